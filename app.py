@@ -2,10 +2,11 @@ from fastapi import FastAPI
 from uvicorn import run as app_run
 from fastapi.responses import Response
 from src.constants import APP_HOST, APP_PORT
-from src.pipeline.tracking import TrackingPipeline
+from src.pipeline.server import TrackingServer
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
+tracking_server = TrackingServer()
 
 origins = ["*"]
 
@@ -18,12 +19,17 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def start_tracking_server():
+    # ingests, loads and warms up the model once, the requests share it
+    tracking_server.start()
+
+
 @app.get("/track")
-async def tracking():
+def tracking():
+    # a plain def runs in the threadpool, so a tracking request does not block the other requests
     try:
-        tracking_pipeline = TrackingPipeline()
-
-        tracking_pipeline.run_pipeline()
+        tracking_server.track()
 
         return Response("Tracked video saved successfully to Gcloud Storage !!")
 
@@ -31,5 +37,17 @@ async def tracking():
         return Response(f"Error Occurred! {e}")
 
 
+@app.get("/reload")
+def reload():
+    # swaps in the latest weights of the Gcloud Storage bucket, requests in flight finish on the previous ones
+    try:
+        model_ingestion_artifacts = tracking_server.reload()
+
+        return Response(f"Reloaded the model from {model_ingestion_artifacts.weights_path} !!")
+
+    except Exception as e:
+        return Response(f"Error Occurred! {e}")
+
+
 if __name__ == "__main__":
     app_run(app, host=APP_HOST, port=APP_PORT)
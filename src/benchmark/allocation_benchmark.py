@@ -0,0 +1,132 @@
+"""
+Per-frame allocation benchmark of the ObjectTracking tensor path
+
+Counts what one steady-state frame allocates from the letterboxed frame to the detections handed to SORT: the
+model input tensor and the conversion of the NMS output. Tensor allocations are counted with a torch dispatch
+mode (every op output that does not reuse an input's storage), Python and NumPy allocations with tracemalloc. The
+legacy path (torch.from_numpy(img).to(DEVICE).float() and the np.vstack loop) is measured next to the current one.
+
+    python -m src.benchmark.allocation_benchmark --detections 10 100 300 --output allocation_benchmark.json
+"""
+import json
+import argparse
+import tracemalloc
+import numpy as np
+import torch
+from torch.utils._pytree import tree_leaves
+from torch.utils._python_dispatch import TorchDispatchMode
+from src.constants import DEVICE, HALF, IMG_SIZE
+from src.entity.config_entity import ObjectTrackingConfig
+from src.components.object_tracking import ObjectTracking
+
+
+class TensorAllocationCounter(TorchDispatchMode):
+    """
+    Counts the tensors created by torch ops: outputs whose storage is not one of the op's inputs
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.allocations = 0
+        self.bytes = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+        inputs = {t.untyped_storage().data_ptr() for t in tree_leaves((args, kwargs)) if isinstance(t, torch.Tensor)}
+        for t in tree_leaves(out):
+            if isinstance(t, torch.Tensor) and t.numel() and t.untyped_storage().data_ptr() not in inputs:
+                self.allocations += 1
+                self.bytes += t.untyped_storage().nbytes()
+        return out
+
+
+def legacy_path(img, det):
+    img = torch.from_numpy(img).to(DEVICE)
+    img = img.half() if HALF else img.float()
+    img /= 255.0
+    if img.ndimension() == 3:
+        img = img.unsqueeze(0)
+    dets_to_sort = np.empty((0, 6))
+    for x1, y1, x2, y2, conf, detclass in det.cpu().detach().numpy():
+        dets_to_sort = np.vstack((dets_to_sort, np.array([x1, y1, x2, y2, conf, detclass])))
+    return img, dets_to_sort
+
+
+def current_path(tracking, img, det):
+    return tracking.preprocess([img]), tracking.detections_to_sort(det)
+
+
+def measure(fn, frames, warmup=5):
+    """
+    Runs fn(i) for warmup + frames frames and returns the allocations per steady-state frame
+    """
+    for i in range(warmup):
+        fn(i)
+    counter = TensorAllocationCounter()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    with counter:
+        for i in range(frames):
+            fn(i)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # only what the frames keep alive shows up in a snapshot diff, temporaries are measured by measure_peak
+    diff = after.compare_to(before, 'filename')
+    return {
+        'tensor_allocations': counter.allocations / frames,
+        'tensor_bytes': counter.bytes / frames,
+        'python_blocks_retained': sum(d.count_diff for d in diff) / frames,
+        'python_bytes_retained': sum(d.size_diff for d in diff) / frames,
+    }
+
+
+def measure_peak(fn, frames):
+    """
+    Mean peak of the Python/NumPy memory allocated within one frame, temporaries included
+    """
+    tracemalloc.start()
+    peaks = []
+    for i in range(frames):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(i)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return float(np.mean(peaks))
+
+
+def run_benchmark(detections=(10, 100, 300), frames=50, img_size=IMG_SIZE):
+    tracking = ObjectTracking(ObjectTrackingConfig(), None, None)
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 255, (3, img_size, img_size), dtype=np.uint8)
+    results = []
+    for n in detections:
+        xy = rng.uniform(0, img_size - 50, (n, 2))
+        det = torch.tensor(np.concatenate((xy, xy + 40, rng.random((n, 1)), rng.integers(0, 80, (n, 1))), axis=1),
+                           dtype=torch.float32)
+        for name, fn in (('legacy', lambda i: legacy_path(img, det)),
+                         ('current', lambda i: current_path(tracking, img, det))):
+            r = measure(fn, frames)
+            r['python_peak_bytes'] = measure_peak(fn, frames)
+            r.update({'path': name, 'detections': n, 'frames': frames})
+            results.append(r)
+            print(f"{name:>8} {n:5d} dets: {r['tensor_allocations']:6.1f} tensors ({r['tensor_bytes'] / 1024:9.1f} kB), "
+                  f"peak python/numpy {r['python_peak_bytes'] / 1024:8.1f} kB per frame")
+    return {'benchmark': 'allocations', 'img_size': img_size, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--detections', type=int, nargs='+', default=[10, 100, 300])
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--img-size', type=int, default=IMG_SIZE)
+    parser.add_argument('--output', default='allocation_benchmark.json', help='JSON report path')
+    opt = parser.parse_args(argv)
+    report = run_benchmark(opt.detections, opt.frames, opt.img_size)
+    with open(opt.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {opt.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+NMS benchmark: batched non_max_suppression against the per-image loop, and the NMS backends against each other
+
+Builds synthetic raw model outputs (B, anchors, 5 + classes) in which every object fires a cluster of jittered
+anchors above the confidence threshold, the rest being background, and times the legacy per-image loop (one
+torchvision.ops.nms call per image) next to the batched non_max_suppression for every batch size. Both outputs are
+compared image by image. The suppression step alone is also timed on the decoded candidates with every backend of
+src.ml.nms.BACKENDS, for every number of objects per image and so of candidates, and compared with the torchvision
+backend: whether it keeps the same boxes, and the fraction of the torchvision boxes it keeps (recall).
+
+    python -m src.benchmark.nms_benchmark --batch-sizes 1 8 32 --objects 5 20 80 --output nms_benchmark.json
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+import torch
+import torchvision
+from src.constants import DEVICE, IMG_SIZE
+from src.exception import CustomException
+from src.ml.nms import BACKENDS, suppress
+from src.utils.general import non_max_suppression, xywh2xyxy
+from src.utils.torch_utils import time_synchronized
+
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+DEFAULT_OBJECTS = [20]
+
+
+def legacy_nms(prediction, conf_thres=0.25, iou_thres=0.45):
+    """
+    The per-image loop non_max_suppression replaced, best class only
+    """
+    max_wh, max_det, max_nms = 4096, 300, 30000
+    xc = prediction[..., 4] > conf_thres
+    output = [torch.zeros((0, 6), device=prediction.device)] * prediction.shape[0]
+    for xi, x in enumerate(prediction):
+        x = x[xc[xi]]
+        if not x.shape[0]:
+            continue
+        x[:, 5:] *= x[:, 4:5]
+        box = xywh2xyxy(x[:, :4])
+        conf, j = x[:, 5:].max(1, keepdim=True)
+        x = torch.cat((box, conf, j.float()), 1)[conf.view(-1) > conf_thres]
+        n = x.shape[0]
+        if not n:
+            continue
+        elif n > max_nms:
+            x = x[x[:, 4].argsort(descending=True)[:max_nms]]
+        c = x[:, 5:6] * max_wh
+        i = torchvision.ops.nms(x[:, :4] + c, x[:, 4], iou_thres)
+        output[xi] = x[i[:max_det]]
+    return output
+
+
+def synthetic_prediction(batch_size, anchors, nc=80, objects=20, anchors_per_object=15, img_size=IMG_SIZE,
+                         seed=0):
+    """
+    Raw (batch_size, anchors, 5 + nc) [cx, cy, w, h, obj, cls...] output with 'objects' objects per image, each
+    seen by 'anchors_per_object' anchors with jittered boxes and confidences
+    """
+    rng = np.random.default_rng(seed)
+    pred = np.zeros((batch_size, anchors, 5 + nc), dtype=np.float32)
+    pred[..., :2] = rng.uniform(0, img_size, (batch_size, anchors, 2))
+    pred[..., 2:4] = rng.uniform(8, 64, (batch_size, anchors, 2))
+    pred[..., 4] = rng.uniform(0, 0.2, (batch_size, anchors))  # background, under the threshold
+    pred[..., 5:] = rng.uniform(0, 0.1, (batch_size, anchors, nc))
+    for b in range(batch_size):
+        idx = rng.choice(anchors, (objects, anchors_per_object), replace=False)
+        centre = rng.uniform(32, img_size - 32, (objects, 1, 2))
+        size = rng.uniform(16, 160, (objects, 1, 2))
+        pred[b, idx, :2] = centre + rng.normal(0, 4, (objects, anchors_per_object, 2))
+        pred[b, idx, 2:4] = size * rng.uniform(0.85, 1.15, (objects, anchors_per_object, 2))
+        pred[b, idx, 4] = rng.uniform(0.3, 1, (objects, anchors_per_object))
+        pred[b, idx, 5 + rng.integers(0, nc, (objects, 1))] = rng.uniform(0.5, 1, (objects, anchors_per_object))
+    return torch.from_numpy(pred).to(DEVICE)
+
+
+def decoded_candidates(prediction, conf_thres=0.25, max_wh=4096):
+    """
+    Class-offset boxes, scores, image and class indices of the candidates of a raw output, as suppressed by
+    non_max_suppression
+    """
+    b, a = (prediction[..., 4] > conf_thres).nonzero(as_tuple=True)
+    x = prediction[b, a]
+    x[:, 5:] *= x[:, 4:5]
+    conf, j = x[:, 5:].max(1)
+    keep = conf > conf_thres
+    return (xywh2xyxy(x[keep, :4]) + j[keep, None] * max_wh, conf[keep], b[keep], j[keep])
+
+
+def time_backends(prediction, runs, backends, iou_thres=0.45):
+    """
+    Median ms of the suppression alone with every backend, whether it keeps the same boxes as the torchvision
+    backend and the fraction of those it keeps
+    """
+    boxes, scores, images, classes = decoded_candidates(prediction.clone())
+    bs = prediction.shape[0]
+    reference = set(suppress(boxes, scores, images, classes, bs, iou_thres, 'torchvision').tolist())
+    results = {}
+    for backend in backends:
+        kept = suppress(boxes, scores, images, classes, bs, iou_thres, backend)  # warmup
+        samples = []
+        for _ in range(runs):
+            t = time_synchronized()
+            suppress(boxes, scores, images, classes, bs, iou_thres, backend)
+            samples.append(time_synchronized() - t)
+        kept = set(kept.tolist())
+        results[backend] = {'ms': 1E3 * float(np.median(samples)), 'kept': len(kept), 'same_output': kept == reference,
+                            'recall': len(kept & reference) / max(len(reference), 1)}
+    return len(scores), results
+
+
+def same_output(a, b):
+    return len(a) == len(b) and all(x.shape == y.shape and torch.equal(x, y) for x, y in zip(a, b))
+
+
+def time_nms(fn, prediction, runs):
+    times = []
+    for _ in range(runs):
+        x = prediction.clone()  # both write into their candidates, keep every run on the same input
+        t = time_synchronized()
+        fn(x)
+        times.append(time_synchronized() - t)
+    return times
+
+
+def run_benchmark(batch_sizes=DEFAULT_BATCH_SIZES, anchors=None, objects=DEFAULT_OBJECTS, runs=20, img_size=IMG_SIZE,
+                  backends=None):
+    try:
+        anchors = anchors or 3 * sum((img_size // s) ** 2 for s in (8, 16, 32))  # P3-P5 anchors of a YOLOv7 head
+        backends = backends or sorted(BACKENDS)
+        results = []
+        for batch_size in batch_sizes:
+            for n_objects in objects:
+                prediction = synthetic_prediction(batch_size, anchors, objects=n_objects, img_size=img_size)
+                same = same_output(legacy_nms(prediction.clone()), non_max_suppression(prediction.clone()))
+                time_nms(legacy_nms, prediction, 2)  # warmup
+                time_nms(non_max_suppression, prediction, 2)
+                legacy = time_nms(legacy_nms, prediction, runs)
+                batched = time_nms(non_max_suppression, prediction, runs)
+                r = {'batch_size': batch_size, 'anchors': anchors, 'objects_per_image': n_objects,
+                     'same_output': same, 'legacy_ms': 1E3 * float(np.median(legacy)),
+                     'batched_ms': 1E3 * float(np.median(batched))}
+                r['speedup'] = r['legacy_ms'] / r['batched_ms']
+                r['candidates'], r['backends'] = time_backends(prediction, runs, backends)
+                results.append(r)
+                print(f"batch {batch_size:3d}, {n_objects:3d} objects: legacy {r['legacy_ms']:8.2f} ms, batched "
+                      f"{r['batched_ms']:8.2f} ms ({r['speedup']:5.2f}x), {'same' if same else 'DIFFERENT'} output")
+                for name, b in r['backends'].items():
+                    print(f"    {name:12s} {b['ms']:8.2f} ms for {r['candidates']:6d} candidates, kept {b['kept']:5d}, "
+                          f"{'same' if b['same_output'] else 'DIFFERENT'} boxes, recall {b['recall']:.3f}")
+        return {'benchmark': 'nms', 'device': str(DEVICE), 'torch': torch.__version__,
+                'torchvision': torchvision.__version__, 'platform': platform.platform(), 'results': results}
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--anchors', type=int, default=None, help='anchors per image, by default those of --img-size')
+    parser.add_argument('--objects', type=int, nargs='+', default=DEFAULT_OBJECTS,
+                        help='objects per image, each fires 15 candidates')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--img-size', type=int, default=IMG_SIZE)
+    parser.add_argument('--backends', nargs='+', default=None, choices=sorted(BACKENDS), help='by default all')
+    parser.add_argument('--output', default='nms_benchmark.json', help='JSON report path')
+    opt = parser.parse_args(argv)
+    report = run_benchmark(opt.batch_sizes, opt.anchors, opt.objects, opt.runs, opt.img_size, opt.backends)
+    with open(opt.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {opt.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class SyntheticScene(object):
+    """
+    Generator of synthetic moving-box scenes for benchmarking the tracker without a model or a video.
+
+    Objects move at constant velocity inside the canvas and bounce off its borders. On every frame each visible
+    object starts an occlusion with probability 'occlusion_rate', occlusions last a geometric number of frames with
+    mean 'occlusion_length', and visible objects are detected with their centre and size perturbed by
+    'noise' * object size. The canvas is sized so there are 'density' objects per megapixel.
+    """
+
+    def __init__(self, n_objects=100, frames=100, density=50., occlusion_rate=0.05, occlusion_length=5.,
+                 noise=0.02, min_size=16., max_size=96., max_speed=6., n_classes=3, seed=0):
+        self.n_objects = n_objects
+        self.frames = frames
+        self.density = density
+        self.occlusion_rate = occlusion_rate
+        self.occlusion_length = occlusion_length
+        self.noise = noise
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_speed = max_speed
+        self.n_classes = n_classes
+        self.seed = seed
+        side = np.sqrt(n_objects / density * 1e6)
+        self.width, self.height = side * 4 / 3, side * 3 / 4  # 16:9 canvas of area side ** 2
+
+    def __len__(self):
+        return self.frames
+
+    def __iter__(self):
+        """
+        Yields (detections, object_ids) per frame: an (n, 6) array of [x1,y1,x2,y2,score,class] detections in
+        random order, and the (n,) ground truth object ID of every row
+        """
+        rng = np.random.default_rng(self.seed)
+        n = self.n_objects
+        canvas = np.array([self.width, self.height])
+        size = rng.uniform(self.min_size, self.max_size, (n, 2))
+        pos = rng.uniform(0, 1, (n, 2)) * (canvas - size) + size / 2
+        vel = rng.uniform(-self.max_speed, self.max_speed, (n, 2))
+        classes = rng.integers(0, self.n_classes, n)
+        occluded_for = np.zeros(n, dtype=np.int64)
+
+        for _ in range(self.frames):
+            pos += vel
+            low, high = pos - size / 2 < 0, pos + size / 2 > canvas
+            vel[low | high] *= -1
+            pos = np.clip(pos, size / 2, canvas - size / 2)
+
+            occluded_for = np.maximum(occluded_for - 1, 0)
+            start = (occluded_for == 0) & (rng.random(n) < self.occlusion_rate)
+            occluded_for[start] = rng.geometric(1. / max(self.occlusion_length, 1.), start.sum())
+            visible = np.flatnonzero(occluded_for == 0)
+
+            k = len(visible)
+            centre = pos[visible] + rng.normal(0, self.noise, (k, 2)) * size[visible]
+            wh = size[visible] * (1 + rng.normal(0, self.noise, (k, 2)))
+            dets = np.empty((k, 6))
+            dets[:, :2] = centre - wh / 2
+            dets[:, 2:4] = centre + wh / 2
+            dets[:, 4] = rng.uniform(0.3, 1., k)
+            dets[:, 5] = classes[visible]
+            order = rng.permutation(k)
+            yield dets[order], visible[order]
@@ -0,0 +1,142 @@
+"""
+Tracker micro-benchmark
+
+Feeds synthetic scenes (see src.benchmark.scenes) through Sort and times Sort.update, the dense
+associate_detections_to_trackers and iou_batch in isolation for a growing number of objects. Results are printed
+as a table and written as JSON so runs of different tracker engines can be compared.
+
+    python -m src.benchmark.tracker_benchmark --objects 10 100 1000 5000 --output tracker_benchmark.json
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+from src.utils import iou_batch
+from src.exception import CustomException
+from src.benchmark.scenes import SyntheticScene
+from src.ml.assignment import AssignmentStats
+from src.ml.sort import Sort, associate_detections_to_trackers
+
+DEFAULT_OBJECTS = [10, 30, 100, 300, 1000, 3000, 5000]
+
+
+def percentiles(samples):
+    """
+    Latency summary in milliseconds of a list of durations in seconds
+    """
+    if not len(samples):
+        return None
+    ms = np.asarray(samples) * 1e3
+    return {'mean': float(ms.mean()), 'p50': float(np.percentile(ms, 50)), 'p90': float(np.percentile(ms, 90)),
+            'p99': float(np.percentile(ms, 99)), 'max': float(ms.max())}
+
+
+def run_scene(scene, gated_association=None, dense_limit=4e6, warmup=5):
+    """
+    Runs one scene through a fresh Sort and returns its measurements as a dict
+
+    The dense association and iou_batch are timed on the same frames, with the detections of the frame against
+    the track boxes after the previous update, and skipped for frames with more than 'dense_limit' pairs. The
+    first 'warmup' frames are not timed.
+    """
+    try:
+        tracker = Sort(gated_association=gated_association)
+        dense_stats = AssignmentStats()
+        update_t, assoc_t, iou_t = [], [], []
+        n_dets, n_trks = [], []
+        for f, (dets, _) in enumerate(scene):
+            trks = tracker.bank.get_state(tracker._slots())[:, :4]
+            n_dets.append(len(dets))
+            n_trks.append(len(trks))
+            timed = f >= warmup
+
+            if len(dets) and len(trks) and len(dets) * len(trks) <= dense_limit:
+                t = time.perf_counter()
+                iou_batch(dets, trks)
+                t1 = time.perf_counter()
+                associate_detections_to_trackers(dets, trks, tracker.iou_threshold, solver=tracker.solver,
+                                                 stats=dense_stats)
+                t2 = time.perf_counter()
+                if timed:
+                    iou_t.append(t1 - t)
+                    assoc_t.append(t2 - t1)
+
+            t = time.perf_counter()
+            tracker.update(dets)
+            if timed:
+                update_t.append(time.perf_counter() - t)
+
+        pairs = np.asarray(n_dets) * np.asarray(n_trks)
+        # frames on which Sort had to associate, at most one fast path is recorded per frame
+        associated = int(np.count_nonzero(pairs))
+        return {
+            'n_objects': scene.n_objects,
+            'frames': scene.frames,
+            'density': scene.density,
+            'occlusion_rate': scene.occlusion_rate,
+            'noise': scene.noise,
+            'gated_association': gated_association,
+            'update_ms': percentiles(update_t),
+            'association_ms': percentiles(assoc_t),
+            'iou_batch_ms': percentiles(iou_t),
+            'matrix': {'mean_detections': float(np.mean(n_dets)), 'mean_tracks': float(np.mean(n_trks)),
+                       'mean_pairs': float(pairs.mean()), 'max_pairs': int(pairs.max())},
+            'fast_path_rate': tracker.assignment_stats.calls.get('fast_path', 0) / associated if associated else None,
+            'solver_calls': dict(tracker.assignment_stats.calls),
+            'dense_solver_calls': dict(dense_stats.calls),
+            'final_tracks': len(tracker.trackers),
+        }
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def run_benchmark(objects=DEFAULT_OBJECTS, frames=100, density=50., occlusion_rate=0.05, noise=0.02,
+                  gated_association=None, dense_limit=4e6, seed=0):
+    """
+    Runs one scene per object count and returns the JSON-able report
+    """
+    results = []
+    print(f"{'objects':>8} {'upd p50':>9} {'upd p99':>9} {'assoc p50':>9} {'iou p50':>9} {'pairs':>10} "
+          f"{'fast path':>9}")
+    for n in objects:
+        scene = SyntheticScene(n_objects=n, frames=frames, density=density, occlusion_rate=occlusion_rate,
+                               noise=noise, seed=seed)
+        results.append(run_scene(scene, gated_association=gated_association, dense_limit=dense_limit))
+        print_row(results[-1])
+    return {'benchmark': 'tracker', 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'results': results}
+
+
+def print_row(r):
+    fmt = lambda p, k: f"{p[k]:9.2f}" if p else f"{'-':>9}"
+    fast = f"{r['fast_path_rate']:9.2f}" if r['fast_path_rate'] is not None else f"{'-':>9}"
+    print(f"{r['n_objects']:8d} {fmt(r['update_ms'], 'p50')} {fmt(r['update_ms'], 'p99')} "
+          f"{fmt(r['association_ms'], 'p50')} {fmt(r['iou_batch_ms'], 'p50')} {r['matrix']['mean_pairs']:10.0f} "
+          f"{fast}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type=int, nargs='+', default=DEFAULT_OBJECTS, help='object counts to run')
+    parser.add_argument('--frames', type=int, default=100, help='frames per scene')
+    parser.add_argument('--density', type=float, default=50., help='objects per megapixel')
+    parser.add_argument('--occlusion-rate', type=float, default=0.05, help='per frame occlusion probability')
+    parser.add_argument('--noise', type=float, default=0.02, help='detection noise relative to the object size')
+    parser.add_argument('--gated', choices=['auto', 'on', 'off'], default='auto', help='Sort gated association')
+    parser.add_argument('--dense-limit', type=float, default=4e6,
+                        help='largest detections x tracks matrix the isolated dense association is timed on')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='tracker_benchmark.json', help='JSON report path')
+    opt = parser.parse_args(argv)
+
+    report = run_benchmark(opt.objects, opt.frames, opt.density, opt.occlusion_rate, opt.noise,
+                           {'auto': None, 'on': True, 'off': False}[opt.gated], opt.dense_limit, opt.seed)
+    with open(opt.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {opt.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,10 @@ import sys
 from numpy import random
 from src.logger import logging
 from src.exception import CustomException
-from src.constants import IMG_SIZE, SOURCE
+from src.constants import (IMG_SIZE, SOURCE, INFERENCE_BATCH_SIZE, TILED_INFERENCE, ADAPTIVE_RESOLUTION,
+                           RESOLUTION_SIZES)
 from src.ml.load_images import LoadImages
+from src.ml.load_stream import LoadStream, is_stream
 from src.entity.config_entity import DataTransformationConfig
 from src.entity.artifact_entity import ModelLoadingArtifacts, DataTransformationArtifacts
 
@@ -35,10 +37,21 @@ class DataTransformation:
             colors = [[random.randint(0, 255) for _ in range(3)] for _ in names]
             logging.info("Get names and colors")
 
-            dataset = LoadImages(SOURCE, img_size=IMG_SIZE, stride=self.model_loading_artifacts.stride)
+            if is_stream(SOURCE):
+                logging.info(f"Live source {SOURCE}")
+                dataset = LoadStream(SOURCE, img_size=IMG_SIZE, stride=self.model_loading_artifacts.stride)
+            else:
+                dataset = LoadImages(SOURCE, img_size=IMG_SIZE, stride=self.model_loading_artifacts.stride)
 
             logging.info("Load and conversion of dataset done")
 
+            if hasattr(model, 'warmup') and not TILED_INFERENCE:  # tile batches are traced on their first keyframe
+                sizes = RESOLUTION_SIZES if ADAPTIVE_RESOLUTION else [IMG_SIZE]
+                shapes = [shape for size in sizes for shape in dataset.shapes(size)]
+                batch_sizes = sorted({1, INFERENCE_BATCH_SIZE} - {'auto'})
+                model.warmup(shapes, batch_sizes)
+                logging.info(f"Traced model warmed up for input shapes {shapes} and batch sizes {batch_sizes}")
+
             data_transformation_artifacts = DataTransformationArtifacts(dataset_obj=dataset,
                                                                         class_name=names,
                                                                         class_colors=colors)
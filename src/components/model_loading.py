@@ -7,7 +7,7 @@ from src.logger import logging
 from src.constants import DEVICE, IMG_SIZE, HALF
 from src.exception import CustomException
 from src.utils.general import check_img_size
-from src.utils.torch_utils import TracedModel
+from src.utils.torch_utils import TracedModel, CompileCache
 from src.entity.config_entity import ModelLoadingConfig
 from src.entity.artifact_entity import ModelIngestionArtifacts, ModelLoadingArtifacts
 
@@ -46,6 +46,34 @@ class ModelLoading:
         except Exception as e:
             raise CustomException(e, sys) from e
 
+    def prune_head(self, model, classes):
+        """
+        Rebuilds the output convolutions of the Detect/IDetect head of 'model' to predict the 'classes' only,
+        dropping the class rows of every anchor. Column c of the pruned head is class class_ids[c] of the model,
+        kept in the head's 'class_ids' buffer, and the model keeps all its names.
+        """
+        try:
+            detect = model.model[-1]
+            classes = sorted(set(int(c) for c in classes))
+            assert classes and all(0 <= c < detect.nc for c in classes), \
+                f"CLASSES {classes} are not classes of the {detect.nc} class model"
+            rows = torch.tensor([a * detect.no + k for a in range(detect.na)
+                                 for k in list(range(5)) + [5 + c for c in classes]],
+                                device=detect.m[0].weight.device)  # box, objectness and kept class outputs
+            for i, conv in enumerate(detect.m):
+                pruned = nn.Conv2d(conv.in_channels, len(rows), 1)
+                pruned.weight = nn.Parameter(conv.weight.detach()[rows])
+                pruned.bias = nn.Parameter(conv.bias.detach()[rows])
+                detect.m[i] = pruned
+            if hasattr(detect, 'im'):  # IDetect, its implicit multipliers are already fused into the convolutions
+                for im in detect.im:
+                    im.implicit = nn.Parameter(im.implicit.detach()[:, rows])
+            logging.info(f"Pruned the detection head from {detect.nc} to {len(classes)} classes {classes}")
+            detect.nc, detect.no = len(classes), len(classes) + 5
+            detect.register_buffer('class_ids', torch.tensor(classes, device=rows.device))
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
     def ensemble_model_check(self, model, weights):
         try:
             if len(model) == 1:
@@ -75,10 +103,23 @@ class ModelLoading:
                 logging.info("Loads an ensemble of models weights=[a,b,c] or a single model weights=[a] or weights=a")
                 weights = self.model_ingestion_artifacts.weights_path
                 logging.info(f"weights: {weights}")
-                ckpt = torch.load(weights, map_location=DEVICE)
-                logging.info("loaded model")
+                compile_cache = None
+                if self.model_loading_config.COMPILE_CACHE:
+                    compile_cache = CompileCache(self.model_loading_config.COMPILE_CACHE_DIR, weights,
+                                                 max_size=self.model_loading_config.COMPILE_CACHE_MAX_SIZE)
+                fused = compile_cache.load_model(DEVICE) if compile_cache else None
+                if fused is not None:
+                    logging.info("loaded the fused model from the compile cache")
+                else:
+                    ckpt = torch.load(weights, map_location=DEVICE)
+                    logging.info("loaded model")
+                    fused = ckpt['ema' if ckpt.get('ema') else 'model'].float().fuse().eval()
+                    if compile_cache:
+                        compile_cache.save_model(fused)
 
-                model.append(ckpt['ema' if ckpt.get('ema') else 'model'].float().fuse().eval())
+                model.append(fused)
+                if self.model_loading_config.CLASSES is not None:
+                    self.prune_head(model[-1], self.model_loading_config.CLASSES)
                 self.compatibility_updates(model)
                 logging.info("Compatibility updated done")
                 model = self.ensemble_model_check(model, weights)
@@ -86,7 +127,7 @@ class ModelLoading:
                 stride = int(model.stride.max())  # model stride
                 imgsz = check_img_size(IMG_SIZE, s=stride)  # check img_size
 
-                model = TracedModel(model=model, device=DEVICE, img_size=IMG_SIZE)
+                model = TracedModel(model=model, device=DEVICE, compile_cache=compile_cache)
                 logging.info("Converted PyTorch model to a Torch Script")
 
                 if HALF:
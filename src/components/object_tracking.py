@@ -6,16 +6,24 @@ import time
 import numpy as np
 from pathlib import Path
 from src.ml.sort import Sort
-from src.logger import logging
+from src.ml.appearance import AppearanceExtractor, EmbeddingGallery
+from src.ml.tiling import TileLayout, merge_tile_detections
+from src.ml.motion import MotionGate
+from src.ml.stitching import track_rows, TRACK_FORMAT
+from src.logger import logging, get_logger, sample_every_n, ProgressReporter
 from src.utils import draw_boxes
-from src.constants import DEVICE, HALF
+from src.utils.stages import StagedPipeline
+from src.utils.resolution import ResolutionController
+from src.constants import DEVICE, HALF, IMG_SIZE, LOG_SAMPLE_EVERY, PIPELINE_QUEUE_SIZE, DETECTIONS_BUFFER_SIZE
 from src.exception import CustomException
-from src.utils.torch_utils import time_synchronized
+from src.utils.torch_utils import time_synchronized, InputBuffer
 from src.entity.config_entity import ObjectTrackingConfig
-from src.utils.general import non_max_suppression, scale_coords
+from src.utils.general import non_max_suppression, scale_coords, clip_coords, check_img_size
 from src.entity.artifact_entity import ObjectTrackingArtifacts, DataTransformationArtifacts, ModelLoadingArtifacts
 torch.cuda.empty_cache()
 
+logger = get_logger(__name__)
+
 
 class ObjectTracking:
     def __init__(self, object_tracking_config: ObjectTrackingConfig,
@@ -28,7 +36,529 @@ class ObjectTracking:
         self.object_tracking_config = object_tracking_config
         self.data_transformation_artifacts = data_transformation_artifacts
         self.model_loading_artifacts = model_loading_artifacts
-        self.sort_tracker = Sort()
+        if self.object_tracking_config.APPEARANCE_REID:
+            logging.info("Appearance re-identification enabled")
+            self.appearance = AppearanceExtractor(self.object_tracking_config.APPEARANCE_WEIGHTS, device=DEVICE)
+            self.sort_tracker = Sort(max_age=self.object_tracking_config.APPEARANCE_MAX_AGE,
+                                     history_len=self.object_tracking_config.TRACK_HISTORY_LEN,
+                                     gallery=EmbeddingGallery(),
+                                     appearance_weight=self.object_tracking_config.APPEARANCE_WEIGHT,
+                                     max_appearance_distance=self.object_tracking_config.APPEARANCE_MAX_DISTANCE,
+                                     appearance_center_gate=self.object_tracking_config.APPEARANCE_CENTER_GATE)
+        else:
+            self.appearance = None
+            self.sort_tracker = Sort(history_len=self.object_tracking_config.TRACK_HISTORY_LEN)
+        self.frames_since_keyframe = 0
+        self.last_timestamp = None
+        self.batch_size = self.object_tracking_config.INFERENCE_BATCH_SIZE
+        self.vid_path, self.vid_writer = None, None
+        # a pipelined tracking stage may still read the inputs of every batch queued before it
+        depth = PIPELINE_QUEUE_SIZE + 2 if self.object_tracking_config.PIPELINE_STAGES else 1
+        self.input_buffer = InputBuffer(device=DEVICE, half=HALF, depth=depth)
+        self.dets_buffer = np.empty((DETECTIONS_BUFFER_SIZE, 6))
+        self.tile_layouts = {}
+        self.motion_gates = {}
+        self.last_detections = None  # (detections, embeddings) of the last keyframe, in frame coordinates
+        # model class IDs of the class columns of a head pruned to some classes, None for a full head
+        detect_layer = getattr(getattr(model_loading_artifacts, 'model_object', None), 'detect_layer', None)
+        self.class_ids = getattr(detect_layer, 'class_ids', None)
+        self.resolution, self.last_render = None, None
+        self.stale_frames = 0  # live frames dropped for exceeding LIVE_LATENCY_BUDGET_MS
+        self.frame_range = None  # (video path, first, last) frames to track instead of the whole dataset
+        self.tracks_path, self.tracks_file = None, None
+        if self.object_tracking_config.ADAPTIVE_RESOLUTION and not self.object_tracking_config.TILED_INFERENCE:
+            stride = self.model_loading_artifacts.stride
+            self.resolution = ResolutionController(
+                sizes=[check_img_size(size, s=stride) for size in self.object_tracking_config.RESOLUTION_SIZES],
+                target_fps=self.object_tracking_config.RESOLUTION_TARGET_FPS,
+                hysteresis=self.object_tracking_config.RESOLUTION_HYSTERESIS,
+                min_dwell=self.object_tracking_config.RESOLUTION_MIN_DWELL,
+                min_detections=self.object_tracking_config.RESOLUTION_MIN_DETECTIONS, size=IMG_SIZE)
+            logging.info(f"Adaptive input size among {self.resolution.sizes}, starting at {self.resolution.size}")
+
+    def is_keyframe(self, use_confidence=True) -> bool:
+        """
+        Decides whether the detector runs on the next frame: every KEYFRAME_INTERVAL-th frame, or earlier when
+        the confidence of the propagated tracks drops below KEYFRAME_MIN_CONFIDENCE. Batched inference schedules
+        frames before the previous ones are tracked, so it passes use_confidence=False.
+        """
+        if self.frames_since_keyframe + 1 >= self.object_tracking_config.KEYFRAME_INTERVAL:
+            return True
+        if not use_confidence:
+            return False
+        confidence = self.sort_tracker.track_confidence(decay=self.object_tracking_config.KEYFRAME_CONFIDENCE_DECAY)
+        return confidence < self.object_tracking_config.KEYFRAME_MIN_CONFIDENCE
+
+    def frame_interval(self, timestamp, fps) -> float:
+        """
+        Time since the previously tracked frame in frame intervals, from the frame 'timestamp' in ms and the nominal
+        'fps' of the source, 1 when the source has no timestamps. Frames dropped in between widen the interval.
+        """
+        if timestamp is None:
+            return 1.0
+        last, self.last_timestamp = self.last_timestamp, timestamp
+        if last is None or not fps or timestamp <= last:
+            return 1.0
+        return (timestamp - last) * fps / 1000.
+
+    def save_snapshot(self, path, frame, frames_since_keyframe):
+        """
+        Writes the tracker state and the position in the source, every SNAPSHOT_INTERVAL frames
+        """
+        interval = self.object_tracking_config.SNAPSHOT_INTERVAL
+        if not interval or frame % interval:
+            return
+        logging.info(f"Writing tracker snapshot at frame {frame} to {self.object_tracking_config.SNAPSHOT_PATH}")
+        self.sort_tracker.save_snapshot(self.object_tracking_config.SNAPSHOT_PATH, source=path, frame=frame,
+                                        frames_since_keyframe=frames_since_keyframe,
+                                        last_timestamp=-1. if self.last_timestamp is None else self.last_timestamp)
+
+    def resume(self, dataset):
+        """
+        Restores the tracker from RESUME_SNAPSHOT and moves 'dataset' to the frame after the snapshot, so an
+        interrupted job continues with the same track IDs without running inference on the frames it already did.
+        With a frame range (a shard of a video), moves 'dataset' to the first frame of the range instead.
+        """
+        if self.frame_range is not None:
+            path, first, last = self.frame_range
+            dataset.seek(path, first - 1)
+            dataset.stop_frame = last
+            logging.info(f"Tracking frames {first} to {last} of {path}")
+            return
+        snapshot = self.object_tracking_config.RESUME_SNAPSHOT
+        if snapshot is None:
+            return
+        extra = self.sort_tracker.load_snapshot(snapshot)
+        frame = int(extra['frame'])
+        self.frames_since_keyframe = int(extra['frames_since_keyframe'])
+        self.last_timestamp = None if extra['last_timestamp'] < 0 else float(extra['last_timestamp'])
+        dataset.seek(str(extra['source']), frame)
+        logging.info(f"Resumed tracking from {snapshot} at frame {frame} of {extra['source']}")
+
+    def track_detections(self, det, img, im0, dt=1.0, embeddings=None):
+        """
+        Rescales one image's detections from the (1, 3, H, W) model input 'img' to the original frame and feeds them to SORT,
+        together with their appearance embeddings when re-identification is enabled. 'img' is None for detections
+        already in frame coordinates, e.g. merged from tiles, which come with their 'embeddings'.
+        A frame without detections still goes through SORT, so its tracks age and predict over the interval 'dt'
+        that frame_interval has already consumed. Returns the tracked detections.
+        """
+        if not len(det):
+            self.last_detections = det, None
+            return self.sort_tracker.update(np.empty((0, 6)), dt=dt)
+        if img is not None:
+            if self.appearance is not None:
+                logger.debug("Embed all detections of the frame in one batch")
+                embeddings = self.appearance(img, det)
+            img_shape = img.shape[2:]
+            logger.debug("Rescale boxes from img_size to im0 size")
+            det[:, :4] = scale_coords(img_shape, det[:, :4], im0.shape).round()
+        self.last_detections = det, embeddings
+
+        logger.debug("NOTE: We send in detected object class too")
+        dets_to_sort = self.detections_to_sort(det)
+        logger.debug("Running SORT")
+        return self.sort_tracker.update(dets_to_sort, dt=dt, embeddings=embeddings)
+
+    def tile_layout(self, path) -> TileLayout:
+        """
+        Tile layout of source 'path': its TILE_LAYOUTS entry, by file name, over the TILE_SIZE, TILE_OVERLAP and
+        TILE_REGIONS defaults
+        """
+        name = Path(path).name
+        if name not in self.tile_layouts:
+            layout = {'tile_size': self.object_tracking_config.TILE_SIZE,
+                      'overlap': self.object_tracking_config.TILE_OVERLAP,
+                      'regions': self.object_tracking_config.TILE_REGIONS}
+            layout.update(self.object_tracking_config.TILE_LAYOUTS.get(name, {}))
+            self.tile_layouts[name] = TileLayout(**layout)
+            logging.info(f"Tiled inference of {name}: {layout}")
+        return self.tile_layouts[name]
+
+    def motion_gate(self, path) -> MotionGate:
+        """
+        Motion gate of source 'path': its MOTION_GATES entry, by file name, over the MOTION_* defaults
+        """
+        name = Path(path).name
+        if name not in self.motion_gates:
+            gate = {'width': self.object_tracking_config.MOTION_GATE_WIDTH,
+                    'pixel_threshold': self.object_tracking_config.MOTION_PIXEL_THRESHOLD,
+                    'area_threshold': self.object_tracking_config.MOTION_AREA_THRESHOLD,
+                    'max_skip': self.object_tracking_config.MOTION_GATE_MAX_SKIP}
+            gate.update(self.object_tracking_config.MOTION_GATES.get(name, {}))
+            self.motion_gates[name] = MotionGate(**gate)
+            logging.info(f"Motion gate of {name}: {gate}")
+        return self.motion_gates[name]
+
+    def report_motion_gates(self):
+        """
+        Logs and prints the skip rate of every motion gate
+        """
+        for name, gate in self.motion_gates.items():
+            stats = gate.stats()
+            logging.info(f"Motion gate stats of {name}: {stats}")
+            print(f"Motion gate {name}: skipped the detector on {stats['skipped']}/{stats['frames']} frames "
+                  f"({100 * stats['skip_rate']:.1f}%), mean changed area {100 * stats['mean_changed_area']:.2f}% "
+                  f"(threshold {100 * stats['area_threshold']:.2f}%)")
+
+    def report_stream(self, dataset):
+        """
+        Logs and prints the frame counters of a live source
+        """
+        stats = {'read': dataset.grabbed, 'returned': dataset.frame, 'dropped_unread': dataset.dropped,
+                 'dropped_stale': self.stale_frames, 'tracked': dataset.frame - self.stale_frames}
+        logging.info(f"Stream stats of {dataset.source}: {stats}")
+        print(f"Stream {dataset.source}: {stats['read']} frames read, {stats['dropped_unread']} replaced by newer "
+              f"frames, {stats['dropped_stale']} dropped over the {self.object_tracking_config.LIVE_LATENCY_BUDGET_MS}"
+              f" ms latency budget, {stats['tracked']} tracked")
+
+    def merge_tiles(self, dets, inputs, windows, im0):
+        """
+        Moves the per-tile detections of one frame from their (k, 3, T, T) tile inputs to frame coordinates and
+        merges the objects seen by several tiles. Appearance embeddings are taken from the tile each detection
+        was found in. Returns the merged (n, 6) detections and their embeddings, None without re-identification.
+        """
+        embeddings = None
+        if self.appearance is not None:
+            logger.debug("Embed the detections of every tile")
+            embeddings = np.concatenate([self.appearance(inputs[i:i + 1], d) for i, d in enumerate(dets)])
+        tile_index = torch.cat([torch.full((len(d),), i, device=d.device) for i, d in enumerate(dets)])
+        det = torch.cat(dets)
+        offsets = torch.as_tensor(windows[:, :2], dtype=det.dtype, device=det.device).repeat(1, 2)
+        det[:, :4] += offsets[tile_index]
+        clip_coords(det, im0.shape)
+        logger.debug("Cross-tile NMS")
+        det, keep = merge_tile_detections(det, tile_index, self.object_tracking_config.TILE_MERGE_THRESHOLD)
+        det[:, :4] = det[:, :4].round()
+        if embeddings is not None:
+            embeddings = embeddings[keep.cpu().numpy()]
+        return det, embeddings
+
+    def write_tracks(self, frame):
+        """
+        Appends the tracks of a frame to the track file of its source, by default <video>_tracks.csv next to the
+        output video
+        """
+        path = self.tracks_path or os.path.splitext(frame['save_path'])[0] + self.object_tracking_config.TRACKS_SUFFIX
+        if self.tracks_file is None or self.tracks_file.name != path:
+            if self.tracks_file is not None:
+                self.tracks_file.close()
+            self.tracks_file = open(path, 'w')
+        if frame['tracked_dets'] is not None and len(frame['tracked_dets']):
+            np.savetxt(self.tracks_file, track_rows(frame['frame'], frame['tracked_dets'], frame['predicted']),
+                       fmt=TRACK_FORMAT)
+
+    def track_trails(self):
+        """
+        Returns the last TRAIL_LENGTH centroids of every track as (k, 1, 2) int32 polylines. They are copies, so
+        they can be drawn after the tracker has moved on to later frames.
+        """
+        return [track.last_centroids(self.object_tracking_config.TRAIL_LENGTH).astype(np.int32).reshape(-1, 1, 2)
+                for track in self.sort_tracker.getTrackers()]
+
+    def render_tracks(self, im0, tracked_dets, names, predicted=False, trails=None):
+        """
+        Draws the track trails (by default those of the current tracks) and the tracked boxes onto the original
+        frame
+        """
+        if trails is None:
+            trails = self.track_trails()
+
+        logger.debug("draw the last centroids of every track as one polyline call")
+        cv2.polylines(im0, [trail for trail in trails if len(trail) > 1], False,
+                      (255, 0, 0), thickness=2)
+
+        logger.debug("draw boxes for visualization")
+        if len(tracked_dets) > 0:
+            bbox_xyxy = tracked_dets[:, :4]
+            identities = tracked_dets[:, 8]
+            categories = tracked_dets[:, 4]
+            draw_boxes(im0, bbox_xyxy, identities, categories, names, predicted=predicted)
+
+    def preprocess(self, imgs):
+        """
+        Copies letterboxed frames of the same shape into the reused normalised (B, 3, H, W) model input buffer
+        """
+        return self.input_buffer(imgs)
+
+    def detections_to_sort(self, det):
+        """
+        Converts one image's (n, 6) NMS output into SORT's [x1, y1, x2, y2, conf, detclass] rows, written into a
+        preallocated array that only grows when a frame has more detections than any frame before
+        """
+        n = len(det)
+        if n > len(self.dets_buffer):
+            self.dets_buffer = np.empty((max(n, 2 * len(self.dets_buffer)), 6))
+        dets_to_sort = self.dets_buffer[:n]
+        np.copyto(dets_to_sort, det.detach().cpu().numpy())  # zero-copy view of the CPU tensor, cast in place
+        return dets_to_sort
+
+    def detect(self, model, img):
+        """
+        Runs the model on a batch of inputs: the fused decode, filter and NMS graph of a traced model under
+        FUSED_POSTPROCESS, which returns the detections of every input, otherwise the raw (B, N, 5 + classes)
+        prediction for non_max_suppression. The fused graph suppresses with torchvision and without merge-NMS, so
+        another NMS_BACKEND or NMS_MERGE goes through non_max_suppression.
+        """
+        if (self.object_tracking_config.FUSED_POSTPROCESS and hasattr(model, 'detect')
+                and self.object_tracking_config.NMS_BACKEND in ('auto', 'torchvision')
+                and not self.object_tracking_config.NMS_MERGE):
+            return model.detect(img, self.object_tracking_config.CONF_THRES, self.object_tracking_config.IOU_THRES)
+        return model(img, augment=False)[0]
+
+    def choose_batch_size(self, model, img_shape, inputs_per_frame=1) -> int:
+        """
+        Picks the inference batch size for 'auto': times the model on batches of 1, 2, 4, ... up to
+        INFERENCE_MAX_BATCH_SIZE frames, each made of 'inputs_per_frame' inputs (tiles) of 'img_shape', and keeps
+        the smallest batch whose time per frame is within 10% of the best one, so latency is only traded for a
+        real throughput gain
+        """
+        per_frame = {}
+        with torch.no_grad():
+            b = 1
+            while b <= self.object_tracking_config.INFERENCE_MAX_BATCH_SIZE:
+                img = torch.zeros((b * inputs_per_frame,) + tuple(img_shape), device=DEVICE)
+                img = img.half() if HALF else img
+                self.detect(model, img)  # warmup
+                t = time_synchronized()
+                self.detect(model, img)
+                per_frame[b] = (time_synchronized() - t) / b
+                b *= 2
+        best = min(per_frame.values())
+        batch_size = min(b for b, t in per_frame.items() if t <= 1.1 * best)
+        logging.info(f"Inference batch size {batch_size}, time per frame by batch size: "
+                     f"{ {b: round(1E3 * t, 2) for b, t in per_frame.items()} } ms")
+        return batch_size
+
+    @staticmethod
+    def video_format(vid_cap):
+        """
+        (fps, width, height) of an open video capture, None for a stream. Read while the frames are decoded, the
+        reader releases the capture at the end of the video, possibly before a pipelined writer gets to it.
+        """
+        if not vid_cap:
+            return None
+        return (vid_cap.get(cv2.CAP_PROP_FPS), int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def write_frame(self, save_path, video_format, im0):
+        """
+        Appends a rendered frame to the output video of its source, opening a new writer when the source changes
+        """
+        logger.debug("Save video results")
+        if self.vid_path != save_path:  # new video
+            self.vid_path = save_path
+            if isinstance(self.vid_writer, cv2.VideoWriter):
+                self.vid_writer.release()  # release previous video writer
+            if video_format:  # video
+                fps, w, h = video_format
+            else:  # stream
+                fps, w, h = 30, im0.shape[1], im0.shape[0]
+                save_path += '.mp4'
+            self.vid_writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+        self.vid_writer.write(im0)
+
+    def collect_batches(self, model, dataset):
+        """
+        Reads the dataset and yields lists of consecutive frames, each holding up to INFERENCE_BATCH_SIZE
+        keyframes and the prediction-only frames between them.
+
+        A partial batch is yielded when the source or the frame shape changes, when its oldest frame has waited
+        INFERENCE_BATCH_TIMEOUT_MS, and at the end of the dataset. A batch size of 1 yields every frame on its own,
+        which keeps the confidence-triggered keyframes of is_keyframe unless the stages are pipelined (then the
+        tracker runs behind the reader).
+        """
+        max_wait = self.object_tracking_config.INFERENCE_BATCH_TIMEOUT_MS / 1E3
+        pipelined = self.object_tracking_config.PIPELINE_STAGES
+        tiled = self.object_tracking_config.TILED_INFERENCE
+        live = getattr(dataset, 'mode', None) == 'stream'
+        pending = []
+        source, video_format = None, None
+        frames = iter(dataset)
+        self.resume(dataset)
+        for path, img, im0s, vid_cap in frames:
+            if pending and (path != pending[-1]['path'] or img.shape != pending[-1]['img'].shape):
+                yield pending
+                pending = []
+            if path != source:
+                source, video_format = path, self.video_format(vid_cap)
+            if self.batch_size == 'auto':
+                if tiled:
+                    layout = self.tile_layout(path)
+                    self.batch_size = self.choose_batch_size(model, (3, layout.tile_size, layout.tile_size),
+                                                             len(layout.windows(im0s.shape)))
+                else:
+                    self.batch_size = self.choose_batch_size(model, img.shape)
+
+            keyframe = self.is_keyframe(use_confidence=self.batch_size == 1 and not pipelined)
+            gated = False
+            if keyframe and self.object_tracking_config.MOTION_GATE:
+                keyframe = self.motion_gate(path)(im0s)
+                gated = not keyframe
+            self.frames_since_keyframe = 0 if keyframe else self.frames_since_keyframe + 1
+            frame = getattr(dataset, 'frame', 0)
+            if vid_cap:
+                timestamp, fps = vid_cap.get(cv2.CAP_PROP_POS_MSEC), vid_cap.get(cv2.CAP_PROP_FPS)
+            else:  # live streams stamp their frames, images have no timestamps
+                timestamp, fps = getattr(dataset, 'timestamp', None), getattr(dataset, 'fps', None)
+            pending.append({
+                'path': path, 'img': img, 'im0s': im0s, 'video_format': video_format, 'keyframe': keyframe,
+                'gated': gated,
+                'timestamp': timestamp, 'fps': fps, 'captured': timestamp / 1E3 if live else None,
+                'frame': frame, 'time': time.monotonic(),
+                'frames_since_keyframe': self.frames_since_keyframe,
+                'save_path': os.path.join(self.object_tracking_config.DETECT_DIR, Path(path).name),
+                'video': f"{getattr(dataset, 'count', 0) + 1}/{getattr(dataset, 'nf', 1)}",
+                'progress': f"{frame}/{dataset.nframes}" if getattr(dataset, 'nframes', 0) else f"{frame}",
+            })
+            if self.object_tracking_config.MOTION_GATE:
+                pending[-1]['stats'] = {'motion_skip': self.motion_gate(path).skip_rate()}
+            if self.resolution is not None:
+                pending[-1].setdefault('stats', {})['img_size'] = max(img.shape[1:])
+            if live:
+                pending[-1].setdefault('stats', {})['dropped'] = dataset.dropped + self.stale_frames
+            if keyframe and tiled:
+                pending[-1]['tiles'], pending[-1]['windows'] = self.tile_layout(path).cut(im0s)
+
+            if (self.batch_size == 1 or sum(f['keyframe'] for f in pending) >= self.batch_size
+                    or time.monotonic() - pending[0]['time'] >= max_wait):
+                yield pending
+                pending = []
+            if self.resolution is not None:
+                dataset.img_size = self.resolution.size  # letterbox size of the next frame
+        if pending:
+            logger.debug("Flush the partial batch at the end of the source")
+            yield pending
+
+    def infer_batch(self, model, batch):
+        """
+        Inference stage: one forward pass over the keyframes of 'batch', or over all their tiles. Live frames
+        captured more than LIVE_LATENCY_BUDGET_MS ago are dropped here, before the costly part of the pipeline.
+        """
+        budget = self.object_tracking_config.LIVE_LATENCY_BUDGET_MS / 1E3
+        if budget:
+            now = time.monotonic()
+            for frame in batch:
+                if frame['captured'] is not None and now - frame['captured'] > budget:
+                    logger.debug("Dropping a stale live frame")
+                    frame['dropped'], frame['keyframe'] = True, False
+                    frame.pop('tiles', None)
+                    self.stale_frames += 1
+        keyframes = [frame for frame in batch if frame['keyframe']]
+        if keyframes:
+            inputs = [frame.pop('tiles', [frame['img']]) for frame in keyframes]
+            img = self.preprocess([x for frame_inputs in inputs for x in frame_inputs])
+            logger.debug("Begin inference")
+            t1 = time_synchronized()
+            with torch.no_grad():
+                pred = self.detect(model, img)
+            t2 = time_synchronized()
+            j = 0
+            for frame, frame_inputs in zip(keyframes, inputs):
+                frame['input'] = img[j:j + len(frame_inputs)]
+                j += len(frame_inputs)
+            batch[0]['batch_pred'] = pred
+            batch[0]['t_inference'] = t2 - t1
+        return batch
+
+    def track_batch(self, batch, names):
+        """
+        Postprocess and tracking stage: one non_max_suppression call over the batch, then SORT on every frame in
+        frame order. Stores what rendering needs with each frame, including a copy of the track trails.
+        """
+        pred = batch[0].pop('batch_pred', None)
+        if pred is not None:
+            t2 = time_synchronized()
+            if not isinstance(pred, list):  # the fused graph already suppressed the detections
+                logger.debug("Applying non-maximum separation to prediction")
+                pred = non_max_suppression(pred, self.object_tracking_config.CONF_THRES,
+                                           self.object_tracking_config.IOU_THRES, pruned=self.class_ids is not None,
+                                           merge=self.object_tracking_config.NMS_MERGE,
+                                           backend=self.object_tracking_config.NMS_BACKEND)
+                if self.class_ids is not None:
+                    for det in pred:
+                        det[:, 5] = self.class_ids[det[:, 5].long()].to(det.dtype)
+            pred = iter(pred)
+            t_nms = time_synchronized() - t2
+            n_keyframes = sum(frame['keyframe'] for frame in batch)
+            t_inference = batch[0]['t_inference']
+
+        for frame in batch:
+            if frame.get('dropped'):
+                continue
+            im0 = frame['im0s']
+            dt = self.frame_interval(frame['timestamp'], frame['fps'])
+            if frame['keyframe']:
+                if 'windows' in frame:
+                    logger.debug("Merge the detections of the tiles")
+                    det, embeddings = self.merge_tiles([next(pred) for _ in frame['windows']], frame.pop('input'),
+                                                       frame.pop('windows'), im0)
+                    img = None
+                else:
+                    det, img, embeddings = next(pred), frame.pop('input'), None
+                logger.debug("Process detections, detections per image")
+                if sample_every_n(logger, LOG_SAMPLE_EVERY, "detections summary"):
+                    s = ''
+                    for c in det[:, -1].unique():
+                        n = (det[:, -1] == c).sum()  # detections per class
+                        s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
+                    logger.info("%sDone. (%.1fms) Inference, (%.1fms) NMS for a batch of %d",
+                                s, 1E3 * t_inference, 1E3 * t_nms, n_keyframes)
+                frame['tracked_dets'] = self.track_detections(det, img, im0, dt=dt, embeddings=embeddings)
+                frame['predicted'] = False
+                frame.setdefault('stats', {}).update({
+                    'detections': len(det), 'batch': n_keyframes,
+                    'inference_ms': 1E3 * t_inference / n_keyframes, 'nms_ms': 1E3 * t_nms / n_keyframes})
+            elif (frame['gated'] and self.object_tracking_config.MOTION_GATE_MODE == 'reuse'
+                  and self.last_detections is not None):
+                logger.debug("Motion gate closed, tracking the detections of the last keyframe again")
+                det, embeddings = self.last_detections
+                frame['tracked_dets'] = self.track_detections(det.clone(), None, im0, dt=dt,
+                                                              embeddings=embeddings)
+                frame['predicted'] = False
+            else:
+                logger.debug("Skipped the detector, propagating tracks with a prediction-only step")
+                frame['tracked_dets'] = self.sort_tracker.predict(dt=dt)
+                frame['predicted'] = True
+            if frame['tracked_dets'] is not None:
+                frame['trails'] = self.track_trails()
+            if self.object_tracking_config.SAVE_TRACKS:
+                self.write_tracks(frame)
+            self.save_snapshot(frame['path'], frame['frame'], frame['frames_since_keyframe'])
+        return batch
+
+    def render_batch(self, batch, names, progress):
+        """
+        Render and encode stage: draws every frame of the batch and appends it to its output video
+        """
+        for frame in batch:
+            if frame.get('dropped'):
+                continue
+            im0 = frame['im0s']
+            if self.object_tracking_config.RENDER_VIDEO:
+                if frame['tracked_dets'] is not None:
+                    self.render_tracks(im0, frame['tracked_dets'], names, predicted=frame['predicted'],
+                                       trails=frame['trails'])
+                self.write_frame(frame['save_path'], frame['video_format'], im0)
+            if frame['captured'] is not None:
+                frame['stats']['latency_ms'] = 1E3 * (time.monotonic() - frame['captured'])
+            progress.update(video=frame['video'], frame=frame['progress'], **frame.get('stats', {}))
+        if self.resolution is not None:
+            self.update_resolution(batch)
+        return batch
+
+    def update_resolution(self, batch):
+        """
+        Feeds the time per frame since the previous batch left the last stage, and the detections per keyframe,
+        to the input size controller. In steady state that interval is the cost of a frame through the slowest
+        stage, pipelined or not.
+        """
+        now = time.perf_counter()
+        if self.last_render is not None:
+            detections = [frame['stats']['detections'] for frame in batch if frame['keyframe']]
+            self.resolution.update((now - self.last_render) / len(batch), max(batch[0]['img'].shape[1:]),
+                                   frames=len(batch), detections=np.mean(detections) if detections else None)
+        self.last_render = now
 
     def initiate_object_tracking(self) -> ObjectTrackingArtifacts:
         """
@@ -53,101 +583,35 @@ class ObjectTracking:
             names = self.data_transformation_artifacts.class_name
             logging.info("Loading class name from data transformation artifacts")
 
-            vid_path, vid_writer = None, None
             t0 = time.time()
+            progress = ProgressReporter("Tracking frames")
 
-            for path, img, im0s, vid_cap in dataset:
-                try:
-                    img = torch.from_numpy(img).to(DEVICE)
-
-                    img = img.half() if HALF else img.float()  # uint8 to fp16/32
-                    img /= 255.0  # 0 - 255 to 0.0 - 1.0
-                    if img.ndimension() == 3:
-                        img = img.unsqueeze(0)
-
-                    logging.info("Iterating through complete data and perform scaling")
-
-                    old_img_b = img.shape[0]
-                    old_img_h = img.shape[2]
-                    old_img_w = img.shape[3]
-
-                    logging.info(f"Get the image height: {old_img_h}, image weight: {old_img_w}, image bias: {old_img_b}")
-                    logging.info("Begin inference")
-                    t1 = time_synchronized()
-                    pred = model(img, augment=False)[0]
-                    t2 = time_synchronized()
-
-                    logging.info("Applying non-maximum separation to prediction")
-                    pred = non_max_suppression(pred)
-                    t3 = time_synchronized()
-
-                    logging.info("Process detections, detections per image")
-                    for i, det in enumerate(pred):
-                        try:
-                            p, s, im0, frame = path, '', im0s, getattr(dataset, 'frame', 0)
-                            p = Path(p)  # to Path
-                            save_path = os.path.join(self.object_tracking_config.DETECT_DIR, p.name)
-                            txt_path = str(os.path.join(self.object_tracking_config.DETECT_DIR, "labels", p.stem)) + ('' if dataset.mode == 'image' else f'_{frame}')  # img.txt
-                            gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
-                            if len(det):
-                                logging.info("Rescale boxes from img_size to im0 size")
-                                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape).round()
-                                logging.info("Print results")
-                                for c in det[:, -1].unique():
-                                    n = (det[:, -1] == c).sum()  # detections per class
-                                    s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
-
-                                logging.info("USING TRACK FUNCTION")
-                                logging.info("pass an empty array to sort")
-                                dets_to_sort = np.empty((0, 6))
-
-                                logging.info("NOTE: We send in detected object class too")
-                                for x1, y1, x2, y2, conf, detclass in det.cpu().detach().numpy():
-                                    dets_to_sort = np.vstack((dets_to_sort, np.array([x1, y1, x2, y2, conf, detclass])))
-                                logging.info("Running SORT")
-                                tracked_dets = self.sort_tracker.update(dets_to_sort)
-                                tracks = self.sort_tracker.getTrackers()
-                                txt_str = ""
-
-                                logging.info("loop over tracks")
-                                for track in tracks:
-                                    try:
-                                        [cv2.line(im0, (int(track.centroidarr[i][0]), int(track.centroidarr[i][1])),
-                                                  (int(track.centroidarr[i + 1][0]), int(track.centroidarr[i + 1][1])),
-                                                  (255, 0, 0), thickness=2)
-                                         for i, _ in enumerate(track.centroidarr)
-                                         if i < len(track.centroidarr) - 1]
-                                    except Exception as e:
-                                        raise CustomException(e, sys) from e
-
-                                logging.info("draw boxes for visualization")
-                                if len(tracked_dets) > 0:
-                                    bbox_xyxy = tracked_dets[:, :4]
-                                    identities = tracked_dets[:, 8]
-                                    categories = tracked_dets[:, 4]
-                                    draw_boxes(im0, bbox_xyxy, identities, categories, names)
-
-                            logging.info("Print time (inference + NMS)")
-                            print(f'{s}Done. ({(1E3 * (t2 - t1)):.1f}ms) Inference, ({(1E3 * (t3 - t2)):.1f}ms) NMS')
-
-                            logging.info("Save video results")
-                            if vid_path != save_path:  # new video
-                                vid_path = save_path
-                                if isinstance(vid_writer, cv2.VideoWriter):
-                                    vid_writer.release()  # release previous video writer
-                                if vid_cap:  # video
-                                    fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                                    w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                                    h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                                else:  # stream
-                                    fps, w, h = 30, im0.shape[1], im0.shape[0]
-                                    save_path += '.mp4'
-                                vid_writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
-                            vid_writer.write(im0)
-                        except Exception as e:
-                            raise CustomException(e, sys) from e
-                except Exception as e:
-                    raise CustomException(e, sys) from e
+            batches = self.collect_batches(model, dataset)
+            stages = [("inference", lambda batch: self.infer_batch(model, batch)),
+                      ("tracking", lambda batch: self.track_batch(batch, names)),
+                      ("rendering", lambda batch: self.render_batch(batch, names, progress))]
+            if self.object_tracking_config.PIPELINE_STAGES:
+                logging.info("Running decode, inference, tracking and rendering as pipelined stages")
+                pipeline = StagedPipeline(batches, stages, source_name="decode")
+                stage_stats = pipeline.run()
+                logging.info(f"Pipeline stage stats: {stage_stats}")
+                for name, stats in stage_stats.items():
+                    rate = f"{stats['items_per_s']:.1f} batches/s" if stats['items_per_s'] else "-"
+                    print(f"{name:>10}: {stats['items']} batches, busy {stats['busy_s']:.2f}s ({rate}), "
+                          f"waiting {stats['wait_s']:.2f}s")
+            else:
+                for batch in batches:
+                    for _, stage in stages:
+                        batch = stage(batch)
+            if isinstance(self.vid_writer, cv2.VideoWriter):
+                self.vid_writer.release()
+            if self.tracks_file is not None:
+                self.tracks_file.close()
+            progress.close()
+            self.report_motion_gates()
+            if getattr(dataset, 'mode', None) == 'stream':
+                dataset.close()
+                self.report_stream(dataset)
             print(f'Done. ({time.time() - t0:.3f}s)')
 
             object_tracking_artifacts = ObjectTrackingArtifacts(
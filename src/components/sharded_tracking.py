@@ -0,0 +1,204 @@
+import os
+import sys
+import copy
+import time
+import math
+import multiprocessing
+from pathlib import Path
+from collections import defaultdict, deque
+import cv2
+import numpy as np
+import torch
+from src.logger import logging
+from src.exception import CustomException
+from src.constants import IMG_SIZE
+from src.ml.load_images import LoadImages
+from src.ml.stitching import load_tracks, stitch_shards, TRACK_FORMAT
+from src.utils import draw_boxes
+from src.components.model_loading import ModelLoading
+from src.components.object_tracking import ObjectTracking
+from src.entity.config_entity import ModelLoadingConfig, ObjectTrackingConfig
+from src.entity.artifact_entity import ModelIngestionArtifacts, DataTransformationArtifacts, ObjectTrackingArtifacts
+
+# model of a shard worker process, loaded once by init_worker
+worker_model = {}
+
+
+def init_worker(weights_path, model_loading_config, threads):
+    """
+    Shard worker initializer: loads the model once per process with the parent's 'model_loading_config', whose
+    paths carry the run's timestamp where a worker's own import of the constants would have a new one, and with
+    'threads' intra-op threads so the workers share the cores instead of oversubscribing them
+    """
+    try:
+        torch.set_num_threads(threads)
+        model_ingestion_artifacts = ModelIngestionArtifacts(weights_path=weights_path)
+        worker_model['artifacts'] = ModelLoading(model_loading_config=model_loading_config,
+                                                 model_ingestion_artifacts=model_ingestion_artifacts
+                                                 ).initiate_model_loading()
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def track_shard(task):
+    """
+    Shard worker: tracks frames 'first' to 'last' of one video with a fresh tracker and writes their tracks to
+    'tracks_path', without rendering. Returns 'tracks_path'.
+    """
+    try:
+        path, first, last, tracks_path, config, names = task
+        model_loading_artifacts = worker_model['artifacts']
+        dataset = LoadImages(path, img_size=IMG_SIZE, stride=model_loading_artifacts.stride)
+        object_tracking = ObjectTracking(
+            object_tracking_config=config,
+            data_transformation_artifacts=DataTransformationArtifacts(dataset_obj=dataset, class_name=names,
+                                                                      class_colors=[]),
+            model_loading_artifacts=model_loading_artifacts)
+        object_tracking.frame_range = dataset.files[0], first, last
+        object_tracking.tracks_path = tracks_path
+        object_tracking.initiate_object_tracking()
+        return tracks_path
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+class ShardedTracking:
+    def __init__(self, object_tracking_config: ObjectTrackingConfig,
+                 data_transformation_artifacts: DataTransformationArtifacts,
+                 model_ingestion_artifacts: ModelIngestionArtifacts,
+                 model_loading_config: ModelLoadingConfig):
+        """
+        :param object_tracking_config: Configuration for object tracking
+        :param data_transformation_artifacts: Artifacts for data transformation
+        :param model_ingestion_artifacts: Artifacts for model ingestion, the workers load their own model
+        :param model_loading_config: Configuration the workers load their model with
+        """
+        self.object_tracking_config = object_tracking_config
+        self.model_loading_config = model_loading_config
+        self.data_transformation_artifacts = data_transformation_artifacts
+        self.model_ingestion_artifacts = model_ingestion_artifacts
+
+    def plan_shards(self, nframes, shards):
+        """
+        Splits a video of 'nframes' frames into up to 'shards' time ranges of whole KEYFRAME_INTERVAL detection
+        intervals. Returns (first, start, end) per shard: the shard owns frames (start, end] and starts tracking
+        at frame 'first', SHARD_OVERLAP frames earlier rounded to a detector keyframe, so its tracker is warm and
+        its IDs can be stitched to the previous shard's over the frames they share. The detector runs on the same
+        frames as in one pass. Shard boundaries have nothing to do with the codec's keyframes, LoadImages.seek
+        lands every shard on its exact first frame.
+        """
+        interval = self.object_tracking_config.KEYFRAME_INTERVAL
+        length = math.ceil(math.ceil(nframes / shards) / interval) * interval
+        plan = []
+        for start in range(0, nframes, length):
+            warmup = max(start - self.object_tracking_config.SHARD_OVERLAP, 0) // interval * interval
+            plan.append((warmup + 1, start, min(start + length, nframes)))
+        return plan
+
+    def track_shards(self, videos, names):
+        """
+        Tracks the shards of all 'videos' in a pool of SHARD_WORKERS processes. Returns the shard track files
+        and the (start, end) ranges they own, per video.
+        """
+        workers = self.object_tracking_config.SHARD_WORKERS
+        shard_dir = os.path.join(self.object_tracking_config.OBJECT_TRACKING_ARTIFACTS_DIR, "shards")
+        os.makedirs(shard_dir, exist_ok=True)
+        config = copy.copy(self.object_tracking_config)
+        config.RENDER_VIDEO, config.SAVE_TRACKS = False, True
+        config.SNAPSHOT_INTERVAL, config.RESUME_SNAPSHOT = 0, None
+
+        tasks, shards = [], defaultdict(list)
+        for path in videos:
+            cap = cv2.VideoCapture(path)
+            nframes = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+            plan = self.plan_shards(nframes, self.object_tracking_config.SHARD_COUNT or workers)
+            logging.info(f"{Path(path).name}: {nframes} frames in {len(plan)} shards {plan}")
+            for i, (first, start, end) in enumerate(plan):
+                tracks_path = os.path.join(shard_dir, f"{Path(path).stem}_{i}.csv")
+                tasks.append((path, first, end, tracks_path, config, names))
+                shards[path].append((tracks_path, start, end))
+
+        threads = max((os.cpu_count() or 1) // workers, 1)
+        context = multiprocessing.get_context(self.object_tracking_config.SHARD_START_METHOD)
+        with context.Pool(workers, initializer=init_worker,
+                          initargs=(self.model_ingestion_artifacts.weights_path, self.model_loading_config,
+                                    threads)) as pool:
+            for done, tracks_path in enumerate(pool.imap_unordered(track_shard, tasks), 1):
+                logging.info(f"Shard {done}/{len(tasks)} done: {tracks_path}")
+        return shards
+
+    def render_video(self, path, rows, names):
+        """
+        Draws the stitched tracks onto the frames of video 'path' in one decode pass and writes the output video.
+        Trails join the last TRAIL_LENGTH box centres of the tracks of each frame.
+        """
+        save_path = os.path.join(self.object_tracking_config.DETECT_DIR, Path(path).name)
+        cap = cv2.VideoCapture(path)
+        video_format = ObjectTracking.video_format(cap)
+        writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), video_format[0], video_format[1:])
+        bounds = np.searchsorted(rows[:, 0], np.arange(int(rows[-1, 0]) + 2)) if len(rows) else None
+        trails = defaultdict(lambda: deque(maxlen=self.object_tracking_config.TRAIL_LENGTH))
+        frame = 0
+        while True:
+            ok, im0 = cap.read()
+            if not ok:
+                break
+            frame += 1
+            tracks = rows[bounds[frame]:bounds[frame + 1]] if bounds is not None and frame + 1 < len(bounds) else []
+            if len(tracks):
+                for track in tracks:
+                    trails[int(track[1])].append(((track[2] + track[4]) / 2, (track[3] + track[5]) / 2))
+                cv2.polylines(im0, [np.array(trails[int(i)], dtype=np.int32).reshape(-1, 1, 2)
+                                    for i in tracks[:, 1] if len(trails[int(i)]) > 1], False, (255, 0, 0),
+                              thickness=2)
+                draw_boxes(im0, tracks[:, 2:6], tracks[:, 1], tracks[:, 6], names, predicted=bool(tracks[0, 7]))
+            writer.write(im0)
+        cap.release()
+        writer.release()
+
+    def initiate_object_tracking(self) -> ObjectTrackingArtifacts:
+        """
+        Method Name :   initiate_object_tracking
+        Description :   This function tracks time ranges of every video in parallel processes, stitches their
+                        track IDs and renders the tracked videos
+
+        Output      :   Returns object tracking artifact
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info("Entered the initiate_object_tracking method of Sharded tracking class")
+        try:
+            os.makedirs(self.object_tracking_config.DETECT_DIR, exist_ok=True)
+            dataset = self.data_transformation_artifacts.dataset_obj
+            names = self.data_transformation_artifacts.class_name
+            videos = [path for path, video in zip(dataset.files, dataset.video_flag) if video]
+            if len(videos) < dataset.nf:
+                logging.warning(f"Sharded tracking only processes videos, skipping {dataset.nf - len(videos)} images")
+
+            t0 = time.time()
+            shards = self.track_shards(videos, names)
+            for path in videos:
+                rows, stitched = stitch_shards(
+                    [(load_tracks(tracks_path), start, end) for tracks_path, start, end in shards[path]],
+                    iou_threshold=self.object_tracking_config.SHARD_STITCH_IOU,
+                    min_frames=self.object_tracking_config.SHARD_STITCH_MIN_FRAMES)
+                for tracks_path, _, _ in shards[path]:
+                    os.remove(tracks_path)
+                logging.info(f"{Path(path).name}: stitched {stitched} track IDs across {len(shards[path])} shards, "
+                             f"{len(np.unique(rows[:, 1]))} tracks")
+                if self.object_tracking_config.SAVE_TRACKS:
+                    np.savetxt(os.path.join(self.object_tracking_config.DETECT_DIR, Path(path).stem +
+                                            self.object_tracking_config.TRACKS_SUFFIX), rows, fmt=TRACK_FORMAT)
+                if self.object_tracking_config.RENDER_VIDEO:
+                    self.render_video(path, rows, names)
+            print(f'Done. ({time.time() - t0:.3f}s)')
+
+            object_tracking_artifacts = ObjectTrackingArtifacts(
+                artifacts_path=self.object_tracking_config.OBJECT_TRACKING_ARTIFACTS_DIR,
+                output_path=self.object_tracking_config.DETECT_DIR)
+
+            logging.info(f"Object tracking artifact: {object_tracking_artifacts}")
+            logging.info("Exited the initiate_object_tracking method of Sharded tracking class")
+            return object_tracking_artifacts
+        except Exception as e:
+            raise CustomException(e, sys) from e
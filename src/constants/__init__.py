@@ -5,7 +5,8 @@ from datetime import datetime
 # Common constants
 IMG_SIZE = 512
 TIMESTAMP: str = datetime.now().strftime("%m_%d_%Y_%H_%M_%S")
-ARTIFACTS_DIR = os.path.join("artifacts", TIMESTAMP)
+ARTIFACTS_ROOT = "artifacts"
+ARTIFACTS_DIR = os.path.join(ARTIFACTS_ROOT, TIMESTAMP)
 use_cuda = torch.cuda.is_available()
 DEVICE = torch.device("cuda:0" if use_cuda else "cpu")
 # DEVICE = torch.device("cpu")
@@ -13,6 +14,18 @@ HALF = DEVICE.type != "cpu"
 
 APP_HOST = "0.0.0.0"
 APP_PORT = 8080
+SERVER_MAX_CONCURRENT_REQUESTS = 1  # /track requests tracking at once on the resident model, the others wait
+
+# Logging constants
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # level of every logger without a LOG_LEVELS entry
+LOG_LEVELS = {  # per module levels, the per-box and per-frame helpers only log at DEBUG
+    "src.utils": "INFO",
+    "src.ml": "INFO",
+    "src.components.object_tracking": "INFO",
+}
+LOG_QUEUE_SIZE = 10000  # records waiting for the background log writer, further records are dropped
+LOG_SAMPLE_EVERY = 100  # per-frame summaries are logged once every N frames
+PROGRESS_INTERVAL = 1.0  # seconds between progress lines
 
 # Model ingestion constants
 MODEL_INGESTION_ARTIFACTS_DIR = 'ModelIngestionArtifacts'
@@ -23,19 +36,95 @@ WEIGHTS_DIR = 'Yolov7'
 MODEL_LOADING_ARTIFACTS_DIR = "ModelLoadingArtifacts"
 MODEL_NAME = "yolov7.pt"
 TRACED_MODEL = "traced_model.pt"
+TRACE_CACHE_SIZE = 8  # input shapes (batch, 3, H, W) whose traces are kept, least recently used are dropped
+TRACE_OPTIMIZE = True  # freeze and optimize_for_inference every trace
+COMPILE_CACHE = True  # keep the fused model and traces across runs, keyed by weights, shape, precision, device, torch
+COMPILE_CACHE_DIR = os.path.join("artifacts", "compile_cache")  # outside the timestamped ARTIFACTS_DIR of a run
+COMPILE_CACHE_MAX_SIZE = 10 * 1024 ** 3  # bytes, the least recently used entries beyond it are removed
+CONF_THRES = 0.25  # detection confidence threshold
+IOU_THRES = 0.45  # NMS IoU threshold
+NMS_BACKEND = "auto"  # torchvision, batched, fast, numpy or auto (torchvision on the CPU, batched otherwise)
+# fast is approximate Fast NMS, it keeps 0.86 to 0.91 of the greedy NMS boxes in nms_benchmark
+NMS_MERGE = False  # merge-NMS, replace every kept box by the score weighted mean of the boxes it suppressed
+FUSED_POSTPROCESS = True  # decode, filter and suppress the detections in one scripted graph after the trace
+CLASSES = None  # class IDs to detect, e.g. [0, 32] for person and sports ball, the head is pruned to them at load time
 
 # Data transformation constants
 DATA_TRANSFORMATION_ARTIFACTS_DIR = "DataTransformationArtifacts"
-SOURCE = "soccer.mp4"
+SOURCE = "soccer.mp4"  # video/image path or glob, or a live webcam index or rtsp://, rtmp://, http(s):// URL
+LIVE_DEFAULT_FPS = 25.  # nominal frame rate of live sources that do not report one
+LIVE_RECONNECT_ATTEMPTS = 3  # failed reads in a row after which a live source counts as ended
+LIVE_READ_TIMEOUT = 10.  # seconds without a new live frame after which the source counts as ended
 IMG_FORMATS = ['bmp', 'jpg', 'jpeg', 'png', 'tif', 'tiff', 'dng', 'webp', 'mpo']  # acceptable image suffixes
 VID_FORMATS = ['mov', 'avi', 'mp4', 'mpg', 'mpeg', 'm4v', 'wmv', 'mkv', 'webm']  # acceptable video suffixes
 
 # Object tracking constants
 OBJECT_TRACKING_ARTIFACTS_DIR = "ObjectTrackingArtifacts"
 DETECT_DIR = "detect"
+RENDER_VIDEO = True  # draw the tracks and write the output video
+SAVE_TRACKS = False  # write a <video>_tracks.csv file of [frame, id, x1, y1, x2, y2, class, predicted] rows
+TRACKS_SUFFIX = "_tracks.csv"
+SHARD_WORKERS = 1  # worker processes tracking time ranges of every video in parallel, 1 tracks in-process
+SHARD_COUNT = None  # shards per video, None makes one per worker
+SHARD_OVERLAP = 30  # frames a shard also tracks before its range, to warm up its tracker and stitch its IDs
+SHARD_STITCH_IOU = 0.5  # IoU from which boxes of two shards on a shared frame vote for the same object
+SHARD_STITCH_MIN_FRAMES = 3  # votes two track IDs need to be stitched
+SHARD_START_METHOD = "spawn"  # multiprocessing start method of the shard workers
+TRACK_HISTORY_LEN = 64  # centroids/boxes kept per track
+TRAIL_LENGTH = 32  # centroids drawn per track trail
+GATED_ASSOCIATION_MIN_PAIRS = 10000  # detections x trackers from which SORT switches to sparse association,
+# which can break exact ties between equal cost matches differently than the dense association
+GATED_ASSOCIATION_EXACT_MAX_PAIRS = 1000000  # up to which the sparse association re-solves densely a frame whose
+# new track order depends on the dense solve's zero cost pairs, above it that order may differ
+ASSIGNMENT_SOLVER = "auto"  # greedy, lapjv, scipy, auction or auto (picked per frame, lapjv when no fast path)
+AUCTION_MIN_SIZE = None  # smaller side of the cost matrix from which auto picks the auction solver, None disables it
+AUCTION_MAX_DENSITY = 0.02  # largest fraction of non-zero costs for which auto picks the auction solver
+AUCTION_TOLERANCE = 1e-3  # auction optimality gap, relative to the cost range
+KEYFRAME_INTERVAL = 1  # run the detector every Nth frame, 1 runs it on every frame
+KEYFRAME_MIN_CONFIDENCE = 0.3  # run the detector early once the propagated track confidence drops below this
+KEYFRAME_CONFIDENCE_DECAY = 0.9  # track confidence decay per prediction-only frame
+INFERENCE_BATCH_SIZE = 1  # keyframes per forward pass, or "auto" to time the model and pick one
+INFERENCE_MAX_BATCH_SIZE = 8  # largest batch "auto" tries
+INFERENCE_BATCH_TIMEOUT_MS = 200  # a partial batch is run once its oldest frame has waited this long
+PIPELINE_STAGES = False  # run decode, inference, tracking and rendering on their own threads
+PIPELINE_QUEUE_SIZE = 4  # batches waiting between two pipeline stages
+TILED_INFERENCE = False  # detect on overlapping native resolution tiles of the frame instead of the downscaled frame
+TILE_SIZE = IMG_SIZE  # tile side in frame pixels, also the model input side of every tile
+TILE_OVERLAP = 0.2  # smallest overlap of neighbouring tiles, as a fraction of the tile size
+TILE_REGIONS = None  # [[x1, y1, x2, y2], ...] regions of interest to tile, in pixels or fractions, None tiles it all
+TILE_LAYOUTS = {}  # per source file name overrides, e.g. {"cam1.mp4": {"tile_size": 640, "regions": [[0, .3, 1, 1]]}}
+TILE_MERGE_THRESHOLD = 0.6  # intersection over the smaller box above which detections of two tiles are merged
+MOTION_GATE = False  # skip the detector on frames that barely changed since the last detected frame
+MOTION_GATE_WIDTH = 160  # width of the grayscale frame the change is measured on
+MOTION_PIXEL_THRESHOLD = 25  # gray level difference from which a pixel counts as changed
+MOTION_AREA_THRESHOLD = 0.002  # fraction of changed pixels under which the detector is skipped
+MOTION_GATE_MODE = "predict"  # gated frames run a "predict"-only tracker step or "reuse" the last detections
+MOTION_GATE_MAX_SKIP = 300  # run the detector after this many gated frames in a row anyway, 0 never forces it
+MOTION_GATES = {}  # per source file name overrides, e.g. {"cam1.mp4": {"area_threshold": 0.01}}
+ADAPTIVE_RESOLUTION = False  # switch the model input size between RESOLUTION_SIZES to hold RESOLUTION_TARGET_FPS
+RESOLUTION_SIZES = [320, 416, 512, 640]  # pre-warmed input sizes, multiples of the model stride
+RESOLUTION_TARGET_FPS = 25.
+RESOLUTION_HYSTERESIS = 0.15  # relative latency band around the frame budget inside which the size is kept
+RESOLUTION_MIN_DWELL = 30  # frames measured at an input size before it may change again
+RESOLUTION_MIN_DETECTIONS = 1.  # detections per keyframe under which the input size is not raised
+LIVE_LATENCY_BUDGET_MS = 500  # live frames older than this when they reach inference are dropped, 0 keeps all
+DETECTIONS_BUFFER_SIZE = 1000  # rows preallocated for the detections passed to SORT, grows when exceeded
+APPEARANCE_REID = False  # fuse appearance embeddings into the association (DeepSORT style re-identification)
+APPEARANCE_WEIGHTS = None  # trained EmbeddingNet state dict, required when APPEARANCE_REID is enabled
+APPEARANCE_EMBEDDING_DIM = 128
+APPEARANCE_CROP_SIZE = (32, 16)  # (height, width) every box is resized to before embedding
+APPEARANCE_GALLERY_SIZE = 16  # embeddings kept per track
+APPEARANCE_WEIGHT = 0.5  # weight of the cosine distance against 1 - IoU in the fused association cost
+APPEARANCE_MAX_DISTANCE = 0.2  # cosine distance under which a nearby pair may match without reaching the IoU threshold
+APPEARANCE_CENTER_GATE = 1.0  # centre distance, in predicted box diagonals, within which a pair counts as nearby
+APPEARANCE_MAX_AGE = 30  # frames a track survives without detections when re-identification is enabled
+SNAPSHOT_INTERVAL = 0  # write a tracker snapshot every N frames, 0 disables snapshots
+SNAPSHOT_NAME = "tracker_snapshot.npz"
+RESUME_SNAPSHOT = None  # snapshot of an interrupted job to resume from, None starts from frame 0
 
 # Pusher constants
-TRACKED_DIR = os.path.join("detect", TIMESTAMP)
+TRACKED_ROOT = "detect"
+TRACKED_DIR = os.path.join(TRACKED_ROOT, TIMESTAMP)
 
 
 
@@ -5,42 +5,98 @@ from dataclasses import dataclass
 
 @dataclass
 class ModelIngestionConfig:
-    def __init__(self):
+    def __init__(self, timestamp: str = TIMESTAMP):
         self.BUCKET_NAME: str = BUCKET_NAME
         self.WEIGHTS_DIR: str = WEIGHTS_DIR
         self.MODEL_NAME: str = MODEL_NAME
-        self.MODEL_INGESTION_ARTIFACTS_DIR: str = os.path.join(os.getcwd(), ARTIFACTS_DIR, MODEL_INGESTION_ARTIFACTS_DIR)
+        self.MODEL_INGESTION_ARTIFACTS_DIR: str = os.path.join(os.getcwd(), ARTIFACTS_ROOT, timestamp, MODEL_INGESTION_ARTIFACTS_DIR)
         self.WEIGHTS_DIR_PATH: str = os.path.join(self.MODEL_INGESTION_ARTIFACTS_DIR, self.WEIGHTS_DIR)
         self.MODEL_PATH: str = os.path.join(self.WEIGHTS_DIR_PATH, self.MODEL_NAME)
 
 
 @dataclass
 class ModelLoadingConfig:
-    def __init__(self):
+    def __init__(self, timestamp: str = TIMESTAMP):
         self.MODEL_NAME = MODEL_NAME
         self.TRACED_MODEL = TRACED_MODEL
-        self.MODEL_LOADING_ARTIFACTS_DIR: str = os.path.join(os.getcwd(), ARTIFACTS_DIR, MODEL_LOADING_ARTIFACTS_DIR)
+        self.MODEL_LOADING_ARTIFACTS_DIR: str = os.path.join(os.getcwd(), ARTIFACTS_ROOT, timestamp, MODEL_LOADING_ARTIFACTS_DIR)
         self.MODEL_PATH: str = os.path.join(self.MODEL_LOADING_ARTIFACTS_DIR, self.MODEL_NAME)
         self.TRACED_MODEL_PATH: str = os.path.join(self.MODEL_LOADING_ARTIFACTS_DIR, self.TRACED_MODEL)
+        self.CLASSES = CLASSES
+        self.COMPILE_CACHE: bool = COMPILE_CACHE
+        self.COMPILE_CACHE_DIR: str = os.path.join(os.getcwd(), COMPILE_CACHE_DIR)
+        self.COMPILE_CACHE_MAX_SIZE: int = COMPILE_CACHE_MAX_SIZE
 
 
 @dataclass
 class DataTransformationConfig:
-    def __init__(self):
-        self.DATA_TRANSFORMATION_ARTIFACTS_DIR: str = os.path.join(os.getcwd(), ARTIFACTS_DIR, DATA_TRANSFORMATION_ARTIFACTS_DIR)
+    def __init__(self, timestamp: str = TIMESTAMP):
+        self.DATA_TRANSFORMATION_ARTIFACTS_DIR: str = os.path.join(os.getcwd(), ARTIFACTS_ROOT, timestamp, DATA_TRANSFORMATION_ARTIFACTS_DIR)
 
 
 @dataclass
 class ObjectTrackingConfig:
-    def __init__(self):
-        self.OBJECT_TRACKING_ARTIFACTS_DIR: str = os.path.join(os.getcwd(), ARTIFACTS_DIR, OBJECT_TRACKING_ARTIFACTS_DIR)
+    def __init__(self, timestamp: str = TIMESTAMP):
+        self.OBJECT_TRACKING_ARTIFACTS_DIR: str = os.path.join(os.getcwd(), ARTIFACTS_ROOT, timestamp, OBJECT_TRACKING_ARTIFACTS_DIR)
         self.DETECT_DIR: str = os.path.join(self.OBJECT_TRACKING_ARTIFACTS_DIR, DETECT_DIR)
+        self.TRACK_HISTORY_LEN: int = TRACK_HISTORY_LEN
+        self.CONF_THRES: float = CONF_THRES
+        self.IOU_THRES: float = IOU_THRES
+        self.NMS_BACKEND: str = NMS_BACKEND
+        self.NMS_MERGE: bool = NMS_MERGE
+        self.FUSED_POSTPROCESS: bool = FUSED_POSTPROCESS
+        self.RENDER_VIDEO: bool = RENDER_VIDEO
+        self.SAVE_TRACKS: bool = SAVE_TRACKS
+        self.TRACKS_SUFFIX: str = TRACKS_SUFFIX
+        self.SHARD_WORKERS: int = SHARD_WORKERS
+        self.SHARD_COUNT = SHARD_COUNT
+        self.SHARD_OVERLAP: int = SHARD_OVERLAP
+        self.SHARD_STITCH_IOU: float = SHARD_STITCH_IOU
+        self.SHARD_STITCH_MIN_FRAMES: int = SHARD_STITCH_MIN_FRAMES
+        self.SHARD_START_METHOD: str = SHARD_START_METHOD
+        self.TRAIL_LENGTH: int = TRAIL_LENGTH
+        self.KEYFRAME_INTERVAL: int = KEYFRAME_INTERVAL
+        self.KEYFRAME_MIN_CONFIDENCE: float = KEYFRAME_MIN_CONFIDENCE
+        self.KEYFRAME_CONFIDENCE_DECAY: float = KEYFRAME_CONFIDENCE_DECAY
+        self.INFERENCE_BATCH_SIZE = INFERENCE_BATCH_SIZE
+        self.INFERENCE_MAX_BATCH_SIZE: int = INFERENCE_MAX_BATCH_SIZE
+        self.INFERENCE_BATCH_TIMEOUT_MS: float = INFERENCE_BATCH_TIMEOUT_MS
+        self.PIPELINE_STAGES: bool = PIPELINE_STAGES
+        self.MOTION_GATE: bool = MOTION_GATE
+        self.MOTION_GATE_WIDTH: int = MOTION_GATE_WIDTH
+        self.MOTION_PIXEL_THRESHOLD: int = MOTION_PIXEL_THRESHOLD
+        self.MOTION_AREA_THRESHOLD: float = MOTION_AREA_THRESHOLD
+        self.MOTION_GATE_MODE: str = MOTION_GATE_MODE
+        self.MOTION_GATE_MAX_SKIP: int = MOTION_GATE_MAX_SKIP
+        self.MOTION_GATES: dict = MOTION_GATES
+        self.ADAPTIVE_RESOLUTION: bool = ADAPTIVE_RESOLUTION
+        self.RESOLUTION_SIZES: list = RESOLUTION_SIZES
+        self.RESOLUTION_TARGET_FPS: float = RESOLUTION_TARGET_FPS
+        self.RESOLUTION_HYSTERESIS: float = RESOLUTION_HYSTERESIS
+        self.RESOLUTION_MIN_DWELL: int = RESOLUTION_MIN_DWELL
+        self.RESOLUTION_MIN_DETECTIONS: float = RESOLUTION_MIN_DETECTIONS
+        self.LIVE_LATENCY_BUDGET_MS: float = LIVE_LATENCY_BUDGET_MS
+        self.TILED_INFERENCE: bool = TILED_INFERENCE
+        self.TILE_SIZE: int = TILE_SIZE
+        self.TILE_OVERLAP: float = TILE_OVERLAP
+        self.TILE_REGIONS = TILE_REGIONS
+        self.TILE_LAYOUTS: dict = TILE_LAYOUTS
+        self.TILE_MERGE_THRESHOLD: float = TILE_MERGE_THRESHOLD
+        self.APPEARANCE_REID: bool = APPEARANCE_REID
+        self.APPEARANCE_WEIGHTS = APPEARANCE_WEIGHTS
+        self.APPEARANCE_WEIGHT: float = APPEARANCE_WEIGHT
+        self.APPEARANCE_MAX_DISTANCE: float = APPEARANCE_MAX_DISTANCE
+        self.APPEARANCE_CENTER_GATE: float = APPEARANCE_CENTER_GATE
+        self.APPEARANCE_MAX_AGE: int = APPEARANCE_MAX_AGE
+        self.SNAPSHOT_INTERVAL: int = SNAPSHOT_INTERVAL
+        self.SNAPSHOT_PATH: str = os.path.join(self.OBJECT_TRACKING_ARTIFACTS_DIR, SNAPSHOT_NAME)
+        self.RESUME_SNAPSHOT = RESUME_SNAPSHOT
 
 
 @dataclass
 class PusherConfig:
-    def __init__(self):
+    def __init__(self, timestamp: str = TIMESTAMP):
         self.BUCKET_NAME: str = BUCKET_NAME
-        self.DIR_NAME: str = TRACKED_DIR
+        self.DIR_NAME: str = os.path.join(TRACKED_ROOT, timestamp)
 
 
@@ -1,7 +1,13 @@
 import logging
+import logging.handlers
 import os
+import sys
+import time
+import queue
+import atexit
 
 from datetime import datetime
+from src.constants import LOG_LEVEL, LOG_LEVELS, LOG_QUEUE_SIZE, PROGRESS_INTERVAL
 
 LOG_FILE_NAME = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
 os.makedirs(os.path.join(os.getcwd(), "logs"), exist_ok=True)
@@ -10,8 +16,112 @@ logs_dir_path = os.path.join(os.getcwd(), "logs")
 
 LOG_FILE_PATH = os.path.join(logs_dir_path, LOG_FILE_NAME)
 
-logging.basicConfig(
-    filename=LOG_FILE_PATH,
-    format="[ %(asctime)s ] %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
\ No newline at end of file
+LOG_FORMAT = "[ %(asctime)s ] %(name)s - %(levelname)s - %(message)s"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking the caller when the queue is full, so the hot loop never
+    waits on the log file
+    """
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def stop_listener():
+    """
+    Stops the listener once the queued records are written, then writes how many records the full queue dropped
+    """
+    listener.stop()
+    if queue_handler.dropped:
+        file_handler.handle(root_logger.makeRecord(
+            __name__, logging.WARNING, __file__, 0,
+            "%d log records were dropped because the log queue was full", (queue_handler.dropped,), None))
+
+
+# Records are queued by the calling thread and written to the log file by the listener's background thread
+log_queue = queue.Queue(LOG_QUEUE_SIZE)
+file_handler = logging.FileHandler(LOG_FILE_PATH)
+file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+queue_handler = DroppingQueueHandler(log_queue)
+listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+
+root_logger = logging.getLogger()
+if not any(isinstance(h, DroppingQueueHandler) for h in root_logger.handlers):
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(LOG_LEVEL)
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+    listener.start()
+    atexit.register(stop_listener)
+
+
+def get_logger(name):
+    """
+    Returns the logger of module 'name'. Its level comes from the closest LOG_LEVELS entry, e.g. 'src.utils' for
+    'src.utils.general', falling back to LOG_LEVEL.
+    """
+    return logging.getLogger(name)
+
+
+_sample_counts = {}
+
+
+def sample_every_n(logger, n, key):
+    """
+    True on the first call and then on every n-th call for the same logger and key, to skip building per-frame
+    messages that would not be logged
+    """
+    key = (logger.name, key)
+    count = _sample_counts.get(key, 0)
+    _sample_counts[key] = count + 1
+    return count % n == 0
+
+
+class ProgressReporter(object):
+    """
+    Single rate-limited progress line, printed and logged at most once every 'interval' seconds, in place of
+    one print per frame
+    """
+
+    def __init__(self, desc="", total=None, interval=PROGRESS_INTERVAL, stream=None):
+        self.desc = desc
+        self.total = total
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stdout
+        self.count = 0
+        self.fields = {}
+        self.start = time.monotonic()
+        self.last = self.start
+        self.logger = logging.getLogger("progress")
+
+    def update(self, n=1, **fields):
+        """
+        Counts 'n' more items and remembers the latest 'fields' (e.g. detections=12, inference_ms=30.2) for the
+        next progress line
+        """
+        self.count += n
+        self.fields.update(fields)
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self.start
+        done = f"{self.count}/{self.total}" if self.total else f"{self.count}"
+        fields = " ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in self.fields.items())
+        line = f"{self.desc} {done} ({self.count / elapsed if elapsed > 0 else 0.:.1f}/s, {elapsed:.1f}s) {fields}"
+        print(line.strip(), file=self.stream, flush=True)
+        self.logger.info(line.strip())
+
+    def close(self):
+        """
+        Prints the final progress line
+        """
+        self.report()
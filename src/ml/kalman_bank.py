@@ -0,0 +1,229 @@
+import sys
+import numpy as np
+from src.exception import CustomException
+from src.utils import convert_bboxes_to_z, convert_x_to_bboxes
+
+
+class KalmanBank(object):
+    """
+    Struct-of-arrays bank of constant velocity Kalman filters, one slot per live track.
+
+    State is x = [u, v, s, r, u_dot, v_dot, s_dot] (centre, area, aspect ratio and their velocities) and
+    the measurement is z = [u, v, s, r]. Every live track owns one slot of the (capacity, 7) state array and
+    the (capacity, 7, 7) covariance array, so predict/update for all tracks of a frame run as a handful of
+    batched array ops instead of one filterpy.KalmanFilter call per track. The noise model is the one of
+    the per object filters of the original SORT.
+    """
+    dim_x = 7
+    dim_z = 4
+    slot_fields = ('x', 'P', 'age', 'hits', 'hit_streak', 'time_since_update', 'detclass', 'score')
+
+    F = np.array([[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
+                  [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]], dtype=float)
+    H = np.array([[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0], [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]],
+                 dtype=float)
+
+    R = np.eye(4)
+    R[2:, 2:] *= 10.  # R: Covariance matrix of measurement noise (set to high for noisy inputs -> more 'inertia' of boxes')
+    P0 = np.eye(7)
+    P0[4:, 4:] *= 1000.  # give high uncertainty to the unobservable initial velocities
+    P0 *= 10.
+    Q = np.eye(7)
+    Q[-1, -1] *= 0.5  # Q: Covariance matrix of process noise (set to high for erratically moving things)
+    Q[4:, 4:] *= 0.5
+
+    def __init__(self, capacity=64):
+        """
+        :param capacity: initial number of track slots, the bank doubles in size when it runs out
+        """
+        self.capacity = 0
+        self.x = np.zeros((0, self.dim_x))
+        self.P = np.zeros((0, self.dim_x, self.dim_x))
+        self.age = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.hit_streak = np.zeros(0, dtype=np.int64)
+        self.time_since_update = np.zeros(0, dtype=np.int64)
+        self.detclass = np.zeros(0)
+        self.score = np.zeros(0)
+        self.active = np.zeros(0, dtype=bool)
+        # stack of free slot indices, the top of the stack is self._free[self._n_free - 1]
+        self._free = np.zeros(0, dtype=np.int64)
+        self._n_free = 0
+        self._grow(max(int(capacity), 1))
+
+    def __len__(self):
+        return self.capacity - self._n_free
+
+    def _grow(self, capacity):
+        """
+        Resizes every per-slot array to the new capacity, existing slot indices stay valid
+        """
+        old = self.capacity
+        for name in ('x', 'P', 'age', 'hits', 'hit_streak', 'time_since_update', 'detclass', 'score', 'active'):
+            arr = getattr(self, name)
+            grown = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            grown[:old] = arr
+            setattr(self, name, grown)
+        free = np.empty(capacity, dtype=np.int64)
+        free[:self._n_free] = self._free[:self._n_free]
+        # new slots go on top of the stack and are handed out lowest index first
+        new_slots = np.arange(capacity - 1, old - 1, -1)
+        free[self._n_free:self._n_free + len(new_slots)] = new_slots
+        self._free = free
+        self._n_free += len(new_slots)
+        self.capacity = capacity
+
+    def _claim(self, n):
+        """
+        Pops n slots off the free stack, growing the bank when it runs out
+        """
+        if n > self._n_free:
+            self._grow(max(self.capacity * 2, len(self) + n))
+        slots = self._free[self._n_free - n:self._n_free][::-1].copy()
+        self._n_free -= n
+        return slots
+
+    def allocate(self, bboxes):
+        """
+        Claims one slot per box and initialises its filter from the box
+
+        Parameter 'bboxes' is an (n, >=6) array of [x1,y1,x2,y2,score,detclass,...] rows.
+        Returns the (n,) array of claimed slot indices.
+        """
+        bboxes = np.atleast_2d(np.asarray(bboxes, dtype=float))
+        n = len(bboxes)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        slots = self._claim(n)
+
+        self.x[slots] = 0.
+        self.x[slots, :4] = convert_bboxes_to_z(bboxes)
+        self.P[slots] = self.P0
+        self.age[slots] = 0
+        self.hits[slots] = 0
+        self.hit_streak[slots] = 0
+        self.time_since_update[slots] = 0
+        self.detclass[slots] = bboxes[:, 5]
+        self.score[slots] = bboxes[:, 4]
+        self.active[slots] = True
+        return slots
+
+    def state_dict(self, slots):
+        """
+        Returns the filter states and counters of 'slots' as a dict of arrays, see restore()
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        return {name: getattr(self, name)[slots] for name in self.slot_fields}
+
+    def restore(self, state):
+        """
+        Claims one slot per filter of a state_dict() and copies the filters in. Returns the claimed slots, in the
+        order of the saved ones.
+        """
+        n = len(state['x'])
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        slots = self._claim(n)
+        for name in self.slot_fields:
+            getattr(self, name)[slots] = state[name]
+        self.active[slots] = True
+        return slots
+
+    def release(self, slots):
+        """
+        Returns slots to the free stack
+        """
+        slots = np.asarray(slots, dtype=np.int64).ravel()
+        if len(slots) == 0:
+            return
+        self.active[slots] = False
+        self._free[self._n_free:self._n_free + len(slots)] = slots[::-1]
+        self._n_free += len(slots)
+
+    def transition(self, dt=1.0):
+        """
+        Returns the (F, Q) pair for a step of 'dt' frame intervals. With an (n,) array of per-slot steps the
+        pair is stacked to (n, 7, 7).
+        """
+        if np.ndim(dt) == 0:
+            if dt == 1.0:
+                return self.F, self.Q
+            F = self.F.copy()
+            F[[0, 1, 2], [4, 5, 6]] = dt
+            return F, self.Q * dt
+        dt = np.asarray(dt, dtype=float)
+        F = np.repeat(self.F[None], len(dt), axis=0)
+        F[:, [0, 1, 2], [4, 5, 6]] = dt[:, None]
+        return F, self.Q * dt[:, None, None]
+
+    def predict(self, slots, dt=1.0, bookkeeping=True):
+        """
+        Advances the state vectors of the given slots by 'dt' frame intervals (a scalar, or one value per slot)
+        and returns the (n, 4) predicted [x1,y1,x2,y2] boxes
+
+        With bookkeeping=False only the filters move: age, hit streak and time since update are left alone, which
+        is what prediction-only steps between detector keyframes need.
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(slots) == 0:
+            return np.empty((0, 4))
+        F, Q = self.transition(dt)
+        x = self.x[slots]
+        # do not let the predicted area go negative
+        x[(x[:, 6] + x[:, 2]) <= 0, 6] = 0.
+        # x = Fx, P = FPF' + Q
+        FT = F.swapaxes(-1, -2)
+        x = x @ FT if F.ndim == 2 else (F @ x[:, :, None])[:, :, 0]
+        self.x[slots] = x
+        self.P[slots] = F @ self.P[slots] @ FT + Q
+        if not bookkeeping:
+            return convert_x_to_bboxes(x)
+
+        self.age[slots] += 1
+        self.hit_streak[slots[self.time_since_update[slots] > 0]] = 0
+        self.time_since_update[slots] += 1
+        return convert_x_to_bboxes(x)
+
+    def update(self, slots, bboxes):
+        """
+        Updates the state vectors of the given slots with their observed boxes
+
+        Parameter 'bboxes' is an (n, >=6) array of [x1,y1,x2,y2,score,detclass,...] rows aligned with 'slots'.
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(slots) == 0:
+            return
+        bboxes = np.asarray(bboxes, dtype=float)
+        x = self.x[slots]
+        P = self.P[slots]
+
+        # y = z - Hx
+        y = convert_bboxes_to_z(bboxes) - x[:, :4]
+        # H only selects the first four state variables: PH' = P[:, :, :4] and HPH' = P[:, :4, :4]
+        PHT = P[:, :, :4]
+        S = PHT[:, :4, :] + self.R
+        K = PHT @ np.linalg.inv(S)
+        x = x + (K @ y[:, :, None])[:, :, 0]
+        # P = (I-KH)P(I-KH)' + KRK'
+        I_KH = np.broadcast_to(np.eye(self.dim_x), P.shape).copy()
+        I_KH[:, :, :4] -= K
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+
+        self.x[slots] = x
+        self.P[slots] = P
+        self.time_since_update[slots] = 0
+        self.hits[slots] += 1
+        self.hit_streak[slots] += 1
+        self.detclass[slots] = bboxes[:, 5]
+        self.score[slots] = bboxes[:, 4]
+
+    def get_state(self, slots):
+        """
+        Returns the (n, 8) array of [x1,y1,x2,y2,detclass,u_dot,v_dot,s_dot] rows for the given slots
+        """
+        try:
+            slots = np.asarray(slots, dtype=np.int64)
+            x = self.x[slots]
+            return np.concatenate((convert_x_to_bboxes(x), self.detclass[slots, None], x[:, 4:7]), axis=1)
+        except Exception as e:
+            raise CustomException(e, sys) from e
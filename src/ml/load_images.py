@@ -30,6 +30,7 @@ class LoadImages:  # for inference
         self.nf = ni + nv  # number of files
         self.video_flag = [False] * ni + [True] * nv
         self.mode = 'image'
+        self.stop_frame = None  # last frame returned of the current video, None reads it to the end
         if any(videos):
             self.new_video(videos[0])  # new video
         else:
@@ -49,6 +50,8 @@ class LoadImages:  # for inference
         if self.video_flag[self.count]:
             # Read video
             self.mode = 'video'
+            if self.stop_frame is not None and self.frame >= self.stop_frame:
+                raise StopIteration
             ret_val, img0 = self.cap.read()
             if not ret_val:
                 self.count += 1
@@ -61,7 +64,6 @@ class LoadImages:  # for inference
                     ret_val, img0 = self.cap.read()
 
             self.frame += 1
-            print(f'video {self.count + 1}/{self.nf} ({self.frame}/{self.nframes}) {path}: ', end='')
 
         else:
             # Read image
@@ -79,6 +81,48 @@ class LoadImages:  # for inference
 
         return path, img, img0, self.cap
 
+    def seek(self, path, frame):
+        """
+        Positions the loader so the next frame it returns is the one after 'frame' of video 'path', e.g. to
+        resume an interrupted job or start a shard. Many codecs only honour CAP_PROP_POS_FRAMES approximately, so
+        the position the capture reports after the seek is checked: frames short of 'frame' are decoded and
+        dropped, and a seek past it or one the backend cannot report decodes from the start of the video.
+        """
+        try:
+            self.count = self.files.index(path)
+            self.new_video(path)
+            position = 0
+            if frame > 0:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+                position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+                if not 0 <= position <= frame:
+                    self.new_video(path)
+                    position = 0
+            while position < frame and self.cap.grab():
+                position += 1
+            self.frame = frame
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def shapes(self, img_size=None):
+        """
+        Letterboxed (H, W) model input shapes of the videos at 'img_size' (by default the loader's), read from
+        their frame sizes without decoding a frame. Images are only read when they are reached.
+        """
+        try:
+            shapes = []
+            for path, video in zip(self.files, self.video_flag):
+                if video:
+                    cap = cv2.VideoCapture(path)
+                    shape = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                    cap.release()
+                    shape = letterbox_shape(shape, img_size or self.img_size, stride=self.stride)
+                    if shape not in shapes:
+                        shapes.append(shape)
+            return shapes
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
     def new_video(self, path):
         self.frame = 0
         self.cap = cv2.VideoCapture(path)
@@ -88,6 +132,19 @@ class LoadImages:  # for inference
         return self.nf  # number of files
 
 
+def letterbox_shape(shape, new_shape=(640, 640), auto=True, scaleup=True, stride=32):
+    # Shape [height, width] of the image letterbox() returns for an image of 'shape' [height, width]
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
+    if not scaleup:
+        r = min(r, 1.0)
+    new_unpad = int(round(shape[0] * r)), int(round(shape[1] * r))
+    if not auto:
+        return new_shape
+    return tuple(s + (n - s) % stride for s, n in zip(new_unpad, new_shape))
+
+
 def letterbox(img, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleFill=False, scaleup=True, stride=32):
     # Resize and pad image while meeting stride-multiple constraints
     shape = img.shape[:2]  # current shape [height, width]
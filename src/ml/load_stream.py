@@ -0,0 +1,128 @@
+import sys
+import time
+import threading
+import numpy as np
+import cv2
+from src.logger import logging
+from src.exception import CustomException
+from src.ml.load_images import letterbox, letterbox_shape
+from src.constants import LIVE_DEFAULT_FPS, LIVE_RECONNECT_ATTEMPTS, LIVE_READ_TIMEOUT
+
+STREAM_PREFIXES = ('rtsp://', 'rtmp://', 'http://', 'https://')
+
+
+def is_stream(source):
+    """
+    True for live sources: a webcam index or an RTSP/RTMP/HTTP URL
+    """
+    source = str(source)
+    return source.isnumeric() or source.lower().startswith(STREAM_PREFIXES)
+
+
+class LoadStream:  # for live inference
+    """
+    Live webcam or RTSP/HTTP source with the interface of LoadImages.
+
+    A reader thread decodes frames as fast as the source delivers them and keeps only the newest one, stamped with
+    its capture time. Iterating returns that newest frame, waiting for the next one when it was already returned,
+    so a slow consumer always works on the latest frame instead of falling behind the source. Frames replaced
+    before they were returned are counted in 'dropped'. 'timestamp' is the capture time in ms (time.monotonic()
+    clock) of the last returned frame. The stream ends when the source fails 'reconnect' times in a row or
+    delivers no frame for 'timeout' seconds.
+    """
+
+    def __init__(self, source, img_size=640, stride=32, reconnect=LIVE_RECONNECT_ATTEMPTS, timeout=LIVE_READ_TIMEOUT):
+        try:
+            self.source = str(source)
+            self.url = int(self.source) if self.source.isnumeric() else self.source
+            self.img_size = img_size
+            self.stride = stride
+            self.reconnect = reconnect
+            self.timeout = timeout
+            self.mode = 'stream'
+            self.cap = cv2.VideoCapture(self.url)
+            assert self.cap.isOpened(), f'Failed to open {self.source}'
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) % 100 or LIVE_DEFAULT_FPS  # RTSP may report 0
+            self.shape = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            logging.info(f"Opened stream {self.source} ({self.shape[1]}x{self.shape[0]} at {self.fps:.2f} FPS)")
+
+            self.frame = 0  # frames returned
+            self.grabbed = 0  # frames decoded by the reader
+            self.dropped = 0  # frames replaced by a newer one before they were returned
+            self.timestamp = None
+            self._latest = None  # (img0, capture time in ms, sequence number)
+            self._returned = 0  # sequence number of the last returned frame
+            self._ended = False
+            self._stop = threading.Event()
+            self._new_frame = threading.Condition()
+            self._thread = threading.Thread(target=self.update, name="stream reader", daemon=True)
+            self._thread.start()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def update(self):
+        # Read the stream in a daemon thread, keeping the newest frame only
+        failures = 0
+        while not self._stop.is_set():
+            ok, img0 = self.cap.read()
+            if not ok:
+                failures += 1
+                if failures > self.reconnect:
+                    logging.error(f"Stream {self.source} failed {failures} times in a row, ending it")
+                    break
+                logging.warning(f"Reading {self.source} failed, reconnecting ({failures}/{self.reconnect})")
+                self.cap.release()
+                time.sleep(1.)
+                self.cap = cv2.VideoCapture(self.url)
+                continue
+            failures = 0
+            timestamp = time.monotonic() * 1E3
+            with self._new_frame:
+                self.grabbed += 1
+                if self._latest is not None and self._latest[2] > self._returned:
+                    self.dropped += 1
+                self._latest = img0, timestamp, self.grabbed
+                self._new_frame.notify_all()
+        with self._new_frame:
+            self._ended = True
+            self._new_frame.notify_all()
+        self.cap.release()
+
+    def __iter__(self):
+        self.count = 0
+        return self
+
+    def __next__(self):
+        with self._new_frame:
+            fresh = self._new_frame.wait_for(
+                lambda: (self._latest is not None and self._latest[2] > self._returned) or self._ended,
+                timeout=self.timeout)
+            if not fresh or self._latest is None or self._latest[2] == self._returned:
+                raise StopIteration
+            img0, self.timestamp, self._returned = self._latest
+        self.frame += 1
+
+        # Padded resize
+        img = letterbox(img0, self.img_size, stride=self.stride)[0]
+
+        # Convert
+        img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3x416x416
+        img = np.ascontiguousarray(img)
+
+        return self.source, img, img0, None
+
+    def shapes(self, img_size=None):
+        """
+        Letterboxed (H, W) model input shape of the stream at 'img_size' (by default the loader's)
+        """
+        return [letterbox_shape(self.shape, img_size or self.img_size, stride=self.stride)]
+
+    def close(self):
+        """
+        Stops the reader thread and releases the capture
+        """
+        self._stop.set()
+        self._thread.join(timeout=self.timeout)
+
+    def __len__(self):
+        return 1  # one source
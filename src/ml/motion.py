@@ -0,0 +1,81 @@
+import sys
+import cv2
+import numpy as np
+from src.exception import CustomException
+from src.constants import MOTION_GATE_WIDTH, MOTION_PIXEL_THRESHOLD, MOTION_AREA_THRESHOLD, MOTION_GATE_MAX_SKIP
+
+
+class MotionGate(object):
+    """
+    Frame-differencing gate in front of the detector of one source.
+
+    Every frame is downscaled to 'width' pixels wide, converted to grayscale and blurred, and compared with the
+    same image of the last frame the detector ran on. The changed area is the fraction of pixels whose gray level
+    moved by more than 'pixel_threshold'. The detector only runs when it reaches 'area_threshold', or once
+    'max_skip' frames in a row were skipped (0 never forces it). Comparing with the last detected frame rather
+    than the previous one lets slow motion add up until it opens the gate.
+    """
+
+    def __init__(self, width=MOTION_GATE_WIDTH, pixel_threshold=MOTION_PIXEL_THRESHOLD,
+                 area_threshold=MOTION_AREA_THRESHOLD, max_skip=MOTION_GATE_MAX_SKIP):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.max_skip = max_skip
+        self.reference = None
+        self.skipped_in_row = 0
+        self.frames = 0
+        self.skipped = 0
+        self.compared = 0  # frames compared with a reference
+        self.total_change = 0.
+
+    def downscale(self, im0):
+        """
+        Blurred grayscale (h, width) image of a BGR frame
+        """
+        h, w = im0.shape[:2]
+        size = (min(self.width, w), max(int(round(h * min(self.width, w) / w)), 1))
+        small = cv2.resize(im0, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed_area(self, gray):
+        """
+        Fraction of the pixels of 'gray' that changed since the reference frame, 1 without a reference
+        """
+        if self.reference is None or self.reference.shape != gray.shape:
+            return 1.
+        return float(np.count_nonzero(cv2.absdiff(gray, self.reference) > self.pixel_threshold)) / gray.size
+
+    def __call__(self, im0) -> bool:
+        """
+        True when the detector has to run on frame 'im0', which then becomes the reference frame
+        """
+        try:
+            gray = self.downscale(im0)
+            change = self.changed_area(gray)
+            self.frames += 1
+            if self.reference is not None:
+                self.compared += 1
+                self.total_change += change
+            forced = self.max_skip and self.skipped_in_row >= self.max_skip
+            if change >= self.area_threshold or forced:
+                self.reference = gray
+                self.skipped_in_row = 0
+                return True
+            self.skipped += 1
+            self.skipped_in_row += 1
+            return False
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def skip_rate(self) -> float:
+        return self.skipped / self.frames if self.frames else 0.
+
+    def stats(self):
+        """
+        Gated frames, skip rate and mean changed area, to tune the thresholds of a camera
+        """
+        return {'frames': self.frames, 'skipped': self.skipped, 'skip_rate': self.skip_rate(),
+                'mean_changed_area': self.total_change / self.compared if self.compared else 0.,
+                'area_threshold': self.area_threshold}
@@ -0,0 +1,218 @@
+import sys
+import numpy as np
+import torch
+from src.exception import CustomException
+
+try:
+    import torchvision  # compiled NMS kernels
+except ImportError:
+    torchvision = None
+
+BACKENDS = {}
+
+
+def register_backend(name):
+    """
+    Registers an NMS backend under 'name'.
+
+    A backend takes the (n, 4) xyxy boxes, offset by class so that boxes of different classes never overlap, the
+    (n,) scores, image and class indices of the candidates of a batch of 'bs' images, sorted by image, and the IoU
+    threshold. Boxes of different images or classes never suppress each other. It returns the indices of the kept
+    boxes, in any order.
+    """
+    def decorator(fn):
+        BACKENDS[name] = fn
+        return fn
+    return decorator
+
+
+def image_slices(images, bs):
+    """
+    (start, count) of the candidates of every image with candidates, for image indices sorted by image
+    """
+    counts = torch.bincount(images, minlength=bs).tolist()
+    starts = np.cumsum([0] + counts[:-1]).tolist()
+    return [(s, k) for s, k in zip(starts, counts) if k]
+
+
+@register_backend('torchvision')
+def torchvision_nms(boxes, scores, images, classes, bs, iou_thres):
+    """
+    One torchvision.ops.nms call per image: the sequential kernel is the fastest on the few boxes of one image on
+    the CPU
+    """
+    keep = [torchvision.ops.nms(boxes[s:s + k], scores[s:s + k], iou_thres) + s for s, k in image_slices(images, bs)]
+    return torch.cat(keep) if keep else images[:0]
+
+
+@register_backend('batched')
+def batched_backend(boxes, scores, images, classes, bs, iou_thres):
+    """
+    Greedy NMS of every class of every image at once in padded tensors, see batched_nms
+    """
+    nc = int(classes.max()) + 1 if len(classes) else 1
+    return batched_nms(boxes, scores, images * nc + classes, bs * nc, iou_thres)
+
+
+@register_backend('fast')
+def fast_backend(boxes, scores, images, classes, bs, iou_thres):
+    """
+    Fast NMS (YOLACT): a box is dropped when any higher score box of its class overlaps it by more than
+    'iou_thres', whether that box was kept or not. One pass over the padded IoU matrices with no sequential step,
+    at the cost of also dropping boxes whose only overlapping box was itself suppressed: nms_benchmark measures
+    a recall of 0.86 to 0.91 of the greedy (torchvision) boxes on its clustered synthetic detections. Its boxes
+    are a subset of greedy's before the max_det cut, not after it, where they can include boxes greedy cut.
+    """
+    nc = int(classes.max()) + 1 if len(classes) else 1
+    return batched_nms(boxes, scores, images * nc + classes, bs * nc, iou_thres, solver=fast_nms)
+
+
+@register_backend('numpy')
+def numpy_backend(boxes, scores, images, classes, bs, iou_thres):
+    """
+    Greedy NMS of every image in NumPy, for installs without torchvision
+    """
+    x = boxes.float().cpu().numpy()
+    s = scores.float().cpu().numpy()
+    keep = [numpy_nms(x[start:start + k], s[start:start + k], iou_thres) + start
+            for start, k in image_slices(images, bs)]
+    return torch.from_numpy(np.concatenate(keep) if keep else np.empty(0, dtype=np.int64)).to(images.device)
+
+
+def select_backend(device, bs):
+    """
+    torchvision per image on the CPU or for a single image, the padded batched backend on accelerators, and the
+    NumPy backend when torchvision is not installed
+    """
+    if torchvision is None:
+        return 'numpy'
+    return 'torchvision' if bs == 1 or device.type == 'cpu' else 'batched'
+
+
+def suppress(boxes, scores, images, classes, bs, iou_thres, backend='auto'):
+    """
+    Suppresses the candidates of a batch with the registered backend 'backend' ('auto' picks one through
+    select_backend). Returns the indices of the kept boxes sorted by image, then by descending score.
+    """
+    try:
+        name = select_backend(boxes.device, bs) if backend == 'auto' else backend
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown NMS backend '{name}', available: {sorted(BACKENDS)}")
+        if name == 'torchvision' and torchvision is None:
+            raise ImportError("The torchvision NMS backend needs torchvision, use the 'numpy' backend instead")
+        i = BACKENDS[name](boxes, scores, images, classes.long(), bs, iou_thres)
+        i = i[scores[i].argsort(descending=True, stable=True)]
+        return i[images[i].argsort(stable=True)]
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def numpy_nms(boxes, scores, iou_thres):
+    """
+    Greedy NMS of one set of (n, 4) xyxy boxes, with IoUs computed as torchvision.ops.nms does. Returns the
+    indices of the kept boxes by descending score.
+    """
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while len(order):
+        i, order = order[0], order[1:]
+        keep.append(i)
+        w = np.clip(np.minimum(x2[i], x2[order]) - np.maximum(x1[i], x1[order]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[order]) - np.maximum(y1[i], y1[order]), 0, None)
+        inter = w * h
+        order = order[inter / (areas[i] + areas[order] - inter) <= iou_thres]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, groups, n, iou_thres, max_matrix=1 << 22, solver=None):
+    """
+    Greedy NMS of 'n' groups of boxes at once, e.g. the classes of every image of a batch, where 'groups' holds
+    the group index of every box. Boxes of different groups never suppress each other.
+
+    The boxes of every group are sorted by descending score into a padded (groups, M, 4) tensor and their
+    (groups, M, M) IoU matrices are computed as torchvision.ops.nms does. A box is kept when no kept box with a
+    higher score overlaps it by more than 'iou_thres', solved by iterating from all boxes kept until the kept set
+    no longer changes: the greedy result is the only fixed point, reached after as many iterations as the longest
+    chain of suppressions. Groups are padded together in increasing size, a chunk ending when padding would more
+    than double its IoU elements or take it past 'max_matrix'. A group with more boxes than fit goes through
+    torchvision.ops.nms on its own. 'solver' replaces the padded greedy NMS (padded_nms) of every chunk, e.g. by
+    fast_nms; it then also takes the groups that do not fit.
+
+    Returns the indices of the kept boxes.
+    """
+    counts = torch.bincount(groups, minlength=n)
+    order = scores.argsort(descending=True, stable=True)
+    order = order[groups[order].argsort(stable=True)]
+    order = order[counts[groups[order]].argsort(stable=True)]  # by group size, group and descending score
+    counts = counts[counts > 0].sort()[0].tolist()
+    keep, start, chunk, squares = [], 0, [], 0
+    for count in counts + [None]:
+        padded = count ** 2 * (len(chunk) + 1) if count is not None else 0
+        if chunk and (count is None or padded > max_matrix or padded > 2 * (squares + count ** 2) + 4096):
+            chunk_order = order[start - sum(chunk):start]
+            if solver is not None:
+                keep.append(chunk_order[solver(boxes[chunk_order], chunk, iou_thres)])
+            elif chunk[-1] ** 2 > max_matrix and torchvision is not None:
+                keep.append(chunk_order[torchvision.ops.nms(boxes[chunk_order], scores[chunk_order], iou_thres)])
+            else:
+                keep.append(chunk_order[padded_nms(boxes[chunk_order], chunk, iou_thres)])
+            chunk, squares = [], 0
+        if count is not None:
+            chunk.append(count)
+            squares += count ** 2
+            start += count
+    return torch.cat(keep) if keep else order[:0]
+
+
+def padded_overlaps(boxes, counts, iou_thres):
+    """
+    Pads consecutive groups of 'counts' boxes, each sorted by descending score, into one tensor. Returns the
+    (groups, M, M) matrices of which box overlaps which lower score box of its group by more than 'iou_thres', the
+    (groups, M) mask of the real boxes, and the group and rank of every box.
+    """
+    n, m = len(counts), max(counts)
+    counts = torch.tensor(counts, device=boxes.device)
+    groups = torch.repeat_interleave(torch.arange(n, device=boxes.device), counts)
+    rank = torch.arange(len(boxes), device=boxes.device) - (torch.cumsum(counts, 0) - counts)[groups]
+    padded = torch.zeros((n, m, 4), dtype=boxes.dtype, device=boxes.device)
+    padded[groups, rank] = boxes
+    valid = torch.arange(m, device=boxes.device)[None] < counts[:, None]
+
+    x1, y1, x2, y2 = padded.unbind(2)
+    areas = (x2 - x1) * (y2 - y1)
+    w = (torch.min(x2[:, :, None], x2[:, None]) - torch.max(x1[:, :, None], x1[:, None])).clamp(min=0)
+    h = (torch.min(y2[:, :, None], y2[:, None]) - torch.max(y1[:, :, None], y1[:, None])).clamp(min=0)
+    inter = w * h
+    overlaps = inter / (areas[:, :, None] + areas[:, None] - inter) > iou_thres
+    overlaps &= torch.ones((m, m), dtype=torch.bool, device=boxes.device).triu(1)  # by a higher score box
+    return overlaps, valid, groups, rank
+
+
+def padded_nms(boxes, counts, iou_thres):
+    """
+    Greedy NMS of consecutive groups of 'counts' boxes, each sorted by descending score, in one padded tensor.
+    Returns the indices of the kept boxes.
+    """
+    overlaps, valid, groups, rank = padded_overlaps(boxes, counts, iou_thres)
+    overlaps = overlaps.float()
+    kept = valid
+    while True:
+        suppressed = torch.bmm(kept.float()[:, None], overlaps)[:, 0] > 0
+        now = valid & ~suppressed
+        if torch.equal(now, kept):
+            break
+        kept = now
+    return torch.nonzero(kept[groups, rank], as_tuple=True)[0]
+
+
+def fast_nms(boxes, counts, iou_thres):
+    """
+    Fast NMS of consecutive groups of 'counts' boxes, each sorted by descending score: keeps the boxes no higher
+    score box of their group overlaps, see fast_backend for how far that is from greedy NMS. Returns the indices
+    of the kept boxes.
+    """
+    overlaps, valid, groups, rank = padded_overlaps(boxes, counts, iou_thres)
+    kept = valid & ~overlaps.any(1)
+    return torch.nonzero(kept[groups, rank], as_tuple=True)[0]
@@ -0,0 +1,82 @@
+from typing import List
+import torch
+import torch.nn as nn
+import torchvision
+from src.constants import CONF_THRES, IOU_THRES
+
+
+class DetectPostprocess(nn.Module):
+    """
+    Output convolutions of a (fused) Detect/IDetect head, box decoding, confidence filter and NMS as one module,
+    meant to be scripted with torch.jit.script.
+
+    Detect decodes every anchor of every cell into a dense (B, N, 5 + classes) prediction that non_max_suppression
+    then mostly discards. Here only the objectness channel is activated and thresholded; the boxes and class scores
+    are decoded for the surviving anchors only, and suppressed per image as non_max_suppression does with its
+    defaults (best class only). forward() takes the feature maps the traced backbone hands to the head and the
+    confidence and NMS IoU thresholds, and returns the (n, 6) [x1, y1, x2, y2, conf, cls] detections of every
+    image, with the model's class IDs for a head pruned to some classes.
+    """
+
+    def __init__(self, detect, max_det=300, max_nms=30000):
+        super(DetectPostprocess, self).__init__()
+        self.m = detect.m  # shared with the head, IDetect has its implicit layers fused into them
+        self.nl, self.na, self.no, self.nc = detect.nl, detect.na, detect.no, detect.nc
+        self.strides: List[float] = [float(s) for s in detect.stride]
+        self.register_buffer('anchor_wh', detect.anchor_grid.detach().clone().view(detect.nl, detect.na, 2))
+        class_ids = getattr(detect, 'class_ids', None)  # set on a head pruned to some classes
+        self.one_class = detect.nc == 1 and class_ids is None  # one class model, its class confidence is constant
+        self.register_buffer('class_ids', class_ids.clone() if class_ids is not None
+                             else torch.arange(detect.nc, device=detect.anchor_grid.device))
+        self.max_det = max_det
+        self.max_nms = max_nms  # maximum number of boxes per image into NMS, as in non_max_suppression
+        self.max_wh = 4096.  # class offset of the boxes, as in non_max_suppression
+
+    def forward(self, features: List[torch.Tensor], conf_thres: float = CONF_THRES,
+                iou_thres: float = IOU_THRES) -> List[torch.Tensor]:
+        bs = features[0].shape[0]
+        rows: List[torch.Tensor] = []
+        images: List[torch.Tensor] = []
+        for i, conv in enumerate(self.m):
+            x = conv(features[i])
+            ny, nx = x.shape[2], x.shape[3]
+            x = x.view(bs, self.na, self.no, ny, nx)
+            b, a, gy, gx = (x[:, :, 4].sigmoid() > conf_thres).nonzero().unbind(1)  # candidates
+            y = x[b, a, :, gy, gx].sigmoid()
+            grid = torch.stack((gx, gy), 1).float()
+            xy = ((y[:, 0:2] * 2. - 0.5 + grid) * self.strides[i]).to(y.dtype)
+            wh = (y[:, 2:4] * 2) ** 2 * self.anchor_wh[i][a]
+            rows.append(torch.cat((xy, wh, y[:, 4:]), 1))
+            images.append(b)
+        x = torch.cat(rows)
+        b = torch.cat(images)
+        order = torch.argsort(b, stable=True)  # by image, in the anchor order of the dense prediction
+        x, b = x[order], b[order]
+
+        if self.one_class:
+            scores = x[:, 4:5]
+        else:
+            scores = x[:, 5:] * x[:, 4:5]  # conf = obj_conf * cls_conf
+        conf, j = scores.max(1)
+        keep = conf > conf_thres
+        x, conf, j, b = x[keep], conf[keep], j[keep], b[keep]
+        box = torch.stack((x[:, 0] - x[:, 2] / 2, x[:, 1] - x[:, 3] / 2,
+                           x[:, 0] + x[:, 2] / 2, x[:, 1] + x[:, 3] / 2), 1)  # xywh to xyxy
+        det = torch.cat((box, conf[:, None], self.class_ids[j][:, None].to(box.dtype)), 1)
+        boxes = box.float() + j[:, None].float() * self.max_wh  # boxes (offset by class), FP16 cannot hold the offsets
+
+        output: List[torch.Tensor] = []
+        counts: List[int] = torch.bincount(b, minlength=bs).tolist()
+        start = 0
+        for count in counts:
+            if count:
+                boxes_i, conf_i, det_i = boxes[start:start + count], conf[start:start + count], det[start:start + count]
+                if count > self.max_nms:  # excess boxes, keep the most confident ones
+                    top = conf_i.argsort(descending=True)[:self.max_nms]
+                    boxes_i, conf_i, det_i = boxes_i[top], conf_i[top], det_i[top]
+                kept = torchvision.ops.nms(boxes_i, conf_i.float(), iou_thres)
+                output.append(det_i[kept[:self.max_det]])
+            else:
+                output.append(torch.zeros((0, 6), dtype=det.dtype, device=x.device))
+            start += count
+        return output
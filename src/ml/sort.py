@@ -1,149 +1,133 @@
+import os
 import sys
+import time
 import numpy as np
 from src.utils import iou_batch
-from src.logger import logging
-from filterpy.kalman import KalmanFilter
+from src.logger import get_logger
+from src.constants import TRACK_HISTORY_LEN, GATED_ASSOCIATION_MIN_PAIRS, GATED_ASSOCIATION_EXACT_MAX_PAIRS, \
+    ASSIGNMENT_SOLVER, APPEARANCE_WEIGHT, APPEARANCE_MAX_DISTANCE, APPEARANCE_CENTER_GATE
+from src.ml.kalman_bank import KalmanBank
+from src.ml.track_history import TrackHistory
+from src.ml.assignment import linear_assignment, AssignmentStats
+from src.ml.spatial_grid import overlapping_pairs, pair_iou, bipartite_components
 from src.exception import CustomException
 
-
-def linear_assignment(cost_matrix):
-    try:
-        import lap  # linear assignment problem solver
-        _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
-        return np.array([[y[i], i] for i in x if i >= 0])
-    except ImportError:
-        from scipy.optimize import linear_sum_assignment
-        x, y = linear_sum_assignment(cost_matrix)
-        return np.array(list(zip(x, y)))
-
-
-def convert_bbox_to_z(bbox):
-    try:
-        logging.info("Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form [x,y,s,r] where x,y is the center of the box and s is the scale/area and r is the aspect ratio")
-        w = bbox[2] - bbox[0]
-        h = bbox[3] - bbox[1]
-        x = bbox[0] + w/2.
-        y = bbox[1] + h/2.
-        s = w * h
-        # scale is just area
-        r = w / float(h)
-        return np.array([x, y, s, r]).reshape((4, 1))
-    except Exception as e:
-        raise CustomException(e, sys) from e
-
-
-def convert_x_to_bbox(x, score=None):
-    try:
-        """Takes a bounding box in the centre form [x,y,s,r] and returns it in the form
-            [x1,y1,x2,y2] where x1,y1 is the top left and x2,y2 is the bottom right"""
-        w = np.sqrt(x[2] * x[3])
-        h = x[2] / w
-        if(score==None):
-            return np.array([x[0]-w/2., x[1]-h/2., x[0]+w/2., x[1]+h/2.]).reshape((1, 4))
-        else:
-            return np.array([x[0]-w/2., x[1]-h/2., x[0]+w/2., x[1]+h/2., score]).reshape((1, 5))
-    except Exception as e:
-        raise CustomException(e, sys) from e
+logger = get_logger(__name__)
 
 
 class KalmanBoxTracker(object):
-    logging.info("This class represents the internal state of individual tracked objects observed as bbox.")
+    logger.debug("This class represents the internal state of individual tracked objects observed as bbox.")
     count = 0
 
-    def __init__(self, bbox):
+    def __init__(self, bbox, bank=None, slot=None, history_len=TRACK_HISTORY_LEN, track_id=None):
         """
         Initialize a tracker using initial bounding box
 
         Parameter 'bbox' must have 'detected class' int number at the -1 position.
+
+        The filter state lives in slot 'slot' of the KalmanBank 'bank'. When no bank is given the tracker
+        claims a slot of a private single track bank. Only the last 'history_len' centroids, boxes and
+        predictions are kept. Without a 'track_id' the ID comes from the process wide KalmanBoxTracker.count.
         """
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array(
-            [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
-             [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]])
-        self.kf.H = np.array(
-            [[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0], [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]])
-
-        self.kf.R[2:,
-        2:] *= 10.  # R: Covariance matrix of measurement noise (set to high for noisy inputs -> more 'inertia' of boxes')
-        self.kf.P[4:, 4:] *= 1000.  # give high uncertainty to the unobservable initial velocities
-        self.kf.P *= 10.
-        self.kf.Q[-1, -1] *= 0.5  # Q: Covariance matrix of process noise (set to high for erratically moving things)
-        self.kf.Q[4:, 4:] *= 0.5
-
-        self.kf.x[:4] = convert_bbox_to_z(bbox)  # STATE VECTOR
-        self.time_since_update = 0
-        self.id = KalmanBoxTracker.count
-        KalmanBoxTracker.count += 1
-        self.history = []
-        self.hits = 0
-        self.hit_streak = 0
-        self.age = 0
-        self.centroidarr = []
+        if bank is None:
+            bank = KalmanBank(capacity=1)
+        if slot is None:
+            slot = bank.allocate(np.asarray(bbox, dtype=float).reshape(1, -1))[0]
+        self.bank = bank
+        self.slot = slot
+
+        if track_id is None:
+            track_id = KalmanBoxTracker.count
+            KalmanBoxTracker.count += 1
+        self.id = track_id
+        # bounded histories: predictions since the last update, centroids and observed boxes
+        self.history = TrackHistory(history_len, 4)
+        self._centroids = TrackHistory(history_len, 2)
+        self._bboxes = TrackHistory(history_len, 6)
         CX = (bbox[0] + bbox[2]) // 2
         CY = (bbox[1] + bbox[3]) // 2
-        self.centroidarr.append((CX, CY))
-
-        # keep yolov5 detected class information
-        self.detclass = bbox[5]
+        self._centroids.append((CX, CY))
 
         # If we want to store bbox
-        self.bbox_history = [bbox]
+        self._bboxes.append(bbox)
+
+    @property
+    def centroidarr(self):
+        return self._centroids.last()
+
+    @property
+    def bbox_history(self):
+        return self._bboxes.last()
+
+    def last_centroids(self, k=None):
+        """
+        Returns a zero-copy (k, 2) view of the last k [CX, CY] centroids, oldest first
+        """
+        return self._centroids.last(k)
+
+    def last_boxes(self, k=None):
+        """
+        Returns a zero-copy (k, 6) view of the last k observed [x1,y1,x2,y2,score,detclass] boxes, oldest first
+        """
+        return self._bboxes.last(k)
+
+    @property
+    def time_since_update(self):
+        return int(self.bank.time_since_update[self.slot])
+
+    @property
+    def hits(self):
+        return int(self.bank.hits[self.slot])
+
+    @property
+    def hit_streak(self):
+        return int(self.bank.hit_streak[self.slot])
+
+    @property
+    def age(self):
+        return int(self.bank.age[self.slot])
+
+    @property
+    def detclass(self):
+        # keep yolov5 detected class information
+        return self.bank.detclass[self.slot]
 
     def update(self, bbox):
         """
         Updates the state vector with observed bbox
         """
-        self.time_since_update = 0
-        self.history = []
-        self.hits += 1
-        self.hit_streak += 1
-        self.kf.update(convert_bbox_to_z(bbox))
-        self.detclass = bbox[5]
+        self.bank.update(np.array([self.slot]), np.asarray(bbox, dtype=float).reshape(1, -1))
+        self.record_update(bbox)
+
+    def record_update(self, bbox):
+        """
+        Appends an observed bbox to the track history once the bank has been updated
+        """
+        self.history.clear()
         CX = (bbox[0] + bbox[2]) // 2
         CY = (bbox[1] + bbox[3]) // 2
-        self.centroidarr.append((CX, CY))
-        self.bbox_history.append(bbox)
+        self._centroids.append((CX, CY))
+        self._bboxes.append(bbox)
 
     def predict(self):
         """
         Advances the state vector and returns the predicted bounding box estimate
         """
-        if ((self.kf.x[6] + self.kf.x[2]) <= 0):
-            self.kf.x[6] *= 0.0
-        self.kf.predict()
-        self.age += 1
-        if (self.time_since_update > 0):
-            self.hit_streak = 0
-        self.time_since_update += 1
-        self.history.append(convert_x_to_bbox(self.kf.x))
-        # bbox=self.history[-1]
-        # CX = (bbox[0]+bbox[2])/2
-        # CY = (bbox[1]+bbox[3])/2
-        # self.centroidarr.append((CX,CY))
-
-        return self.history[-1]
+        pos = self.bank.predict(np.array([self.slot]))
+        self.history.append(pos)
+        return pos
 
     def get_state(self):
         """
-        Returns the current bounding box estimate
-        # test
-        arr1 = np.array([[1,2,3,4]])
-        arr2 = np.array([0])
-        arr3 = np.expand_dims(arr2, 0)
-        np.concatenate((arr1,arr3), axis=1)
+        Returns the current bounding box estimate as [[x1,y1,x2,y2,detclass,u_dot,v_dot,s_dot]]
         """
-        arr_detclass = np.expand_dims(np.array([self.detclass]), 0)
-
-        arr_u_dot = np.expand_dims(self.kf.x[4], 0)
-        arr_v_dot = np.expand_dims(self.kf.x[5], 0)
-        arr_s_dot = np.expand_dims(self.kf.x[6], 0)
-
-        return np.concatenate((convert_x_to_bbox(self.kf.x), arr_detclass, arr_u_dot, arr_v_dot, arr_s_dot), axis=1)
+        return self.bank.get_state(np.array([self.slot]))
 
 
-def associate_detections_to_trackers(detections, trackers, iou_threshold = 0.3):
+def associate_detections_to_trackers(detections, trackers, iou_threshold = 0.3, solver='auto', stats=None):
     """
     Assigns detections to tracked object (both represented as bounding boxes)
+    'solver' names the assignment solver (see src.ml.assignment), 'stats' is an optional AssignmentStats
     Returns 3 lists of 
     1. matches,
     2. unmatched_detections
@@ -155,62 +139,217 @@ def associate_detections_to_trackers(detections, trackers, iou_threshold = 0.3):
     iou_matrix = iou_batch(detections, trackers)
     
     if min(iou_matrix.shape) > 0:
+        t = time.perf_counter()
         a = (iou_matrix > iou_threshold).astype(np.int32)
         if a.sum(1).max() == 1 and a.sum(0).max() ==1:
             matched_indices = np.stack(np.where(a), axis=1)
+            if stats is not None:
+                stats.record('fast_path', time.perf_counter() - t, iou_matrix.shape)
         else:
-            matched_indices = linear_assignment(-iou_matrix)
+            matched_indices = linear_assignment(-iou_matrix, solver=solver, stats=stats)
     else:
         matched_indices = np.empty(shape=(0,2))
     
-    unmatched_detections = []
-    for d, det in enumerate(detections):
-        if(d not in matched_indices[:,0]):
-            unmatched_detections.append(d)
-    
-    unmatched_trackers = []
-    for t, trk in enumerate(trackers):
-        if(t not in matched_indices[:,1]):
-            unmatched_trackers.append(t)
-    
+    matched_indices = matched_indices.astype(int)
+    det_matched = np.zeros(len(detections), dtype=bool)
+    det_matched[matched_indices[:, 0]] = True
+    trk_matched = np.zeros(len(trackers), dtype=bool)
+    trk_matched[matched_indices[:, 1]] = True
+
     #filter out matched with low IOU
-    matches = []
-    for m in matched_indices:
-        if(iou_matrix[m[0], m[1]]<iou_threshold):
-            unmatched_detections.append(m[0])
-            unmatched_trackers.append(m[1])
-        else:
-            matches.append(m.reshape(1,2))
-    
-    if (len(matches)==0):
-        matches = np.empty((0,2), dtype=int)
+    low_iou = iou_matrix[matched_indices[:, 0], matched_indices[:, 1]] < iou_threshold
+    unmatched_detections = np.concatenate((np.where(~det_matched)[0], matched_indices[low_iou, 0]))
+    unmatched_trackers = np.concatenate((np.where(~trk_matched)[0], matched_indices[low_iou, 1]))
+    matches = matched_indices[~low_iou].reshape(-1, 2)
+
+    return matches, unmatched_detections, unmatched_trackers
+
+
+def associate_detections_to_trackers_gated(detections, trackers, iou_threshold = 0.3, solver='auto', stats=None,
+                                           exact_max_pairs=GATED_ASSOCIATION_EXACT_MAX_PAIRS):
+    """
+    Sparse variant of associate_detections_to_trackers for dense scenes
+
+    Candidate (detection, tracker) pairs are the ones with overlapping boxes, found through a uniform grid
+    index instead of the full N x M IoU matrix. The sparse cost graph is split into connected components and
+    one small assignment is solved per component; single-pair components are matched directly.
+
+    Zero IoU pairs can never pass a positive iou_threshold, so for iou_threshold > 0 the gating is lossless and
+    the matches are as good as the dense path's. They are identical to it except between exact ties of equal
+    cost assignments, which a solve per component can break differently than one solve of the full matrix.
+    Unmatched detections and trackers come in the dense path's order, see dense_unmatched_order. When that order
+    depends on which non overlapping detections the dense solve pairs at zero cost, the frame is associated
+    densely instead, as long as it has at most 'exact_max_pairs' detection x tracker pairs.
+    """
+    n, m = len(detections), len(trackers)
+    if m == 0:
+        return np.empty((0,2),dtype=int), np.arange(n), np.empty((0,5),dtype=int)
+
+    d_idx, t_idx = overlapping_pairs(detections[:, :4], trackers[:, :4])
+    iou = pair_iou(detections[d_idx, :4], trackers[t_idx, :4])
+
+    # same one-to-one fast path as the dense matrix
+    t = time.perf_counter()
+    above = iou > iou_threshold
+    if above.any() and np.bincount(d_idx[above]).max() == 1 and np.bincount(t_idx[above]).max() == 1:
+        matches = np.stack((d_idx[above], t_idx[above]), axis=1)
+        if stats is not None:
+            stats.record('fast_path', time.perf_counter() - t, (n, m))
     else:
-        matches = np.concatenate(matches, axis=0)
-        
-    return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
-    
+        d_label, t_label = bipartite_components(d_idx, t_idx, n, m)
+        edge_label = d_label[d_idx]
+        edges_per_component = np.bincount(edge_label, minlength=n + m)
+        single = edges_per_component[edge_label] == 1
+        matched = [np.stack((d_idx[single], t_idx[single]), axis=1)]
+
+        multi = ~single
+        if multi.any():
+            order = np.argsort(edge_label[multi], kind='stable')
+            comp_d, comp_t, comp_iou = d_idx[multi][order], t_idx[multi][order], iou[multi][order]
+            bounds = np.flatnonzero(np.diff(edge_label[multi][order])) + 1
+            for cd, ct, ciou in zip(np.split(comp_d, bounds), np.split(comp_t, bounds), np.split(comp_iou, bounds)):
+                rows, r = np.unique(cd, return_inverse=True)
+                cols, c = np.unique(ct, return_inverse=True)
+                if len(rows) == 1 or len(cols) == 1:
+                    best = np.argmax(ciou)
+                    matched.append(np.array([[cd[best], ct[best]]]))
+                    continue
+                cost = np.zeros((len(rows), len(cols)))
+                cost[r, c] = -ciou
+                assigned = linear_assignment(cost, solver=solver, stats=stats)
+                matched.append(np.stack((rows[assigned[:, 0]], cols[assigned[:, 1]]), axis=1))
+
+        matches = np.concatenate(matched)
+    matches = matches[np.argsort(matches[:, 0], kind='stable')]
+
+    # assignments can still pick zero or low IoU pairs inside a component
+    match_iou = pair_iou(detections[matches[:, 0], :4], trackers[matches[:, 1], :4])
+    rejected = matches[(match_iou > 0) & (match_iou < iou_threshold)]
+    matches = matches[match_iou >= iou_threshold]
+    if n > m and len(matches) + len(rejected) < m and n * m <= exact_max_pairs:
+        return associate_detections_to_trackers(detections, trackers, iou_threshold, solver=solver, stats=stats)
+    unmatched_detections, unmatched_trackers = dense_unmatched_order(matches, rejected, n, m)
+    return matches, unmatched_detections, unmatched_trackers
+
+
+def dense_unmatched_order(matches, rejected, n, m):
+    """
+    Orders the unmatched detections and trackers of a sparse association the way associate_detections_to_trackers
+    does, so Sort starts new tracks, and gives them IDs, in the same order on either path.
+
+    The dense solve assigns min(n, m) pairs and lists the rows (columns) it never assigned first, in ascending
+    order, then the assigned pairs rejected for low IoU, in row order. 'matches' and 'rejected' are the accepted
+    and the low but non zero IoU pairs, sorted by detection. On the side with more boxes than the other can take,
+    the dense solve also pairs boxes with no overlap at zero cost to fill the other side, an exact tie it breaks
+    arbitrarily; those boxes are counted as never assigned here.
+    """
+    det_matched = np.zeros(n, dtype=bool)
+    det_matched[matches[:, 0]] = True
+    trk_matched = np.zeros(m, dtype=bool)
+    trk_matched[matches[:, 1]] = True
+    if n <= m:  # every detection is assigned, the rejected ones come in row order
+        unmatched_detections = np.where(~det_matched)[0]
+    else:
+        det_rejected = det_matched.copy()
+        det_rejected[rejected[:, 0]] = True
+        unmatched_detections = np.concatenate((np.where(~det_rejected)[0], rejected[:, 0]))
+    if m <= n and len(rejected) == m - len(matches):  # every tracker is assigned, in the row order of its pair
+        unmatched_trackers = rejected[:, 1]
+    else:
+        trk_rejected = trk_matched.copy()
+        trk_rejected[rejected[:, 1]] = True
+        unmatched_trackers = np.concatenate((np.where(~trk_rejected)[0], rejected[:, 1]))
+    return unmatched_detections, unmatched_trackers
+
+
+def associate_detections_to_trackers_appearance(detections, trackers, appearance_distance, iou_threshold = 0.3,
+                                                appearance_weight=APPEARANCE_WEIGHT,
+                                                max_distance=APPEARANCE_MAX_DISTANCE,
+                                                center_gate=APPEARANCE_CENTER_GATE, solver='auto', stats=None):
+    """
+    Appearance aware variant of associate_detections_to_trackers
+
+    'appearance_distance' is the (detections, trackers) cosine distance matrix from an EmbeddingGallery. The
+    assignment cost is appearance_weight * cosine distance + (1 - appearance_weight) * (1 - IoU). A pair may match
+    when its IoU reaches iou_threshold, or when it is nearby and its cosine distance is within max_distance, so a
+    track whose predicted box drifted off its object during an occlusion is still re-identified by appearance.
+    Nearby pairs overlap or have their centres within 'center_gate' diagonals of the predicted box of the track:
+    appearance alone never matches a detection to a track across the frame.
+    """
+    n, m = len(detections), len(trackers)
+    if m == 0 or n == 0:
+        return np.empty((0,2),dtype=int), np.arange(n), np.arange(m)
+
+    iou_matrix = iou_batch(detections, trackers)
+    det_centers = (detections[:, :2] + detections[:, 2:4]) / 2.
+    trk_centers = (trackers[:, :2] + trackers[:, 2:4]) / 2.
+    trk_diagonals = np.hypot(trackers[:, 2] - trackers[:, 0], trackers[:, 3] - trackers[:, 1])
+    center_distance = np.linalg.norm(det_centers[:, None] - trk_centers[None], axis=2)
+    nearby = (iou_matrix > 0) | (center_distance <= center_gate * trk_diagonals[None])
+    feasible = (iou_matrix >= iou_threshold) | (nearby & (appearance_distance <= max_distance))
+    cost = appearance_weight * appearance_distance + (1. - appearance_weight) * (1. - iou_matrix)
+    cost[~feasible] = 1e5
+    matched_indices = linear_assignment(cost, solver=solver, stats=stats)
+    matches = matched_indices[feasible[matched_indices[:, 0], matched_indices[:, 1]]].reshape(-1, 2)
+
+    det_matched = np.zeros(n, dtype=bool)
+    det_matched[matches[:, 0]] = True
+    trk_matched = np.zeros(m, dtype=bool)
+    trk_matched[matches[:, 1]] = True
+    return matches, np.where(~det_matched)[0], np.where(~trk_matched)[0]
+
 
 class Sort(object):
 
-    def __init__(self, max_age=5, min_hits=2, iou_threshold=0.2):
+    def __init__(self, max_age=5, min_hits=2, iou_threshold=0.2, history_len=TRACK_HISTORY_LEN,
+                 gated_association=None, solver=ASSIGNMENT_SOLVER, bank=None, gallery=None,
+                 appearance_weight=APPEARANCE_WEIGHT, max_appearance_distance=APPEARANCE_MAX_DISTANCE,
+                 appearance_center_gate=APPEARANCE_CENTER_GATE):
         """
         Parameters for SORT
+
+        'gated_association' - True/False forces the sparse/dense association, None switches to the sparse one once
+        detections x trackers reaches GATED_ASSOCIATION_MIN_PAIRS
+        'solver' - assignment solver name from src.ml.assignment.SOLVERS, or 'auto' to pick one per frame.
+        Every run is recorded in self.assignment_stats
+        'bank' - KalmanBank holding the filter states, several trackers (streams) can share one. Track IDs are
+        allocated per Sort instance either way
+        'gallery' - EmbeddingGallery indexed by bank slot. With a gallery, frames passed to update() with detection
+        embeddings are associated on fused appearance and IoU cost (see associate_detections_to_trackers_appearance)
+        'max_appearance_distance', 'appearance_center_gate' - how close in appearance, and how near, a pair below the
+        IoU threshold must be to match on appearance
         """
 
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
+        self.history_len = history_len
+        self.gated_association = gated_association
+        self.solver = solver
+        self.assignment_stats = AssignmentStats()
         self.trackers = []
         self.frame_count = 0
+        self.predicted_frames = 0
+        self.next_id = 0
+        self.bank = KalmanBank() if bank is None else bank
+        self.gallery = gallery
+        self.appearance_weight = appearance_weight
+        self.max_appearance_distance = max_appearance_distance
+        self.appearance_center_gate = appearance_center_gate
 
     def getTrackers(self,):
         return self.trackers
 
-    def update(self, dets=np.empty((0, 6))):
+    def _slots(self):
+        return np.fromiter((trk.slot for trk in self.trackers), dtype=np.int64, count=len(self.trackers))
+
+    def update(self, dets=np.empty((0, 6)), dt=1.0, embeddings=None):
         """
         Parameters: 
 
         'dets' - a numpy array of detection in the format [[x1, y1, x2, y2, score], [x1, y1, x2, y2, score],...]
+        'dt' - time since the previous frame, in frame intervals
+        'embeddings' - optional (len(dets), dim) appearance embeddings, used when the tracker has a gallery
 
         Ensure to call this method even frame has no detections. (pass np.empty((0, 5)))
 
@@ -219,45 +358,232 @@ class Sort(object):
         NOTE: The number of objects returned may differ from the number of objects provided.
         """
         try:
-            self.frame_count += 1
-
-            # Get predicted locations from existing trackers
-
-            trks = np.zeros((len(self.trackers), 6))
-            to_del = []
-            ret = []
-
-            for t, trk in enumerate(trks):
-                pos = self.trackers[t].predict()[0]
-                trk[:] = [pos[0], pos[1], pos[2], pos[3], 0, 0]
-                if np.any(np.isnan(pos)):
-                    to_del.append(t)
-            trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
-            for t in reversed(to_del):
-                self.trackers.pop(t)
-            matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold)
-            
+            # Get predicted locations from existing trackers, all filters advance in one batched step
+            slots = self._slots()
+            pos = self.bank.predict(slots, dt=dt)
+            slots, trks = self._begin_frame(slots, pos)
+            if embeddings is not None and self.gallery is not None:
+                self.gallery.reserve(self.bank.capacity)
+                matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers_appearance(
+                    dets, trks, self.gallery.distance(embeddings, slots), self.iou_threshold,
+                    self.appearance_weight, self.max_appearance_distance, self.appearance_center_gate,
+                    solver=self.solver, stats=self.assignment_stats)
+            else:
+                matched, unmatched_dets, unmatched_trks = self._associate(dets, trks, self.assignment_stats)
+
             # Update matched trackers with assigned detections
-            for m in matched:
-                self.trackers[m[1]].update(dets[m[0], :])
-                
-            # Create and initialize new trackers for unmatched detections
-            for i in unmatched_dets:
-                trk = KalmanBoxTracker(np.hstack((dets[i,:], np.array([0]))))
-                #trk = KalmanBoxTracker(np.hstack(dets[i,:])
+            if len(matched):
+                self.bank.update(slots[matched[:, 1]], dets[matched[:, 0], :])
+            return self._end_frame(dets, matched, unmatched_dets, embeddings)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def _associate(self, dets, trks, stats):
+        """
+        IoU association of one frame, dense or sparse as 'gated_association' asks, runs recorded in 'stats'
+        """
+        gated = self.gated_association
+        if gated is None:
+            gated = len(dets) * len(trks) >= GATED_ASSOCIATION_MIN_PAIRS
+        associate = associate_detections_to_trackers_gated if gated else associate_detections_to_trackers
+        return associate(dets, trks, self.iou_threshold, solver=self.solver, stats=stats)
+
+    def _begin_frame(self, slots, pos):
+        """
+        First half of update() once the bank has predicted 'pos' for 'slots': records the predictions and drops
+        trackers whose prediction is invalid. Returns the surviving slots and their [x1,y1,x2,y2,0,0] rows.
+        """
+        self.frame_count += 1
+        self.predicted_frames = 0
+        for t, trk in enumerate(self.trackers):
+            trk.history.append(pos[t])
+        trks = np.zeros((len(self.trackers), 6))
+        trks[:, :4] = pos
+        invalid = np.isnan(pos).any(axis=1)
+        if invalid.any():
+            self.bank.release(slots[invalid])
+            self.trackers = [trk for trk, bad in zip(self.trackers, invalid) if not bad]
+            slots = slots[~invalid]
+            trks = trks[~invalid]
+        return slots, trks
+
+    def _end_frame(self, dets, matched, unmatched_dets, embeddings=None):
+        """
+        Second half of update() once the bank has been updated with the matched detections: records the matches
+        (and their embeddings), starts trackers for unmatched detections, reports confirmed tracks and prunes
+        dead ones
+        """
+        for m in matched:
+            self.trackers[m[1]].record_update(dets[m[0], :])
+        record_embeddings = embeddings is not None and self.gallery is not None
+        if record_embeddings and len(matched):
+            self.gallery.add(self._slots()[matched[:, 1]], embeddings[matched[:, 0]])
+
+        # Create and initialize new trackers for unmatched detections
+        if len(unmatched_dets):
+            new_dets = np.hstack((dets[unmatched_dets, :], np.zeros((len(unmatched_dets), 1))))
+            new_slots = self.bank.allocate(new_dets)
+            for bbox, slot in zip(new_dets, new_slots):
+                self.trackers.append(KalmanBoxTracker(bbox, bank=self.bank, slot=slot,
+                                                      history_len=self.history_len, track_id=self.next_id))
+                self.next_id += 1
+            if self.gallery is not None:
+                self.gallery.reserve(self.bank.capacity)
+                self.gallery.reset(new_slots, embeddings[unmatched_dets] if record_embeddings else None)
+
+        # Report and prune in the same (reversed) order the per-tracker loop used to
+        slots = self._slots()[::-1]
+        report = self._reported(slots)
+        dead = self.bank.time_since_update[slots] > self.max_age
+        ret = self._report(slots, report)
+        if dead.any():
+            self.bank.release(slots[dead])
+            keep = ~dead[::-1]
+            self.trackers = [trk for trk, alive in zip(self.trackers, keep) if alive]
+        if len(ret) > 0:
+            return ret
+        return np.empty((0,6))
+
+    def release(self):
+        """
+        Drops every track and hands its bank slots back, e.g. when a stream sharing a bank goes away
+        """
+        self.bank.release(self._slots())
+        self.trackers = []
+
+    def state_dict(self):
+        """
+        Returns the full tracker state as a dict of arrays: the filter states, covariances and counters of every
+        track, the track IDs and bounded histories, the frame counters and the ID allocator, plus the appearance
+        galleries when the tracker has one
+        """
+        slots = self._slots()
+        state = {'bank_' + name: arr for name, arr in self.bank.state_dict(slots).items()}
+        state['params'] = np.array([self.max_age, self.min_hits, self.iou_threshold, self.history_len], dtype=float)
+        state['counters'] = np.array([self.frame_count, self.predicted_frames, self.next_id], dtype=np.int64)
+        state['ids'] = np.array([trk.id for trk in self.trackers], dtype=np.int64)
+        # ragged histories are stored concatenated, with one length per track
+        for key, name, dim in (('history', 'history', 4), ('centroids', '_centroids', 2), ('bboxes', '_bboxes', 6)):
+            records = [getattr(trk, name).last() for trk in self.trackers]
+            state[key + '_lengths'] = np.array([len(r) for r in records], dtype=np.int64)
+            state[key] = np.concatenate(records) if records else np.empty((0, dim))
+        if self.gallery is not None:
+            state['gallery_embeddings'] = self.gallery.embeddings[slots]
+            state['gallery_count'] = self.gallery.count[slots]
+            state['gallery_head'] = self.gallery.head[slots]
+        return state
+
+    def load_state_dict(self, state):
+        """
+        Replaces the tracker state with one from state_dict(). The tracks get new bank slots but keep their IDs,
+        so tracking continues exactly where the saved tracker stopped.
+        """
+        try:
+            self.release()
+            max_age, min_hits, self.iou_threshold, history_len = state['params']
+            self.max_age, self.min_hits, self.history_len = int(max_age), int(min_hits), int(history_len)
+            self.frame_count, self.predicted_frames, self.next_id = (int(c) for c in state['counters'])
+            slots = self.bank.restore({name: state['bank_' + name] for name in self.bank.slot_fields})
+
+            histories = {}
+            for key in ('history', 'centroids', 'bboxes'):
+                bounds = np.cumsum(state[key + '_lengths'])[:-1]
+                histories[key] = np.split(state[key], bounds) if len(slots) else []
+            for i, (slot, track_id) in enumerate(zip(slots, state['ids'])):
+                trk = KalmanBoxTracker(histories['bboxes'][i][-1], bank=self.bank, slot=slot,
+                                       history_len=self.history_len, track_id=int(track_id))
+                trk.history.load(histories['history'][i])
+                trk._centroids.load(histories['centroids'][i])
+                trk._bboxes.load(histories['bboxes'][i])
                 self.trackers.append(trk)
-            
-            i = len(self.trackers)
-            for trk in reversed(self.trackers):
-                d = trk.get_state()[0]
-                if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
-                    ret.append(np.concatenate((d, [trk.id+1])).reshape(1,-1)) #+1'd because MOT benchmark requires positive value
-                i -= 1
-                #remove dead tracklet
-                if(trk.time_since_update >self.max_age):
-                    self.trackers.pop(i)
-            if(len(ret) > 0):
-                return np.concatenate(ret)
-            return np.empty((0,6))
+
+            if self.gallery is not None:
+                self.gallery.reserve(self.bank.capacity)
+                if 'gallery_embeddings' in state:
+                    self.gallery.embeddings[slots] = state['gallery_embeddings']
+                    self.gallery.count[slots] = state['gallery_count']
+                    self.gallery.head[slots] = state['gallery_head']
+                else:
+                    self.gallery.reset(slots)
         except Exception as e:
-            raise CustomException(e, sys) from e
\ No newline at end of file
+            raise CustomException(e, sys) from e
+
+    def save_snapshot(self, path, **extra):
+        """
+        Writes state_dict(), plus any 'extra' arrays (e.g. the frame number), to the uncompressed .npz file 'path'.
+        The file is written next to 'path' first and then renamed, so a job dying mid-write leaves the previous
+        snapshot intact.
+        """
+        try:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **self.state_dict(), **{'extra_' + k: np.asarray(v) for k, v in extra.items()})
+            os.replace(tmp_path, path)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def load_snapshot(self, path):
+        """
+        Restores a snapshot written by save_snapshot() and returns its 'extra' arrays as a dict
+        """
+        try:
+            with np.load(path) as data:
+                state = {k: data[k] for k in data.files}
+            self.load_state_dict(state)
+            return {k[len('extra_'):]: v for k, v in state.items() if k.startswith('extra_')}
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def _reported(self, slots):
+        """
+        Mask of the slots whose tracks are confirmed and were matched on the last update
+        """
+        return (self.bank.time_since_update[slots] < 1) & (
+                (self.bank.hit_streak[slots] >= self.min_hits) | (self.frame_count <= self.min_hits))
+
+    def _report(self, slots, mask):
+        """
+        Output rows [x1,y1,x2,y2,detclass,u_dot,v_dot,s_dot,id] of the masked slots, in reversed tracker order
+        """
+        if not mask.any():
+            return np.empty((0, 9))
+        ids = np.fromiter((trk.id for trk in reversed(self.trackers)), dtype=float, count=len(slots))
+        return np.concatenate((self.bank.get_state(slots[mask]), ids[mask, None] + 1), axis=1)  # +1'd because MOT benchmark requires positive value
+
+    def predict(self, dt=1.0):
+        """
+        Prediction-only step for frames the detector skipped
+
+        Advances every filter by 'dt' frame intervals without touching the age/hit counters, so skipped frames do
+        not count as missed detections, and returns the tracks the last update reported at their predicted
+        positions, in the same format as update(). The caller knows these rows are predicted, not observed.
+        """
+        try:
+            slots = self._slots()
+            pos = self.bank.predict(slots, dt=dt, bookkeeping=False)
+            return self._end_prediction(slots, pos)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def _end_prediction(self, slots, pos):
+        """
+        Reports the tracks of a prediction-only step once the bank has predicted 'pos' for 'slots'
+        """
+        self.predicted_frames += 1
+        valid = ~np.isnan(pos).any(axis=1)[::-1]
+        slots = slots[::-1]
+        ret = self._report(slots, self._reported(slots) & valid)
+        if len(ret) > 0:
+            return ret
+        return np.empty((0, 6))
+
+    def track_confidence(self, decay=0.9):
+        """
+        Confidence of the current tracks: mean detection score of the reported tracks, decayed by 'decay' for
+        every prediction-only step since the last update. Returns 0 when nothing is tracked.
+        """
+        slots = self._slots()
+        report = self._reported(slots)
+        if not report.any():
+            return 0.
+        return float(self.bank.score[slots[report]].mean() * decay ** self.predicted_frames)
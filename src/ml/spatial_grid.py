@@ -0,0 +1,98 @@
+import sys
+import numpy as np
+from src.exception import CustomException
+
+
+def _grid_cells(boxes, cell_size, origin):
+    """
+    Expands (n, 4) [x1,y1,x2,y2] boxes into the uniform grid cells they cover.
+    Returns (box index, cell x, cell y) arrays with one entry per covered cell.
+    """
+    ix0 = np.floor((boxes[:, 0] - origin[0]) / cell_size).astype(np.int64)
+    iy0 = np.floor((boxes[:, 1] - origin[1]) / cell_size).astype(np.int64)
+    ix1 = np.floor((boxes[:, 2] - origin[0]) / cell_size).astype(np.int64)
+    iy1 = np.floor((boxes[:, 3] - origin[1]) / cell_size).astype(np.int64)
+    nx = np.maximum(ix1 - ix0 + 1, 1)
+    ny = np.maximum(iy1 - iy0 + 1, 1)
+    counts = nx * ny
+    idx = np.repeat(np.arange(len(boxes)), counts)
+    offs = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return idx, ix0[idx] + offs % nx[idx], iy0[idx] + offs // nx[idx]
+
+
+def overlapping_pairs(boxes_a, boxes_b, cell_size=None):
+    """
+    Finds every (a, b) pair of [x1,y1,x2,y2] boxes with a positive intersection area, i.e. every pair whose
+    IoU is non-zero, without building the dense len(a) x len(b) matrix.
+
+    Boxes of 'boxes_b' are hashed into a uniform grid, each box of 'boxes_a' is joined with the boxes sharing
+    one of its cells and the surviving candidates get an exact overlap test. The default cell size is the
+    median box side, so each box only touches a handful of cells.
+
+    Returns two aligned index arrays (a_idx, b_idx) sorted by a_idx, then b_idx.
+    """
+    try:
+        boxes_a = np.asarray(boxes_a, dtype=float)[:, :4]
+        boxes_b = np.asarray(boxes_b, dtype=float)[:, :4]
+        empty = np.empty(0, dtype=np.int64)
+        if len(boxes_a) == 0 or len(boxes_b) == 0:
+            return empty, empty
+
+        both = np.concatenate((boxes_a, boxes_b))
+        if cell_size is None:
+            cell_size = np.median(np.maximum(both[:, 2] - both[:, 0], both[:, 3] - both[:, 1]))
+        cell_size = max(float(cell_size), 1.)
+        origin = both[:, :2].min(axis=0)
+
+        a_idx, a_cx, a_cy = _grid_cells(boxes_a, cell_size, origin)
+        b_idx, b_cx, b_cy = _grid_cells(boxes_b, cell_size, origin)
+        span_y = max(a_cy.max(), b_cy.max()) + 1
+        a_key = a_cx * span_y + a_cy
+        b_key = b_cx * span_y + b_cy
+
+        order = np.argsort(b_key, kind='stable')
+        b_key, b_idx = b_key[order], b_idx[order]
+        lo = np.searchsorted(b_key, a_key, side='left')
+        hi = np.searchsorted(b_key, a_key, side='right')
+        counts = hi - lo
+        if counts.sum() == 0:
+            return empty, empty
+        cand_a = np.repeat(a_idx, counts)
+        cand_b = b_idx[np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+
+        pair_key = np.unique(cand_a * len(boxes_b) + cand_b)
+        cand_a, cand_b = pair_key // len(boxes_b), pair_key % len(boxes_b)
+
+        a, b = boxes_a[cand_a], boxes_b[cand_b]
+        overlap = ((np.minimum(a[:, 2], b[:, 2]) > np.maximum(a[:, 0], b[:, 0])) &
+                   (np.minimum(a[:, 3], b[:, 3]) > np.maximum(a[:, 1], b[:, 1])))
+        return cand_a[overlap], cand_b[overlap]
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def pair_iou(boxes_a, boxes_b):
+    """
+    Computes the IoU of aligned rows of two (n, 4) [x1,y1,x2,y2] box arrays
+    """
+    w = np.maximum(0., np.minimum(boxes_a[:, 2], boxes_b[:, 2]) - np.maximum(boxes_a[:, 0], boxes_b[:, 0]))
+    h = np.maximum(0., np.minimum(boxes_a[:, 3], boxes_b[:, 3]) - np.maximum(boxes_a[:, 1], boxes_b[:, 1]))
+    wh = w * h
+    return wh / ((boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+                 + (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1]) - wh)
+
+
+def bipartite_components(a_idx, b_idx, n_a, n_b):
+    """
+    Labels the connected components of the bipartite graph with edges (a_idx[k], b_idx[k]).
+    Returns (a_labels, b_labels), the component label of every node on each side.
+    """
+    try:
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        n = n_a + n_b
+        graph = coo_matrix((np.ones(len(a_idx), dtype=np.int8), (a_idx, b_idx + n_a)), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+        return labels[:n_a], labels[n_a:]
+    except Exception as e:
+        raise CustomException(e, sys) from e
@@ -0,0 +1,101 @@
+import sys
+import numpy as np
+from src.utils import iou_batch
+from src.exception import CustomException
+from src.ml.assignment import linear_assignment
+from src.constants import SHARD_STITCH_IOU, SHARD_STITCH_MIN_FRAMES
+
+# columns of a track file row
+TRACK_COLUMNS = ['frame', 'id', 'x1', 'y1', 'x2', 'y2', 'class', 'predicted']
+TRACK_FORMAT = '%d,%d,%.1f,%.1f,%.1f,%.1f,%d,%d'
+
+
+def track_rows(frame, tracked_dets, predicted=False):
+    """
+    Track file rows [frame, id, x1, y1, x2, y2, class, predicted] of the tracked detections of one frame
+    """
+    rows = np.empty((len(tracked_dets), len(TRACK_COLUMNS)))
+    rows[:, 0] = frame
+    rows[:, 1] = tracked_dets[:, 8]
+    rows[:, 2:6] = tracked_dets[:, :4]
+    rows[:, 6] = tracked_dets[:, 4]
+    rows[:, 7] = predicted
+    return rows
+
+
+def load_tracks(path):
+    """
+    (n, 8) array of the rows of a track file
+    """
+    try:
+        rows = np.loadtxt(path, delimiter=',', ndmin=2)
+        return rows.reshape(-1, len(TRACK_COLUMNS))
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def match_shard_tracks(previous, following, iou_threshold=SHARD_STITCH_IOU, min_frames=SHARD_STITCH_MIN_FRAMES):
+    """
+    Matches the track IDs of two shards over the frames both of them tracked.
+
+    On every shared frame the boxes of the same class are assigned to each other by IoU, and every assigned pair
+    with an IoU of at least 'iou_threshold' is a vote for the two IDs being the same object. The IDs are then
+    assigned one to one by votes, keeping the pairs with at least 'min_frames' votes.
+
+    Returns a dict from the IDs of 'following' to those of 'previous'.
+    """
+    try:
+        frames = np.intersect1d(previous[:, 0], following[:, 0])
+        if not len(frames):
+            return {}
+        prev_ids, prev_index = np.unique(previous[:, 1], return_inverse=True)
+        next_ids, next_index = np.unique(following[:, 1], return_inverse=True)
+        votes = np.zeros((len(prev_ids), len(next_ids)))
+        for frame in frames:
+            a, b = np.flatnonzero(previous[:, 0] == frame), np.flatnonzero(following[:, 0] == frame)
+            if not len(a) or not len(b):
+                continue
+            iou = iou_batch(previous[a, 2:6], following[b, 2:6])
+            iou[previous[a, 6][:, None] != following[b, 6][None, :]] = 0.
+            for i, j in linear_assignment(-iou):
+                if iou[i, j] >= iou_threshold:
+                    votes[prev_index[a[i]], next_index[b[j]]] += 1
+        mapping = {}
+        for i, j in linear_assignment(-votes):
+            if votes[i, j] >= min_frames:
+                mapping[int(next_ids[j])] = int(prev_ids[i])
+        return mapping
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def stitch_shards(shards, iou_threshold=SHARD_STITCH_IOU, min_frames=SHARD_STITCH_MIN_FRAMES):
+    """
+    Joins the tracks of consecutive shards of one video into one track array with video-wide IDs.
+
+    'shards' is a list of (rows, start, end) in video order, where 'rows' holds the track rows of a shard that
+    tracked frames up to 'end' and owns frames (start, end]. Frames at or before 'start' are the overlap it shares
+    with the previous shard: they are only used to match its IDs to those of the previous shard, whose rows are
+    kept for them. Matched IDs continue the previous shard's video-wide ID, the others get new ones.
+
+    Returns the rows of all shards with video-wide IDs, in frame order, and the number of IDs that were stitched.
+    """
+    try:
+        out, previous, next_id, stitched = [], None, 1, 0
+        for rows, start, end in shards:
+            rows = rows.copy()
+            mapping = {}
+            if previous is not None and len(previous) and len(rows):
+                # the previous rows already carry video-wide IDs
+                mapping = match_shard_tracks(previous, rows, iou_threshold, min_frames)
+                stitched += len(mapping)
+            for i in np.unique(rows[:, 1]).astype(int):
+                if i not in mapping:
+                    mapping[i], next_id = next_id, next_id + 1
+            rows[:, 1] = [mapping[int(i)] for i in rows[:, 1]]
+            previous = rows
+            out.append(rows[(rows[:, 0] > start) & (rows[:, 0] <= end)])
+        rows = np.concatenate(out) if out else np.empty((0, len(TRACK_COLUMNS)))
+        return rows[np.argsort(rows[:, 0], kind='stable')], stitched
+    except Exception as e:
+        raise CustomException(e, sys) from e
@@ -0,0 +1,130 @@
+import sys
+import numpy as np
+import torch
+from src.exception import CustomException
+from src.constants import TILE_SIZE, TILE_OVERLAP, TILE_MERGE_THRESHOLD
+
+
+def tile_starts(length, tile, overlap):
+    """
+    Start offsets of the fewest tiles of size 'tile', overlapping by at least 'overlap' of a tile, that cover
+    [0, length). The last tile ends on 'length', a single tile starts at 0 when 'length' fits in one.
+    """
+    if length <= tile:
+        return [0]
+    step = max(tile * (1. - overlap), 1.)
+    n = int(np.ceil((length - tile) / step)) + 1
+    return sorted(set(np.linspace(0, length - tile, n).round().astype(int).tolist()))
+
+
+class TileLayout(object):
+    """
+    Overlapping square tiles of 'tile_size' pixels cut from the original frame at its native resolution.
+
+    Every tile has the same (tile_size, tile_size) model input shape, tiles running past the border of a frame
+    smaller than a tile are padded on the bottom and right, so the tiles of any number of frames stack into one
+    batch. 'regions' restricts the tiles to [x1, y1, x2, y2] regions of interest, in pixels or, when every value
+    is at most 1, in fractions of the frame size. Without regions the whole frame is tiled.
+    """
+
+    def __init__(self, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, regions=None):
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.regions = regions
+        self._windows = {}
+
+    def windows(self, shape):
+        """
+        (k, 4) int array of the [x1, y1, x2, y2] tile windows of a frame of 'shape' [height, width], ordered
+        row by row
+        """
+        try:
+            shape = tuple(shape[:2])
+            if shape not in self._windows:
+                h, w = shape
+                t = self.tile_size
+                regions = self.regions or [[0, 0, w, h]]
+                windows = []
+                for region in regions:
+                    x1, y1, x2, y2 = region
+                    if max(region) <= 1:
+                        x1, y1, x2, y2 = x1 * w, y1 * h, x2 * w, y2 * h
+                    x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+                    if x2 - x1 < t:  # grow regions narrower than a tile to one tile around their centre
+                        x1 = min(max((x1 + x2 - t) / 2, 0), max(w - t, 0))
+                        x2 = min(x1 + t, w)
+                    if y2 - y1 < t:
+                        y1 = min(max((y1 + y2 - t) / 2, 0), max(h - t, 0))
+                        y2 = min(y1 + t, h)
+                    for y in tile_starts(int(round(y2 - y1)), t, self.overlap):
+                        for x in tile_starts(int(round(x2 - x1)), t, self.overlap):
+                            window = (int(x1) + x, int(y1) + y, int(x1) + x + t, int(y1) + y + t)
+                            if window not in windows:
+                                windows.append(window)
+                self._windows[shape] = np.array(sorted(windows, key=lambda b: (b[1], b[0])), dtype=np.int64)
+            return self._windows[shape]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def cut(self, im0, color=114):
+        """
+        Cuts a BGR (H, W, 3) frame into its tiles, returned as a list of RGB (3, tile_size, tile_size) uint8 model
+        inputs, and the (k, 4) tile windows
+        """
+        try:
+            windows = self.windows(im0.shape)
+            tiles = []
+            for x1, y1, x2, y2 in windows:
+                tile = im0[y1:y2, x1:x2, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3 x tile x tile
+                if tile.shape[1:] != (self.tile_size, self.tile_size):  # frame smaller than a tile
+                    padded = np.full((3, self.tile_size, self.tile_size), color, dtype=im0.dtype)
+                    padded[:, :tile.shape[1], :tile.shape[2]] = tile
+                    tile = padded
+                tiles.append(np.ascontiguousarray(tile))
+            return tiles, windows
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+def merge_tile_detections(det, tile_index, threshold=TILE_MERGE_THRESHOLD):
+    """
+    Cross-tile NMS of the (n, 6) [x1, y1, x2, y2, conf, cls] detections of one frame, in frame coordinates, where
+    'tile_index' is the tile each row was detected in.
+
+    In descending confidence, a detection suppresses the lower confidence detections of the same class from other
+    tiles whose intersection covers at least 'threshold' of the smaller box, and its box grows to the union of
+    the boxes it suppresses. Intersection over the smaller box rather than IoU is what removes the partial box an
+    object cut by a tile border leaves in the tile that only sees part of it. Detections of the same tile were
+    already suppressed by the per-tile NMS.
+
+    Returns the (m, 6) merged detections and the (m,) indices of the kept rows of 'det'.
+    """
+    try:
+        n = len(det)
+        if n < 2 or int(tile_index.max()) == int(tile_index.min()):
+            return det, torch.arange(n, device=det.device)
+        order = det[:, 4].argsort(descending=True)
+        det, tile_index = det[order], tile_index[order]
+        lt = torch.max(det[:, None, :2], det[None, :, :2])
+        rb = torch.min(det[:, None, 2:4], det[None, :, 2:4])
+        inter = (rb - lt).clamp(min=0).prod(2)
+        area = (det[:, 2:4] - det[:, :2]).prod(1)
+        ios = inter / torch.min(area[:, None], area[None, :]).clamp(min=1e-9)
+        suppress = ((ios >= threshold) & (det[:, None, 5] == det[None, :, 5]) &
+                    (tile_index[:, None] != tile_index[None, :])).triu(1).cpu().numpy()
+
+        keep = np.ones(n, dtype=bool)
+        boxes = det[:, :4].clone()
+        for i in np.flatnonzero(suppress.any(1)):
+            if not keep[i]:
+                continue
+            j = np.flatnonzero(suppress[i] & keep)
+            if len(j):
+                keep[j] = False
+                j = torch.from_numpy(j).to(det.device)
+                boxes[i, :2] = torch.min(boxes[i, :2], det[j, :2].min(0).values)
+                boxes[i, 2:] = torch.max(boxes[i, 2:], det[j, 2:4].max(0).values)
+        keep = torch.from_numpy(keep).to(det.device)
+        return torch.cat((boxes, det[:, 4:]), 1)[keep], order[keep]
+    except Exception as e:
+        raise CustomException(e, sys) from e
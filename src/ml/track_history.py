@@ -0,0 +1,73 @@
+import numpy as np
+
+
+class TrackHistory(object):
+    """
+    Fixed-capacity ring buffer of per-frame track records (centroids, boxes, predictions) backed by one
+    preallocated NumPy array.
+
+    Every record is written twice, at 'head' and at 'head + capacity', so the newest k records are always a
+    contiguous slice of the buffer and last(k) can hand them out as a zero-copy view, oldest first. Memory
+    and read cost stay constant however long the track lives.
+    """
+
+    def __init__(self, capacity, dim, dtype=float):
+        """
+        :param capacity: number of most recent records that are kept
+        :param dim: length of one record
+        """
+        self.capacity = max(int(capacity), 1)
+        self.dim = dim
+        self._buf = np.zeros((2 * self.capacity, dim), dtype=dtype)
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        return self.last()[index]
+
+    def __iter__(self):
+        return iter(self.last())
+
+    def append(self, record):
+        """
+        Stores one record, overwriting the oldest one once the buffer is full
+        """
+        head = self._head
+        row = self._buf[head]
+        if len(record) == self.dim:
+            row[:] = record
+        else:
+            record = np.asarray(record).ravel()[:self.dim]
+            row[:len(record)] = record
+            row[len(record):] = 0
+        self._buf[head + self.capacity] = row
+        self._head = (head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def load(self, records):
+        """
+        Replaces the content with 'records' (oldest first), keeping the newest 'capacity' of them
+        """
+        records = np.asarray(records).reshape(-1, self.dim)[-self.capacity:]
+        k = len(records)
+        self._buf[:k] = records
+        self._buf[self.capacity:self.capacity + k] = records
+        self._head = k % self.capacity
+        self._size = k
+
+    def clear(self):
+        self._size = 0
+
+    def last(self, k=None):
+        """
+        Returns a (k, dim) read-only view of the k most recent records, oldest first.
+        With k=None every retained record is returned.
+        """
+        k = self._size if k is None else min(int(k), self._size)
+        end = self._head + self.capacity
+        view = self._buf[end - k:end]
+        view.flags.writeable = False
+        return view
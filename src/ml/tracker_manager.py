@@ -0,0 +1,120 @@
+import sys
+import numpy as np
+from src.ml.sort import Sort
+from src.ml.kalman_bank import KalmanBank
+from src.ml.assignment import AssignmentStats
+from src.exception import CustomException
+
+
+class TrackerManager(object):
+    """
+    Holds one independent SORT tracker per stream (camera, video, ...) key.
+
+    Every stream has its own tracks and its own ID space, but all of them keep their filters in one shared
+    KalmanBank. A tick over several streams therefore predicts all filters in one batched call, associates every
+    stream the way its standalone Sort would and updates all matched filters in one batched call, so one worker
+    can serve many low-fps cameras and every stream gets the tracks an independent Sort would give it.
+    """
+
+    def __init__(self, **sort_kwargs):
+        """
+        :param sort_kwargs: parameters for every stream's Sort (max_age, min_hits, iou_threshold, ...)
+        """
+        self.sort_kwargs = sort_kwargs
+        self.bank = KalmanBank()
+        self.trackers = {}
+        self.assignment_stats = AssignmentStats()
+
+    def __contains__(self, key):
+        return key in self.trackers
+
+    def __len__(self):
+        return len(self.trackers)
+
+    def add_stream(self, key) -> Sort:
+        """
+        Returns the tracker of stream 'key', creating it on first use
+        """
+        if key not in self.trackers:
+            self.trackers[key] = Sort(bank=self.bank, **self.sort_kwargs)
+        return self.trackers[key]
+
+    def get_tracker(self, key) -> Sort:
+        return self.trackers[key]
+
+    def remove_stream(self, key):
+        """
+        Drops stream 'key' and hands its filter slots back to the shared bank
+        """
+        tracker = self.trackers.pop(key, None)
+        if tracker is not None:
+            tracker.release()
+
+    def _per_slot(self, keys, counts, dt):
+        if not isinstance(dt, dict):
+            return dt
+        return np.repeat(np.array([dt.get(key, 1.0) for key in keys], dtype=float), counts)
+
+    def update(self, detections, dt=1.0):
+        """
+        One tracking tick over several streams
+
+        'detections' - dict of stream key -> detections array in Sort.update format. Streams missing from the dict
+        are not advanced on this tick.
+        'dt' - time since each stream's previous frame in frame intervals, a scalar or a dict keyed like
+        'detections'
+
+        Returns a dict of stream key -> tracked detections, the same array Sort.update returns for that stream.
+        """
+        try:
+            keys = list(detections)
+            if not keys:
+                return {}
+            trackers = [self.add_stream(key) for key in keys]
+            dets = [np.asarray(detections[key], dtype=float).reshape(-1, 6) if len(detections[key])
+                    else np.empty((0, 6)) for key in keys]
+
+            # one batched predict over every stream's filters
+            slots = [tracker._slots() for tracker in trackers]
+            counts = [len(s) for s in slots]
+            pos = self.bank.predict(np.concatenate(slots), dt=self._per_slot(keys, counts, dt))
+            pos = np.split(pos, np.cumsum(counts)[:-1])
+            trks = []
+            for i, tracker in enumerate(trackers):
+                slots[i], trk = tracker._begin_frame(slots[i], pos[i])
+                trks.append(trk)
+
+            # every stream is associated on its own, exactly like its standalone Sort, so a stream's tracks do not
+            # depend on which other streams share the tick
+            matched = [tracker._associate(dets[i], trks[i], self.assignment_stats)[:2]
+                       for i, tracker in enumerate(trackers)]
+
+            # one batched update of every matched filter
+            upd_slots = [slots[i][m[:, 1]] for i, (m, _) in enumerate(matched)]
+            upd_dets = [dets[i][m[:, 0]] for i, (m, _) in enumerate(matched)]
+            if sum(len(s) for s in upd_slots):
+                self.bank.update(np.concatenate(upd_slots), np.concatenate(upd_dets))
+
+            return {key: tracker._end_frame(dets[i], *matched[i])
+                    for i, (key, tracker) in enumerate(zip(keys, trackers))}
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def predict(self, keys, dt=1.0):
+        """
+        Prediction-only step (see Sort.predict) for the streams in 'keys', batched into one bank call.
+        Returns a dict of stream key -> predicted tracks.
+        """
+        try:
+            keys = list(keys)
+            if not keys:
+                return {}
+            trackers = [self.add_stream(key) for key in keys]
+            slots = [tracker._slots() for tracker in trackers]
+            counts = [len(s) for s in slots]
+            pos = self.bank.predict(np.concatenate(slots), dt=self._per_slot(keys, counts, dt), bookkeeping=False)
+            pos = np.split(pos, np.cumsum(counts)[:-1])
+            return {key: tracker._end_prediction(slots[i], pos[i])
+                    for i, (key, tracker) in enumerate(zip(keys, trackers))}
+        except Exception as e:
+            raise CustomException(e, sys) from e
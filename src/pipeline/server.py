@@ -0,0 +1,106 @@
+import sys
+import itertools
+import threading
+from datetime import datetime
+from src.logger import logging
+from src.exception import CustomException
+from src.constants import SERVER_MAX_CONCURRENT_REQUESTS
+from src.pipeline.tracking import TrackingPipeline
+from src.entity.artifact_entity import ModelIngestionArtifacts, PusherArtifacts
+
+
+class TrackingServer:
+    """
+    Keeps the model of the tracking pipeline resident across /track requests: start() ingests, loads, traces and
+    warms up the weights once, and every request only runs the data transformation, object tracking and pusher
+    steps with it.
+
+    A request tracks with the model that is current when it gets one of the 'max_concurrent_requests' slots.
+    reload() loads and warms up new weights next to the current model and only then swaps them in, so requests in
+    flight finish on the old model, which is freed with its last request.
+    """
+
+    def __init__(self, max_concurrent_requests=SERVER_MAX_CONCURRENT_REQUESTS):
+        self.lock = threading.Lock()  # guards the swap of the resident model
+        self.reload_lock = threading.Lock()  # one reload at a time
+        self.slots = threading.BoundedSemaphore(max_concurrent_requests)
+        self.runs = itertools.count()
+        self.model_ingestion_artifacts = None
+        self.model_loading_artifacts = None
+
+    def run_timestamp(self) -> str:
+        # every run gets its own artifacts directory and Gcloud Storage folder, TIMESTAMP is fixed at import
+        return f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}_{next(self.runs)}"
+
+    def load(self, weights_path=None):
+        """
+        Ingests the weights from Gcloud Storage, or takes the local 'weights_path', then loads the model and warms it
+        up on the input shapes of SOURCE. Returns the model ingestion and model loading artifacts.
+        """
+        logging.info("Entered the load method of TrackingServer class")
+        try:
+            tracking_pipeline = TrackingPipeline(self.run_timestamp())
+            if weights_path is None:
+                model_ingestion_artifacts = tracking_pipeline.start_model_ingestion()
+            else:
+                model_ingestion_artifacts = ModelIngestionArtifacts(weights_path=weights_path)
+
+            model_loading_artifacts = tracking_pipeline.start_model_loading(
+                model_ingestion_artifacts=model_ingestion_artifacts
+            )
+
+            data_transformation_artifacts = tracking_pipeline.start_data_transformation(
+                model_loading_artifacts=model_loading_artifacts
+            )
+            dataset = data_transformation_artifacts.dataset_obj
+            if hasattr(dataset, 'close'):  # a live source was only opened for its input shapes
+                dataset.close()
+
+            logging.info("Exited the load method of TrackingServer class")
+            return model_ingestion_artifacts, model_loading_artifacts
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def reload(self, weights_path=None) -> ModelIngestionArtifacts:
+        """
+        Loads and warms up new weights (see load), then makes them the resident model of the following requests
+        """
+        logging.info("Entered the reload method of TrackingServer class")
+        try:
+            with self.reload_lock:
+                model_ingestion_artifacts, model_loading_artifacts = self.load(weights_path)
+                with self.lock:
+                    self.model_ingestion_artifacts = model_ingestion_artifacts
+                    self.model_loading_artifacts = model_loading_artifacts
+            logging.info(f"Resident model swapped to {model_ingestion_artifacts.weights_path}")
+            logging.info("Exited the reload method of TrackingServer class")
+            return model_ingestion_artifacts
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def start(self) -> ModelIngestionArtifacts:
+        logging.info("Starting the tracking server")
+        return self.reload()
+
+    def track(self) -> PusherArtifacts:
+        """
+        Tracks SOURCE with the resident model and pushes the tracked video
+        """
+        logging.info("Entered the track method of TrackingServer class")
+        try:
+            with self.slots:
+                with self.lock:
+                    model_ingestion_artifacts = self.model_ingestion_artifacts
+                    model_loading_artifacts = self.model_loading_artifacts
+                if model_loading_artifacts is None:
+                    raise RuntimeError("The tracking server has no model, call start() first")
+
+                tracking_pipeline = TrackingPipeline(self.run_timestamp())
+                pusher_artifacts = tracking_pipeline.track(
+                    model_ingestion_artifacts=model_ingestion_artifacts,
+                    model_loading_artifacts=model_loading_artifacts
+                )
+            logging.info("Exited the track method of TrackingServer class")
+            return pusher_artifacts
+        except Exception as e:
+            raise CustomException(e, sys) from e
@@ -2,22 +2,28 @@ import os
 import sys
 from src.logger import logging
 from src.exception import CustomException
+from src.constants import SOURCE, TIMESTAMP
+from src.ml.load_stream import is_stream
 from src.components.model_ingestion import ModelIngestion
 from src.components.model_loading import ModelLoading
 from src.components.data_transformation import DataTransformation
 from src.components.object_tracking import ObjectTracking
+from src.components.sharded_tracking import ShardedTracking
 from src.components.pusher import Pusher
 from src.entity.config_entity import ModelIngestionConfig, ModelLoadingConfig, DataTransformationConfig, ObjectTrackingConfig, PusherConfig
 from src.entity.artifact_entity import ModelIngestionArtifacts, ModelLoadingArtifacts, DataTransformationArtifacts, ObjectTrackingArtifacts, PusherArtifacts
 
 
 class TrackingPipeline:
-    def __init__(self):
-        self.model_ingestion_config = ModelIngestionConfig()
-        self.model_loading_config = ModelLoadingConfig()
-        self.data_transformation_config = DataTransformationConfig()
-        self.object_tracking_config = ObjectTrackingConfig()
-        self.pusher_config = PusherConfig()
+    def __init__(self, timestamp: str = TIMESTAMP):
+        """
+        :param timestamp: Names the artifacts directory and the Gcloud Storage folder of the run
+        """
+        self.model_ingestion_config = ModelIngestionConfig(timestamp)
+        self.model_loading_config = ModelLoadingConfig(timestamp)
+        self.data_transformation_config = DataTransformationConfig(timestamp)
+        self.object_tracking_config = ObjectTrackingConfig(timestamp)
+        self.pusher_config = PusherConfig(timestamp)
 
     def start_model_ingestion(self) -> ModelIngestionArtifacts:
         logging.info("Entered the start_model_ingestion method of TrackingPipeline class")
@@ -80,6 +86,23 @@ class TrackingPipeline:
         except Exception as e:
             raise CustomException(e, sys) from e
 
+    def start_sharded_tracking(self, data_transformation_artifacts: DataTransformationArtifacts,
+                               model_ingestion_artifacts: ModelIngestionArtifacts) -> ObjectTrackingArtifacts:
+        logging.info("Entered the start_sharded_tracking method of TrackingPipeline class")
+        try:
+            logging.info(f"Track the videos in shards over {self.object_tracking_config.SHARD_WORKERS} processes")
+            sharded_tracking = ShardedTracking(
+                object_tracking_config=self.object_tracking_config,
+                data_transformation_artifacts=data_transformation_artifacts,
+                model_ingestion_artifacts=model_ingestion_artifacts,
+                model_loading_config=self.model_loading_config
+            )
+            object_tracking_artifacts = sharded_tracking.initiate_object_tracking()
+            logging.info("Exited the start_sharded_tracking method of TrackingPipeline class")
+            return object_tracking_artifacts
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
     def start_pusher(self, object_tracking_artifacts: ObjectTrackingArtifacts) -> PusherArtifacts:
         logging.info("Entered the start_pusher method of TrackingPipeline class")
         try:
@@ -95,6 +118,38 @@ class TrackingPipeline:
         except Exception as e:
             raise CustomException(e, sys) from e
 
+    def track(self, model_ingestion_artifacts: ModelIngestionArtifacts,
+              model_loading_artifacts: ModelLoadingArtifacts) -> PusherArtifacts:
+        """
+        Tracks SOURCE with an already loaded model and pushes the tracked video, the part of the pipeline a
+        resident model server runs per request
+        """
+        logging.info("Entered the track method of TrackingPipeline class")
+        try:
+            data_transformation_artifacts = self.start_data_transformation(
+                model_loading_artifacts=model_loading_artifacts
+            )
+
+            if self.object_tracking_config.SHARD_WORKERS > 1 and not is_stream(SOURCE):
+                object_tracking_artifacts = self.start_sharded_tracking(
+                    data_transformation_artifacts=data_transformation_artifacts,
+                    model_ingestion_artifacts=model_ingestion_artifacts
+                )
+            else:
+                object_tracking_artifacts = self.start_object_tracking(
+                    data_transformation_artifacts=data_transformation_artifacts,
+                    model_loading_artifacts=model_loading_artifacts
+                )
+
+            pusher_artifacts = self.start_pusher(
+                object_tracking_artifacts=object_tracking_artifacts
+            )
+
+            logging.info("Exited the track method of TrackingPipeline class")
+            return pusher_artifacts
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
     def run_pipeline(self) -> None:
         logging.info("Entered the run_pipeline method of TrackingPipeline class")
         try:
@@ -104,19 +159,11 @@ class TrackingPipeline:
                 model_ingestion_artifacts=model_ingestion_artifacts
             )
 
-            data_transformation_artifacts = self.start_data_transformation(
+            self.track(
+                model_ingestion_artifacts=model_ingestion_artifacts,
                 model_loading_artifacts=model_loading_artifacts
             )
 
-            object_tracking_artifacts = self.start_object_tracking(
-                data_transformation_artifacts=data_transformation_artifacts,
-                model_loading_artifacts=model_loading_artifacts
-            )
-
-            pusher_artifacts = self.start_pusher(
-                object_tracking_artifacts=object_tracking_artifacts
-            )
-
             logging.info("Exited the run_pipeline method of TrackingPipeline class")
         except Exception as e:
             raise CustomException(e, sys) from e
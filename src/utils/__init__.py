@@ -1,42 +1,51 @@
 import sys
 import cv2
 import numpy as np
-from src.logger import logging
+from src.logger import get_logger
 from src.exception import CustomException
 
+logger = get_logger(__name__)
 
-def convert_bbox_to_z(bbox):
+
+def convert_bboxes_to_z(bboxes):
+    """
+    Takes an (n, >=4) array of [x1,y1,x2,y2] boxes and returns an (n, 4) array of [x,y,s,r] measurements,
+    where x,y is the centre of the box, s its scale/area and r its aspect ratio
+    """
     try:
-        logging.info(
-            "Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form [x,y,s,r] where x,y is the center of the box and s is the scale/area and r is the aspect ratio")
-        w = bbox[2] - bbox[0]
-        h = bbox[3] - bbox[1]
-        x = bbox[0] + w / 2.
-        y = bbox[1] + h / 2.
-        s = w * h
-        # scale is just area
-        r = w / float(h)
-        return np.array([x, y, s, r]).reshape((4, 1))
+        bboxes = np.asarray(bboxes, dtype=float)
+        w = bboxes[:, 2] - bboxes[:, 0]
+        h = bboxes[:, 3] - bboxes[:, 1]
+        z = np.empty((bboxes.shape[0], 4))
+        z[:, 0] = bboxes[:, 0] + w / 2.
+        z[:, 1] = bboxes[:, 1] + h / 2.
+        z[:, 2] = w * h
+        z[:, 3] = w / h
+        return z
     except Exception as e:
         raise CustomException(e, sys) from e
 
 
-def convert_x_to_bbox(x, score=None):
-    logging.info(
-        "Takes a bounding box in the centre form [x,y,s,r] and returns it in the form [x1,y1,x2,y2] where x1,y1 is the top left and x2,y2 is the bottom right")
+def convert_x_to_bboxes(x):
+    """
+    Takes an (n, >=4) array of [x,y,s,r,...] centre form states and returns an (n, 4) array of [x1,y1,x2,y2]
+    boxes, where x1,y1 is the top left and x2,y2 is the bottom right
+    """
     try:
-        w = np.sqrt(x[2] * x[3])
-        h = x[2] / w
-        if (score == None):
-            return np.array([x[0] - w / 2., x[1] - h / 2., x[0] + w / 2., x[1] + h / 2.]).reshape((1, 4))
-        else:
-            return np.array([x[0] - w / 2., x[1] - h / 2., x[0] + w / 2., x[1] + h / 2., score]).reshape((1, 5))
+        w = np.sqrt(x[:, 2] * x[:, 3])
+        h = x[:, 2] / w
+        bboxes = np.empty((x.shape[0], 4))
+        bboxes[:, 0] = x[:, 0] - w / 2.
+        bboxes[:, 1] = x[:, 1] - h / 2.
+        bboxes[:, 2] = x[:, 0] + w / 2.
+        bboxes[:, 3] = x[:, 1] + h / 2.
+        return bboxes
     except Exception as e:
         raise CustomException(e, sys) from e
 
 
 def iou_batch(bb_test, bb_gt):
-    logging.info("From SORT: Computes IOU between two boxes in the form [x1,y1,x2,y2]")
+    logger.debug("From SORT: Computes IOU between two boxes in the form [x1,y1,x2,y2]")
     try:
         bb_gt = np.expand_dims(bb_gt, 0)
         bb_test = np.expand_dims(bb_test, 1)
@@ -55,9 +64,11 @@ def iou_batch(bb_test, bb_gt):
         raise CustomException(e, sys) from e
 
 
-def draw_boxes(img, bbox, identities=None, categories=None, names=None, offset=(0, 0)):
+def draw_boxes(img, bbox, identities=None, categories=None, names=None, offset=(0, 0), predicted=False):
     try:
-        logging.info("Function to Draw Bounding boxes")
+        logger.debug("Function to Draw Bounding boxes")
+        # boxes propagated by the tracker without a detection are drawn grey and their label is marked with '~'
+        box_color, label_color = ((160, 160, 160), (128, 128, 128)) if predicted else ((255, 0, 20), (255, 144, 30))
         for i, box in enumerate(bbox):
             x1, y1, x2, y2 = [int(i) for i in box]
             x1 += offset[0]
@@ -67,10 +78,10 @@ def draw_boxes(img, bbox, identities=None, categories=None, names=None, offset=(
             cat = int(categories[i]) if categories is not None else 0
             id = int(identities[i]) if identities is not None else 0
             data = (int((box[0] + box[2]) / 2), (int((box[1] + box[3]) / 2)))
-            label = str(id) + ":" + names[cat]
+            label = ("~" if predicted else "") + str(id) + ":" + names[cat]
             (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
-            cv2.rectangle(img, (x1, y1), (x2, y2), (255, 0, 20), 2)
-            cv2.rectangle(img, (x1, y1 - 20), (x1 + w, y1), (255, 144, 30), -1)
+            cv2.rectangle(img, (x1, y1), (x2, y2), box_color, 2)
+            cv2.rectangle(img, (x1, y1 - 20), (x1 + w, y1), label_color, -1)
             cv2.putText(img, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX,
                         0.6, [255, 255, 255], 1)
             # cv2.circle(img, data, 6, color,-1)
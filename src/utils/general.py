@@ -3,16 +3,18 @@ import sys
 import math
 import time
 import torch
-import torchvision
 import numpy as np
 from random import randint
-from src.logger import logging
+from src.logger import get_logger
 from src.exception import CustomException
+from src.ml.nms import suppress
+
+logger = get_logger(__name__)
 
 
 def make_divisible(x, divisor):
     try:
-        logging.info("Returns x evenly divisible by divisor")
+        logger.debug("Returns x evenly divisible by divisor")
         return math.ceil(x / divisor) * divisor
     except Exception as e:
         raise CustomException(e, sys) from e
@@ -20,10 +22,10 @@ def make_divisible(x, divisor):
 
 def check_img_size(img_size, s=32):
     try:
-        logging.info("Verify img_size is a multiple of stride s")
+        logger.debug("Verify img_size is a multiple of stride s")
         new_size = make_divisible(img_size, int(s))  # ceil gs-multiple
         if new_size != img_size:
-            print('WARNING: --img-size %g must be multiple of max stride %g, updating to %g' % (img_size, s, new_size))
+            logger.warning('--img-size %g must be multiple of max stride %g, updating to %g', img_size, s, new_size)
         return new_size
     except Exception as e:
         raise CustomException(e, sys) from e
@@ -45,7 +47,7 @@ def random_color_list():
 
 def xywh2xyxy(x):
     try:
-        logging.info("Convert nx4 boxes from [x, y, w, h] to [x1, y1, x2, y2] where xy1=top-left, xy2=bottom-right")
+        logger.debug("Convert nx4 boxes from [x, y, w, h] to [x1, y1, x2, y2] where xy1=top-left, xy2=bottom-right")
         y = x.clone() if isinstance(x, torch.Tensor) else np.copy(x)
         y[:, 0] = x[:, 0] - x[:, 2] / 2  # top left x
         y[:, 1] = x[:, 1] - x[:, 3] / 2  # top left y
@@ -83,100 +85,130 @@ def box_iou(box1, box2):
 
 
 def non_max_suppression(prediction, conf_thres=0.25, iou_thres=0.45, classes=None, agnostic=False, multi_label=False,
-                        labels=()):
+                        labels=(), pruned=False, merge=False, backend='auto'):
     """Runs Non-Maximum Suppression (NMS) on inference results
 
+    The candidates of the whole batch are filtered and decoded at once, then suppressed by the NMS backend
+    'backend' from src.ml.nms.BACKENDS. 'auto' suppresses them at once by batched_nms on accelerators, with the
+    same per-image outputs as suppressing every image on its own, and keeps one torchvision.ops.nms call per image
+    on the CPU, whose sequential kernel is faster there. 'merge' replaces every kept box by the score weighted mean
+    of the boxes it suppressed (merge-NMS).
+    'pruned' marks the prediction of a head pruned to some classes, whose single class column, if any, is a real
+    class confidence rather than that of a one class model.
+
     Returns:
          list of detections, on (n,6) tensor per image [xyxy, conf, cls]
     """
-    logging.info("Running Non-Maximum Suppression (NMS) on inference results")
+    logger.debug("Running Non-Maximum Suppression (NMS) on inference results")
     try:
+        bs = prediction.shape[0]  # batch size
         nc = prediction.shape[2] - 5  # number of classes
         xc = prediction[..., 4] > conf_thres  # candidates
 
         # Settings
         min_wh, max_wh = 2, 4096  # (pixels) minimum and maximum box width and height
         max_det = 300  # maximum number of detections per image
-        max_nms = 30000  # maximum number of boxes into torchvision.ops.nms()
-        time_limit = 10.0  # seconds to quit after
+        max_nms = 30000  # maximum number of boxes per image into the NMS backend
+        time_limit = 10.0  # seconds to warn after
         redundant = True  # require redundant detections
         multi_label &= nc > 1  # multiple labels per box (adds 0.5ms/img)
-        merge = False  # use merge-NMS
 
         t = time.time()
-        output = [torch.zeros((0, 6), device=prediction.device)] * prediction.shape[0]
-        for xi, x in enumerate(prediction):  # image index, image inference
-            # Apply constraints
-            # x[((x[..., 2:4] < min_wh) | (x[..., 2:4] > max_wh)).any(1), 4] = 0  # width-height
-            x = x[xc[xi]]  # confidence
-
-            # Cat apriori labels if autolabelling
-            if labels and len(labels[xi]):
-                l = labels[xi]
-                v = torch.zeros((len(l), nc + 5), device=x.device)
-                v[:, :4] = l[:, 1:5]  # box
-                v[:, 4] = 1.0  # conf
-                v[range(len(l)), l[:, 0].long() + 5] = 1.0  # cls
-                x = torch.cat((x, v), 0)
-
-            # If none remain process next image
-            if not x.shape[0]:
-                continue
-
-            # Compute conf
-            if nc == 1:
-                x[:, 5:] = x[:, 4:5]  # for models with one class, cls_loss is 0 and cls_conf is always 0.5,
-                                    # so there is no need to multiplicate.
-            else:
-                x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
-
-            # Box (center x, center y, width, height) to (x1, y1, x2, y2)
-            box = xywh2xyxy(x[:, :4])
-
-            # Detections matrix nx6 (xyxy, conf, cls)
-            if multi_label:
-                i, j = (x[:, 5:] > conf_thres).nonzero(as_tuple=False).T
-                x = torch.cat((box[i], x[i, j + 5, None], j[:, None].float()), 1)
-            else:  # best class only
-                conf, j = x[:, 5:].max(1, keepdim=True)
-                x = torch.cat((box, conf, j.float()), 1)[conf.view(-1) > conf_thres]
-
-            # Filter by class
-            if classes is not None:
-                x = x[(x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)]
-
-            # Check shape
-            n = x.shape[0]  # number of boxes
-            if not n:  # no boxes
-                continue
-            elif n > max_nms:  # excess boxes
-                x = x[x[:, 4].argsort(descending=True)[:max_nms]]  # sort by confidence
-
-            # Batched NMS
-            c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
-            boxes, scores = x[:, :4] + c, x[:, 4]  # boxes (offset by class), scores
-            i = torchvision.ops.nms(boxes, scores, iou_thres)  # NMS
-            if i.shape[0] > max_det:  # limit detections
-                i = i[:max_det]
-            if merge and (1 < n < 3E3):  # Merge NMS (boxes merged using weighted mean)
-                iou = box_iou(boxes[i], boxes) > iou_thres  # iou matrix
-                weights = iou * scores[None]  # box weights
-                x[i, :4] = torch.mm(weights, x[:, :4]).float() / weights.sum(1, keepdim=True)  # merged boxes
-                if redundant:
-                    i = i[iou.sum(1) > 1]  # require redundancy
-
-            output[xi] = x[i]
-            if (time.time() - t) > time_limit:
-                print(f'WARNING: NMS time limit {time_limit}s exceeded')
-                break  # time limit exceeded
+        output = [torch.zeros((0, 6), device=prediction.device)] * bs
+        # Apply constraints
+        # prediction[((prediction[..., 2:4] < min_wh) | (prediction[..., 2:4] > max_wh)).any(2), 4] = 0  # width-height
+        b, a = xc.nonzero(as_tuple=True)  # image index and anchor of every candidate
+        x = prediction[b, a]  # confidence
+
+        # Cat apriori labels if autolabelling
+        if labels and any(len(l) for l in labels):
+            v, vb = [x], [b]
+            for xi, l in enumerate(labels):
+                if len(l):
+                    lv = torch.zeros((len(l), nc + 5), device=x.device, dtype=x.dtype)
+                    lv[:, :4] = l[:, 1:5]  # box
+                    lv[:, 4] = 1.0  # conf
+                    lv[range(len(l)), l[:, 0].long() + 5] = 1.0  # cls
+                    v.append(lv)
+                    vb.append(torch.full((len(l),), xi, device=b.device, dtype=b.dtype))
+            b = torch.cat(vb)
+            order = b.argsort(stable=True)  # labels after the candidates of their image
+            x, b = torch.cat(v)[order], b[order]
+
+        # If none remain there is nothing to suppress
+        if not x.shape[0]:
+            return output
+
+        # Compute conf
+        if nc == 1 and not pruned:
+            x[:, 5:] = x[:, 4:5]  # for models with one class, cls_loss is 0 and cls_conf is always 0.5,
+                                # so there is no need to multiplicate.
+        else:
+            x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
+
+        # Box (center x, center y, width, height) to (x1, y1, x2, y2)
+        box = xywh2xyxy(x[:, :4])
+
+        # Detections matrix nx6 (xyxy, conf, cls)
+        if multi_label:
+            i, j = (x[:, 5:] > conf_thres).nonzero(as_tuple=False).T
+            x, b = torch.cat((box[i], x[i, j + 5, None], j[:, None].float()), 1), b[i]
+        else:  # best class only
+            conf, j = x[:, 5:].max(1, keepdim=True)
+            keep = conf.view(-1) > conf_thres
+            x, b = torch.cat((box, conf, j.float()), 1)[keep], b[keep]
+
+        # Filter by class
+        if classes is not None:
+            keep = (x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)
+            x, b = x[keep], b[keep]
+
+        # Check shape
+        n = x.shape[0]  # number of boxes
+        if not n:  # no boxes
+            return output
+        if int(torch.bincount(b, minlength=bs).max()) > max_nms:  # excess boxes
+            order = x[:, 4].argsort(descending=True)  # sort every image by confidence
+            order = order[b[order].argsort(stable=True)]
+            keep = order[rank_in_groups(b[order], bs) < max_nms]
+            x, b = x[keep], b[keep]
+
+        # Batched NMS
+        c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
+        boxes, scores = x[:, :4] + c, x[:, 4]  # boxes (offset by class), scores
+        j = torch.zeros_like(b) if agnostic else x[:, 5].long()  # class index
+        i = suppress(boxes, scores, b, j, bs, iou_thres, backend)  # by image, then by descending score
+        i = i[rank_in_groups(b[i], bs) < max_det]  # limit detections
+        if merge and (1 < n < 3E3):  # Merge NMS (boxes merged using weighted mean)
+            iou = (box_iou(boxes[i], boxes) > iou_thres) & (b[i, None] == b[None])  # iou matrix within images
+            weights = iou * scores[None]  # box weights
+            x[i, :4] = torch.mm(weights, x[:, :4]).float() / weights.sum(1, keepdim=True)  # merged boxes
+            if redundant:
+                i = i[iou.sum(1) > 1]  # require redundancy
+
+        counts = torch.bincount(b[i], minlength=bs).tolist()
+        for xi, det in enumerate(torch.split(x[i], counts)):
+            if counts[xi]:
+                output[xi] = det
+        if (time.time() - t) > time_limit:
+            logger.warning(f'NMS time limit {time_limit}s exceeded')
         return output
     except Exception as e:
         raise CustomException(e, sys) from e
 
 
+def rank_in_groups(groups, n):
+    """
+    Position of every element within its group, for a sorted int tensor 'groups' of group indices below 'n'
+    """
+    counts = torch.bincount(groups, minlength=n)
+    starts = torch.cumsum(counts, 0) - counts
+    return torch.arange(len(groups), device=groups.device) - starts[groups]
+
+
 def clip_coords(boxes, img_shape):
     try:
-        logging.info("Clip bounding xyxy bounding boxes to image shape (height, width)")
+        logger.debug("Clip bounding xyxy bounding boxes to image shape (height, width)")
         boxes[:, 0].clamp_(0, img_shape[1])  # x1
         boxes[:, 1].clamp_(0, img_shape[0])  # y1
         boxes[:, 2].clamp_(0, img_shape[1])  # x2
@@ -187,7 +219,7 @@ def clip_coords(boxes, img_shape):
 
 def scale_coords(img1_shape, coords, img0_shape, ratio_pad=None):
     try:
-        logging.info("Rescale coords (xyxy) from img1_shape to img0_shape")
+        logger.debug("Rescale coords (xyxy) from img1_shape to img0_shape")
         if ratio_pad is None:  # calculate from img0_shape
             gain = min(img1_shape[0] / img0_shape[0], img1_shape[1] / img0_shape[1])  # gain  = old / new
             pad = (img1_shape[1] - img0_shape[1] * gain) / 2, (img1_shape[0] - img0_shape[0] * gain) / 2  # wh padding
@@ -0,0 +1,67 @@
+from src.logger import logging
+from src.constants import (RESOLUTION_SIZES, RESOLUTION_TARGET_FPS, RESOLUTION_HYSTERESIS, RESOLUTION_MIN_DWELL,
+                           RESOLUTION_MIN_DETECTIONS)
+
+
+class ResolutionController(object):
+    """
+    Picks the model input size among a few pre-warmed 'sizes' to hold 'target_fps'.
+
+    The measured latency per frame and the number of detections per keyframe are smoothed with an exponential
+    moving average. Once a size has been measured on 'min_dwell' frames it is lowered when the latency exceeds
+    the frame budget by more than 'hysteresis', and raised when the latency, scaled by the pixel count of the next
+    size, still stays more than 'hysteresis' under the budget and the scene has at least 'min_detections'
+    detections per keyframe. An empty scene gains nothing from more pixels. Frames measured at another size, still
+    in flight when the size changed, are ignored.
+    """
+
+    def __init__(self, sizes=RESOLUTION_SIZES, target_fps=RESOLUTION_TARGET_FPS, hysteresis=RESOLUTION_HYSTERESIS,
+                 min_dwell=RESOLUTION_MIN_DWELL, min_detections=RESOLUTION_MIN_DETECTIONS, size=None, smoothing=0.1):
+        self.sizes = sorted(set(sizes))
+        size = self.sizes[-1] if size is None else size
+        self.index = min(range(len(self.sizes)), key=lambda i: abs(self.sizes[i] - size))
+        self.budget = 1. / target_fps
+        self.hysteresis = hysteresis
+        self.min_dwell = min_dwell
+        self.min_detections = min_detections
+        self.smoothing = smoothing
+        self.latency = None
+        self.detections = None
+        self.frames = 0  # frames measured at the current size
+        self.switches = 0
+
+    @property
+    def size(self) -> int:
+        return self.sizes[self.index]
+
+    def _average(self, average, value):
+        return value if average is None else average + self.smoothing * (value - average)
+
+    def update(self, latency, size, frames=1, detections=None) -> int:
+        """
+        Records 'frames' frames that took 'latency' seconds each at input size 'size', with 'detections' detections
+        per keyframe (None without keyframes), and returns the input size for the next frames
+        """
+        if size != self.size:
+            return self.size
+        self.latency = self._average(self.latency, latency)
+        if detections is not None:
+            self.detections = self._average(self.detections, detections)
+        self.frames += frames
+        if self.frames < self.min_dwell:
+            return self.size
+
+        if self.latency > self.budget * (1 + self.hysteresis) and self.index > 0:
+            self._switch(self.index - 1)
+        elif (self.index + 1 < len(self.sizes) and (self.detections or 0.) >= self.min_detections
+              and self.latency * (self.sizes[self.index + 1] / self.size) ** 2 < self.budget * (1 - self.hysteresis)):
+            self._switch(self.index + 1)
+        return self.size
+
+    def _switch(self, index):
+        logging.info(f"Input size {self.size} -> {self.sizes[index]}: {1E3 * self.latency:.1f} ms per frame for a "
+                     f"{1E3 * self.budget:.1f} ms budget, {self.detections or 0.:.1f} detections per keyframe")
+        self.index = index
+        self.latency = None
+        self.frames = 0
+        self.switches += 1
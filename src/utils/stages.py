@@ -0,0 +1,135 @@
+import time
+import queue
+import threading
+from src.logger import logging
+from src.constants import PIPELINE_QUEUE_SIZE
+
+_END = object()  # end of stream marker passed down the queues
+
+
+class Stage(object):
+    """
+    One worker of a StagedPipeline: calls fn(item) for every item and hands the result to the next stage
+    """
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self.items = 0
+        self.busy = 0.  # seconds spent inside fn
+        self.waited = 0.  # seconds spent waiting for input or for room in the output queue
+
+    def stats(self):
+        return {'items': self.items, 'busy_s': self.busy, 'wait_s': self.waited,
+                'items_per_s': self.items / self.busy if self.busy > 0 else None}
+
+
+class StagedPipeline(object):
+    """
+    Runs a source iterator and a chain of stages, each on its own thread, connected by bounded queues.
+
+    Every stage has exactly one worker and the queues are FIFO, so items leave the last stage in source order. A
+    full queue blocks the stage feeding it (backpressure), so at most queue_size items wait between two stages and
+    the end-to-end rate approaches that of the slowest stage. The first exception raised by any stage stops the
+    whole pipeline and is re-raised by run() once every worker has stopped.
+    """
+
+    def __init__(self, source, stages, queue_size=PIPELINE_QUEUE_SIZE, source_name="source"):
+        """
+        :param source: iterable producing the items, iterated on its own thread
+        :param stages: list of (name, fn) pairs, the last fn consumes the items and its result is dropped
+        """
+        self.source = Stage(source_name, None)
+        self._source_iter = source
+        self.stages = [Stage(name, fn) for name, fn in stages]
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in self.stages]
+        self._stop = threading.Event()
+        self._error = None
+        self.elapsed = 0.
+
+    def _put(self, stage, q, item):
+        t = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stage.waited += time.perf_counter() - t
+
+    def _get(self, stage, q):
+        t = time.perf_counter()
+        item = _END
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stage.waited += time.perf_counter() - t
+        return item
+
+    def _fail(self, stage, e):
+        if self._error is None:
+            logging.error(f"Pipeline stage {stage.name} failed: {e}")
+            self._error = e
+        self._stop.set()
+
+    def _run_source(self):
+        stage, out = self.source, self.queues[0]
+        try:
+            items = iter(self._source_iter)
+            while not self._stop.is_set():
+                t = time.perf_counter()
+                item = next(items, _END)
+                if item is _END:
+                    break
+                stage.busy += time.perf_counter() - t
+                stage.items += 1
+                self._put(stage, out, item)
+        except Exception as e:
+            self._fail(stage, e)
+        self._put(stage, out, _END)
+
+    def _run_stage(self, i):
+        stage = self.stages[i]
+        inp = self.queues[i]
+        out = self.queues[i + 1] if i + 1 < len(self.queues) else None
+        try:
+            while True:
+                item = self._get(stage, inp)
+                if item is _END:
+                    break
+                t = time.perf_counter()
+                item = stage.fn(item)
+                stage.busy += time.perf_counter() - t
+                stage.items += 1
+                if out is not None:
+                    self._put(stage, out, item)
+        except Exception as e:
+            self._fail(stage, e)
+        if out is not None:
+            self._put(stage, out, _END)
+
+    def run(self):
+        """
+        Runs the pipeline until the source is exhausted and every item has left the last stage
+        """
+        threads = [threading.Thread(target=self._run_source, name=self.source.name, daemon=True)]
+        threads += [threading.Thread(target=self._run_stage, args=(i,), name=stage.name, daemon=True)
+                    for i, stage in enumerate(self.stages)]
+        t = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - t
+        if self._error is not None:
+            raise self._error
+        return self.stats()
+
+    def stats(self):
+        """
+        Per stage item counts, busy and wait times and throughput (items per busy second)
+        """
+        return {stage.name: stage.stats() for stage in [self.source] + self.stages}
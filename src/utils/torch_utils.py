@@ -1,51 +1,261 @@
 import os
 import sys
+import json
 import time
+import hashlib
+import threading
 import torch
 import torch.nn as nn
-from src.constants import IMG_SIZE
+from collections import OrderedDict
+from src.constants import TRACE_CACHE_SIZE, TRACE_OPTIMIZE, TRACED_MODEL, COMPILE_CACHE_MAX_SIZE, CONF_THRES, IOU_THRES
+from src.ml.postprocess import DetectPostprocess
 from src.logger import logging
 from src.exception import CustomException
-from src.entity.config_entity import ModelLoadingConfig
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    SHA-256 hex digest of the contents of file 'path'
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CompileCache(object):
+    """
+    Persistent, content-addressed cache of what loading a weights file compiles: the fused eager model and the
+    frozen TorchScript trace of every input shape.
+
+    Every entry is named after a hash of the SHA-256 of the weights contents, the torch version and, for traces,
+    the input shape, precision, device type and whether the trace is frozen, so a changed file, upgrade or setting
+    simply misses and is rebuilt. Entries are written to a temporary file and renamed into place, so processes
+    sharing the cache (e.g. shard workers) never read a partial entry. An entry that fails to load is rebuilt.
+    Every trace holds a copy of the weights, so the least recently used entries beyond 'max_size' bytes are removed.
+    """
+
+    def __init__(self, cache_dir, weights_path, max_size=COMPILE_CACHE_MAX_SIZE):
+        try:
+            self.cache_dir = cache_dir
+            self.max_size = max_size
+            os.makedirs(self.cache_dir, exist_ok=True)
+            t = time.time()
+            self.weights_hash = file_hash(weights_path)
+            logging.info(f"Compile cache {self.cache_dir}, weights {self.weights_hash[:12]} "
+                         f"hashed in {time.time() - t:.2f}s")
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def path(self, name, **key):
+        """
+        Cache path of entry 'name' for the 'key' fields on top of the weights hash and torch version
+        """
+        key = dict(key, weights=self.weights_hash, torch=torch.__version__)
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:24]
+        return os.path.join(self.cache_dir, f"{name}_{digest}.pt")
+
+    def load(self, path, loader):
+        """
+        Returns loader(path), or None when the entry is missing or does not load
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            entry = loader(path)
+            os.utime(path)  # last use, for evict()
+            return entry
+        except Exception as e:
+            logging.warning(f"Rebuilding compile cache entry {path} that failed to load: {e}")
+            return None
+
+    def save(self, path, saver):
+        """
+        Writes an entry atomically with saver(temporary path)
+        """
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # one writer per temporary file
+        try:
+            saver(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries beyond 'max_size' bytes
+        """
+        entries = []
+        for f in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, f)
+            try:
+                if f.endswith('.pt'):
+                    entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                pass  # removed by another process meanwhile
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_size:
+                logging.info(f"Evicting compile cache entry {path}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def model_path(self):
+        return self.path("fused_model")
+
+    def load_model(self, device):
+        """
+        The cached fused eager model, or None
+        """
+        return self.load(self.model_path(), lambda path: torch.load(path, map_location=device)['model'])
+
+    def save_model(self, model):
+        try:
+            self.save(self.model_path(), lambda path: torch.save({'model': model}, path))
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def trace_path(self, shape, weight, frozen):
+        """
+        Cache path of the trace of input shape 'shape' for weights like 'weight', e.g.
+        traced_model_1x3x288x512_<key>.pt
+        """
+        name = f"{os.path.splitext(TRACED_MODEL)[0]}_{'x'.join(str(d) for d in shape)}"
+        return self.path(name, shape=list(shape), dtype=str(weight.dtype), device=weight.device.type, frozen=frozen)
+
+    def load_trace(self, shape, weight, frozen):
+        """
+        The cached trace of input shape 'shape', or None
+        """
+        return self.load(self.trace_path(shape, weight, frozen),
+                         lambda path: torch.jit.load(path, map_location=weight.device))
+
+    def save_trace(self, traced, shape, weight, frozen):
+        try:
+            self.save(self.trace_path(shape, weight, frozen), traced.save)
+        except Exception as e:
+            raise CustomException(e, sys) from e
 
 
 class TracedModel(nn.Module):
     """
-    Trace a function and return an executable or ScriptFunction that will be optimized using just-in-time compilation.
-    Tracing is ideal for code that operates only on Tensors and lists, dictionaries, and tuples of Tensors.
+    Keeps one TorchScript trace of the model per input shape bucket, i.e. per (batch, 3, H, W) input shape.
+
+    LoadImages letterboxes to the smallest stride-aligned rectangle of the source aspect ratio (e.g. 288x512 for
+    16:9 video at IMG_SIZE 512), so a single square trace is specialised to a shape the inputs never have. Here a
+    new shape is traced on first use, frozen and optimised for inference when 'optimize' is set, and the
+    'cache_size' most recently used traces are kept. warmup() traces the expected shapes ahead of the first frame.
+    With a CompileCache, traces are loaded from it when it has them and saved to it otherwise.
+    The Detect layer runs eagerly after the trace. detect() instead hands the trace output to the scripted
+    DetectPostprocess, which returns the detections of every image with NMS applied.
     """
 
-    def __init__(self, model=None, device=None, img_size=(IMG_SIZE, IMG_SIZE)):
+    def __init__(self, model=None, device=None, cache_size=TRACE_CACHE_SIZE, optimize=TRACE_OPTIMIZE,
+                 compile_cache=None):
 
         super(TracedModel, self).__init__()
-        self.model_loading_config = ModelLoadingConfig()
         logging.info(" Convert model to Traced-model... ")
         self.stride = model.stride
         self.names = model.names
         self.model = model
 
         self.model = revert_sync_batchnorm(self.model)
-        self.model.to('cpu')
+        self.model.to(device)
         self.model.eval()
 
         self.detect_layer = self.model.model[-1]
+        self.postprocess = torch.jit.script(DetectPostprocess(self.detect_layer))
         self.model.traced = True
+        self.cache_size = cache_size
+        self.optimize = optimize
+        self.traces = OrderedDict()  # input shape -> trace, least recently used first
+        self.compile_cache = compile_cache
+        self.lock = threading.Lock()  # the requests of a resident model share its traces
 
-        rand_example = torch.rand(1, 3, img_size, img_size)
+    def _apply(self, fn, *args, **kwargs):
+        # traces are specialised to the dtype and device of the weights, a .half() or .to() that changes them
+        # retraces on demand
+        weight = next(self.model.parameters())
+        before = weight.dtype, weight.device
+        module = super(TracedModel, self)._apply(fn, *args, **kwargs)
+        weight = next(self.model.parameters())
+        if (weight.dtype, weight.device) != before:
+            self.traces.clear()
+        return module
 
-        traced_script_module = torch.jit.trace(self.model, rand_example, strict=False)
-        # traced_script_module = torch.jit.script(self.model)
-        os.makedirs(self.model_loading_config.MODEL_LOADING_ARTIFACTS_DIR, exist_ok=True)
-        traced_script_module.save(self.model_loading_config.TRACED_MODEL_PATH)
-        logging.info(" traced_script_module saved! ")
-        self.model = traced_script_module
-        self.model.to(device)
-        self.detect_layer.to(device)
-        logging.info(" model is traced! \n")
+    def trace(self, shape):
+        """
+        Returns the trace of input shape 'shape', loading it from the compile cache or tracing it first if it is not
+        in memory. Frozen traces are cached before optimize_for_inference, whose output cannot be serialised.
+        """
+        try:
+            shape = tuple(shape)
+            with self.lock:
+                traced = self.traces.get(shape)
+                if traced is not None:
+                    self.traces.move_to_end(shape)
+                    return traced
+                t = time.time()
+                weight = next(self.model.parameters())
+                example = torch.zeros(shape, dtype=weight.dtype, device=weight.device)
+                traced = self.compile_cache.load_trace(shape, weight, self.optimize) if self.compile_cache else None
+                cached = traced is not None
+                with torch.no_grad():
+                    if not cached:
+                        traced = torch.jit.trace(self.model, example, strict=False)
+                        if self.optimize:
+                            traced = torch.jit.freeze(traced)
+                        if self.compile_cache:
+                            self.compile_cache.save_trace(traced, shape, weight, self.optimize)
+                    if self.optimize:
+                        traced = torch.jit.optimize_for_inference(traced)
+                self.traces[shape] = traced
+                if len(self.traces) > self.cache_size:
+                    self.traces.popitem(last=False)
+                logging.info(f" model {'loaded from the compile cache' if cached else 'traced'} for input shape "
+                             f"{shape} in {time.time() - t:.2f}s ")
+                return traced
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def warmup(self, shapes, batch_sizes=(1,), runs=2):
+        """
+        Traces and runs every (batch size, 3, H, W) bucket of the (H, W) input 'shapes' 'runs' times, so the first
+        frames neither trace nor go through the profiling runs of the TorchScript executor. Buckets whose trace is
+        already in memory have been run before and are skipped.
+        """
+        try:
+            with torch.no_grad():
+                for h, w in shapes:
+                    for b in batch_sizes:
+                        if (b, 3, h, w) in self.traces:
+                            continue
+                        traced = self.trace((b, 3, h, w))
+                        weight = next(self.model.parameters())
+                        x = torch.zeros((b, 3, h, w), dtype=weight.dtype, device=weight.device)
+                        for _ in range(runs):
+                            self.postprocess(traced(x))
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def detect(self, x, conf_thres=CONF_THRES, iou_thres=IOU_THRES):
+        """
+        Fused inference: the trace of the input shape, then box decoding, confidence filter and NMS in one scripted
+        graph. Returns the list of (n, 6) [x1, y1, x2, y2, conf, cls] detections of every image of 'x'.
+        """
+        try:
+            return self.postprocess(self.trace(x.shape)(x), float(conf_thres), float(iou_thres))
+        except Exception as e:
+            raise CustomException(e, sys) from e
 
     def forward(self, x, augment=False, profile=False):
         try:
-            out = self.model(x)
+            out = self.trace(x.shape)(x)
             out = self.detect_layer(out)
             return out
         except Exception as e:
@@ -98,4 +308,39 @@ def time_synchronized():
     # pytorch-accurate time
     if torch.cuda.is_available():
         torch.cuda.synchronize()
-    return time.time()
\ No newline at end of file
+    return time.time()
+
+class InputBuffer(object):
+    """
+    Ring of preallocated model input tensors, one (max batch, 3, H, W) tensor per slot and frame shape.
+
+    Letterboxed uint8 frames are copied straight into the next slot, converting to fp16/32 during the copy, and
+    normalised in place, so steady-state frames allocate no input tensors. A slot is only written again 'depth'
+    batches later, which is how long a pipelined consumer may still hold on to it.
+    """
+
+    def __init__(self, device=None, half=False, depth=1):
+        self.device = device
+        self.dtype = torch.float16 if half else torch.float32
+        self.depth = max(int(depth), 1)
+        self._buffers = {}
+        self._next = 0
+
+    def __call__(self, imgs):
+        """
+        Returns the normalised (len(imgs), 3, H, W) model input for a list of (3, H, W) uint8 arrays
+        """
+        try:
+            n, shape = len(imgs), tuple(imgs[0].shape)
+            ring = self._buffers.get(shape)
+            if ring is None or len(ring[0]) < n:
+                ring = [torch.empty((n,) + shape, dtype=self.dtype, device=self.device) for _ in range(self.depth)]
+                self._buffers[shape] = ring
+            buf = ring[self._next % self.depth][:n]
+            self._next += 1
+            for i, img in enumerate(imgs):
+                buf[i].copy_(torch.from_numpy(img), non_blocking=True)  # uint8 to fp16/32
+            buf /= 255.0  # 0 - 255 to 0.0 - 1.0
+            return buf
+        except Exception as e:
+            raise CustomException(e, sys) from e
@@ -0,0 +1,58 @@
+import numpy as np
+from src.ml.sort import Sort, associate_detections_to_trackers, associate_detections_to_trackers_gated
+from src.ml.tracker_manager import TrackerManager
+
+
+def churn_scene(seed, frames=40, objects=20, births=3, deaths=2, jump=0.6, size=40., canvas=1000.):
+    """
+    Frames of [x1, y1, x2, y2, score, class] detections in shuffled order, where objects jump by about 'jump'
+    box sizes per frame, so many detection/track pairs overlap below the IoU threshold and are rejected, and
+    objects appear and disappear every frame, so there are more detections than tracks
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(0, canvas, (objects, 2))
+    for _ in range(frames):
+        centres = centres + rng.normal(0, jump * size, centres.shape)
+        centres = np.delete(centres, rng.choice(len(centres), min(deaths, len(centres) - 1), replace=False), 0)
+        centres = np.concatenate((centres, rng.uniform(0, canvas, (births, 2))))
+        dets = np.concatenate((centres - size / 2, centres + size / 2, np.full((len(centres), 1), .9),
+                               np.zeros((len(centres), 1))), axis=1)
+        yield dets[rng.permutation(len(dets))]
+
+
+def test_gated_association_returns_unmatched_in_dense_order():
+    trackers = np.array([[0, 0, 10, 10, 0, 0], [100, 0, 110, 10, 0, 0]], dtype=float)
+    detections = np.array([[102, 0, 112, 10, .9, 0],   # IoU 0.67 with tracker 1, assigned then rejected
+                           [500, 0, 510, 10, .9, 0],   # overlaps nothing, never assigned
+                           [3, 0, 13, 10, .9, 0]])     # IoU 0.54 with tracker 0, assigned then rejected
+    dense = associate_detections_to_trackers(detections, trackers, 0.7)
+    gated = associate_detections_to_trackers_gated(detections, trackers, 0.7)
+    for a, b in zip(dense, gated):
+        assert np.array_equal(a, b)
+    assert gated[1].tolist() == [1, 0, 2]
+
+
+def test_gated_sort_matches_dense_sort():
+    rejected_frames = 0
+    for seed in range(10):
+        dense, gated = Sort(gated_association=False), Sort(gated_association=True)
+        for dets in churn_scene(seed):
+            trks = dense.bank.get_state(dense._slots())[:, :4]
+            if len(trks):
+                matches = associate_detections_to_trackers(dets, trks, dense.iou_threshold)[0]
+                rejected_frames += len(matches) < min(len(dets), len(trks))
+            assert np.array_equal(dense.update(dets), gated.update(dets))
+    assert rejected_frames > 0
+
+
+def test_tracker_manager_matches_independent_sorts():
+    streams = {'a': dict(seed=0), 'b': dict(seed=1, objects=60), 'c': dict(seed=2, objects=5, jump=0.1)}
+    scenes = {key: list(churn_scene(**kwargs)) for key, kwargs in streams.items()}
+    manager, sorts = TrackerManager(), {key: Sort() for key in streams}
+    for t in range(40):
+        # stream 'c' runs at half the rate of the others
+        frame = {key: scene[t] for key, scene in scenes.items() if key != 'c' or t % 2 == 0}
+        dt = {key: 2.0 if key == 'c' else 1.0 for key in frame}
+        results = manager.update(frame, dt=dt)
+        for key, dets in frame.items():
+            assert np.array_equal(results[key], sorts[key].update(dets, dt=dt[key]))